@@ -0,0 +1,85 @@
+"""
+Encode cost and bytes on the wire of a large /tree response.
+
+Builds an in-memory tree shaped like get_tree_structure's output and
+compares the old payload (the tree as a JSON string inside a JSON object,
+stdlib encoder) with the current one (a single encode through
+utils.serialization), uncompressed and after gzip and brotli at the
+levels CompressionMiddleware uses.
+
+    cd backend && python -m benchmarks.bench_serialization --nodes 50000
+"""
+import argparse
+import gzip
+import json
+import statistics
+import time
+
+from utils.compression import COMPRESSION, brotli
+from utils.serialization import dumps, orjson
+
+
+def build_tree(nodes, files_per_dir=20, dirs_per_dir=5):
+    """A directory tree with `nodes` nodes in total, token counts filled in."""
+    root = {"name": "repo", "type": "directory", "item_count": 0, "token_count": 0, "path": ".",
+            "skip_token_count": False, "children": []}
+    queue, count = [root], 1
+    while queue and count < nodes:
+        directory = queue.pop(0)
+        prefix = "" if directory["path"] == "." else directory["path"] + "/"
+        for i in range(files_per_dir):
+            if count >= nodes:
+                break
+            directory["children"].append({"name": f"module_{i}.py", "type": "file", "item_count": 1,
+                                          "token_count": 100 + (count * 37) % 4000, "path": f"{prefix}module_{i}.py",
+                                          "skip_token_count": False})
+            count += 1
+        for i in range(dirs_per_dir):
+            if count >= nodes:
+                break
+            child = {"name": f"pkg_{i}", "type": "directory", "item_count": 0, "token_count": 0,
+                     "path": f"{prefix}pkg_{i}", "skip_token_count": False, "children": []}
+            directory["children"].append(child)
+            queue.append(child)
+            count += 1
+    return root, count
+
+
+def _timed(function, runs):
+    times, result = [], None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - started)
+    return result, round(statistics.median(times) * 1000, 2)
+
+
+def _measure(encode, runs):
+    body, encode_ms = _timed(encode, runs)
+    report = {"encode_ms": encode_ms, "bytes": len(body)}
+    gzipped, report["gzip_ms"] = _timed(lambda: gzip.compress(body, COMPRESSION['gzip_level']), runs)
+    report["gzip_bytes"] = len(gzipped)
+    if brotli is not None:
+        compressed, report["brotli_ms"] = _timed(lambda: brotli.compress(body, quality=COMPRESSION['brotli_quality']), runs)
+        report["brotli_bytes"] = len(compressed)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--nodes", type=int, default=50000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    tree, nodes = build_tree(args.nodes)
+    print(json.dumps({
+        "nodes": nodes,
+        "encoder": "orjson" if orjson is not None else "json",
+        "brotli_available": brotli is not None,
+        "double_encoded_stdlib": _measure(lambda: json.dumps({"tree": json.dumps(tree)}).encode("utf-8"), args.runs),
+        "single_encoded": _measure(lambda: dumps({"tree": tree}), args.runs),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Import cost of the backend at startup.
+
+Runs `python -X importtime -c "import main"` in fresh interpreters and
+reports the wall time, the cumulative import time of the heaviest packages
+main.py pulls in, and whether any provider SDK was imported before the
+first request.
+
+    cd backend && python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+PROVIDER_SDKS = ("openai", "anthropic", "google.generativeai", "tiktoken", "grpc")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _parse_importtime(stderr):
+    """Cumulative microseconds per package imported directly by main, and every module imported."""
+    cumulative = defaultdict(int)
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        module = name.strip()
+        modules.add(module)
+        # Entries are indented two spaces per nesting level; depth 1 is what `main` imports directly
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            cumulative[module.split(".")[0]] += int(cumulative_us)
+    return cumulative, modules
+
+
+def _run_once(env):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    return elapsed, result.stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    for key in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "GOOGLE_API_KEY"):
+        env.setdefault(key, "benchmark")
+    env.setdefault("REPO_PATH", tempfile.gettempdir())
+
+    walls, stderr = [], ""
+    for _ in range(args.runs):
+        elapsed, stderr = _run_once(env)
+        walls.append(elapsed)
+
+    cumulative, modules = _parse_importtime(stderr)
+    heaviest = sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    print(json.dumps({
+        "runs": args.runs,
+        "wall_ms_median": round(statistics.median(walls) * 1000, 1),
+        "wall_ms_min": round(min(walls) * 1000, 1),
+        "heaviest_imports_ms": {name: round(us / 1000, 1) for name, us in heaviest},
+        "provider_sdks_imported": sorted(sdk for sdk in PROVIDER_SDKS if sdk in modules),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+CPU cost of usage accounting on the LLM request path.
+
+Compares the old Anthropic/Google accounting (joining every message and
+re-encoding prompt and output with tiktoken) against reading the usage block
+the provider already returned. Providers are stubbed, so no network is used.
+
+    cd backend && python -m benchmarks.bench_usage_accounting --prompt-kb 512
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from types import SimpleNamespace
+
+for key in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "GOOGLE_API_KEY"):
+    os.environ.setdefault(key, "benchmark")
+
+from fastapi.concurrency import run_in_threadpool
+
+import llm_interaction
+
+MODEL = "claude-sonnet-4-0"
+
+
+class _StubMessages:
+    def __init__(self, text):
+        self.text = text
+
+    def create(self, **kwargs):
+        return SimpleNamespace(
+            content=[SimpleNamespace(text=self.text)],
+            usage=SimpleNamespace(input_tokens=1, output_tokens=1),
+        )
+
+
+def _messages(prompt_kb):
+    line = "def handler(request):\n    return {'status': 'ok', 'items': [1, 2, 3]}\n"
+    body = line * (prompt_kb * 1024 // len(line))
+    return [
+        {"role": "system", "content": "You are a careful reviewer."},
+        {"role": "user", "content": f'<file path="app.py">\n{body}\n</file>\n\nReview this file.'},
+    ]
+
+
+async def _cpu(fn, iterations):
+    start = time.process_time()
+    for _ in range(iterations):
+        await fn()
+    return (time.process_time() - start) / iterations
+
+
+async def _run(messages, iterations):
+    async def legacy():
+        # Previous request path: provider call, then tokenizing on the event loop
+        response = await run_in_threadpool(llm_interaction.anthropic_completion, MODEL, messages, 1024, 0.7)
+        llm_interaction.estimate_usage(MODEL, messages, response["content"])
+
+    async def provider_usage():
+        await llm_interaction._dispatch_completion(MODEL, messages, 1024, 0.7)
+
+    return await _cpu(legacy, iterations), await _cpu(provider_usage, iterations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--prompt-kb", type=int, default=256)
+    parser.add_argument("--output-kb", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    messages = _messages(args.prompt_kb)
+    output_text = "x = 1\n" * (args.output_kb * 1024 // 6)
+    llm_interaction._clients["Anthropic"] = SimpleNamespace(messages=_StubMessages(output_text))
+
+    # Warm the encoder so both sides exclude its one-time load
+    llm_interaction.count_tokens("warm up", MODEL)
+    legacy_cpu, provider_cpu = asyncio.run(_run(messages, args.iterations))
+
+    print(json.dumps({
+        "model": MODEL,
+        "prompt_kb": args.prompt_kb,
+        "output_kb": args.output_kb,
+        "iterations": args.iterations,
+        "legacy_request_cpu_ms": round(legacy_cpu * 1000, 3),
+        "provider_usage_request_cpu_ms": round(provider_cpu * 1000, 3),
+        "cpu_removed_ms": round((legacy_cpu - provider_cpu) * 1000, 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
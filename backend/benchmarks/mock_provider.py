@@ -0,0 +1,181 @@
+"""
+Local stand-in for the OpenAI, Anthropic and Gemini HTTP APIs.
+
+Answers chat completions, messages and generateContent requests (streamed
+or not) after a configurable time to first token and per-token delay, with
+usage blocks in each provider's own shape. Point the backend at it with
+OPENAI_BASE_URL, ANTHROPIC_BASE_URL and GOOGLE_API_ENDPOINT.
+
+    cd backend && python -m benchmarks.mock_provider --port 9100 --latency-ms 300 --token-ms 5
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SETTINGS = {
+    "latency_ms": 200.0,
+    "token_ms": 2.0,
+    "output_tokens": 200,
+}
+
+# /analyze-prompt parses the reply as JSON, so the filler goes inside a JSON document
+REPLY_PREFIX = '{"high_confidence": [], "medium_confidence": [], "low_confidence": [], "notes": "'
+REPLY_SUFFIX = '"}'
+
+
+def _reply_words(count):
+    words = [f"token{i % 97}" for i in range(max(count, 1))]
+    words[0] = REPLY_PREFIX + words[0]
+    words[-1] = words[-1] + REPLY_SUFFIX
+    return words
+
+
+def _input_tokens(payload) -> int:
+    return max(1, len(json.dumps(payload)) // 4)
+
+
+async def _first_token_delay():
+    await asyncio.sleep(SETTINGS["latency_ms"] / 1000)
+
+
+async def _stream_words(words):
+    """Yield the reply word by word, paced like a provider emitting tokens."""
+    await _first_token_delay()
+    for i, word in enumerate(words):
+        if i:
+            await asyncio.sleep(SETTINGS["token_ms"] / 1000)
+        yield word if i == 0 else " " + word
+
+
+async def _whole_reply(words) -> str:
+    await _first_token_delay()
+    await asyncio.sleep(SETTINGS["token_ms"] * (len(words) - 1) / 1000)
+    return " ".join(words)
+
+
+def _sse(data, event=None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+app = FastAPI()
+
+
+@app.post("/v1/chat/completions")
+async def openai_chat(request: Request):
+    payload = await request.json()
+    model = payload.get("model", "mock")
+    limit = payload.get("max_completion_tokens") or payload.get("max_tokens") or SETTINGS["output_tokens"]
+    words = _reply_words(min(SETTINGS["output_tokens"], limit))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    usage = {"prompt_tokens": _input_tokens(payload), "completion_tokens": len(words),
+             "total_tokens": _input_tokens(payload) + len(words)}
+
+    if payload.get("stream"):
+        async def events():
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model}
+            async for piece in _stream_words(words):
+                yield _sse({**chunk, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+            yield _sse({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage})
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return JSONResponse({
+        "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": await _whole_reply(words)},
+                     "finish_reason": "stop"}],
+        "usage": usage,
+    })
+
+
+@app.post("/v1/messages")
+async def anthropic_messages(request: Request):
+    payload = await request.json()
+    model = payload.get("model", "mock")
+    words = _reply_words(min(SETTINGS["output_tokens"], payload.get("max_tokens", SETTINGS["output_tokens"])))
+    message_id = f"msg_{uuid.uuid4().hex}"
+    input_tokens = _input_tokens(payload)
+
+    if payload.get("stream"):
+        async def events():
+            yield _sse({"type": "message_start", "message": {
+                "id": message_id, "type": "message", "role": "assistant", "model": model, "content": [],
+                "stop_reason": None, "stop_sequence": None,
+                "usage": {"input_tokens": input_tokens, "output_tokens": 1}}}, "message_start")
+            yield _sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+                       "content_block_start")
+            async for piece in _stream_words(words):
+                yield _sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}},
+                           "content_block_delta")
+            yield _sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+            yield _sse({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                        "usage": {"output_tokens": len(words)}}, "message_delta")
+            yield _sse({"type": "message_stop"}, "message_stop")
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return JSONResponse({
+        "id": message_id, "type": "message", "role": "assistant", "model": model,
+        "content": [{"type": "text", "text": await _whole_reply(words)}],
+        "stop_reason": "end_turn", "stop_sequence": None,
+        "usage": {"input_tokens": input_tokens, "output_tokens": len(words)},
+    })
+
+
+@app.post("/v1beta/models/{target}")
+async def gemini_generate(target: str, request: Request):
+    payload = await request.json()
+    _, _, method = target.partition(":")
+    config = payload.get("generationConfig", {})
+    words = _reply_words(min(SETTINGS["output_tokens"], config.get("maxOutputTokens", SETTINGS["output_tokens"])))
+    usage = {"promptTokenCount": _input_tokens(payload), "candidatesTokenCount": len(words),
+             "totalTokenCount": _input_tokens(payload) + len(words)}
+
+    def candidate(text, finished):
+        entry = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+        if finished:
+            entry["finishReason"] = "STOP"
+        return entry
+
+    if method == "streamGenerateContent":
+        # With alt=sse the API streams server-sent events, otherwise one JSON array written incrementally
+        sse = request.query_params.get("alt") == "sse"
+
+        async def chunks():
+            yield "" if sse else "["
+            async for piece in _stream_words(words):
+                chunk = {"candidates": [candidate(piece, False)]}
+                yield _sse(chunk) if sse else json.dumps(chunk) + ","
+            final = {"candidates": [candidate("", True)], "usageMetadata": usage}
+            yield _sse(final) if sse else json.dumps(final) + "]"
+        return StreamingResponse(chunks(), media_type="text/event-stream" if sse else "application/json")
+
+    return JSONResponse({"candidates": [candidate(await _whole_reply(words), True)], "usageMetadata": usage})
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", **SETTINGS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=SETTINGS["latency_ms"], help="time to first token")
+    parser.add_argument("--token-ms", type=float, default=SETTINGS["token_ms"], help="delay between output tokens")
+    parser.add_argument("--output-tokens", type=int, default=SETTINGS["output_tokens"])
+    args = parser.parse_args()
+    SETTINGS.update(latency_ms=args.latency_ms, token_ms=args.token_ms, output_tokens=args.output_tokens)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Synthetic repository generator for benchmarks.
+
+Writes a deterministic tree of source files in a chosen language mix, with a
+README, a .gitignore'd build directory and optionally a git history, so
+/tree, /file_content and the context map have something realistic to chew on.
+
+    cd backend && python -m benchmarks.synthetic_repo /tmp/bench-repos/bench --files 5000 --mix py=5,js=3,md=1,json=1
+"""
+import argparse
+import os
+import random
+import subprocess
+from typing import Dict
+
+DEFAULT_MIX = {"py": 5, "js": 3, "md": 1, "json": 1}
+
+
+def _python_file(rng, index, lines):
+    body = [f"import os\nfrom typing import Dict, List\n\n\nclass Service{index}:"]
+    for i in range(max(1, lines // 6)):
+        body.append(f"    def handle_{i}(self, request: Dict) -> List[str]:\n"
+                    f"        items = [str(x) for x in request.get('items', [])]\n"
+                    f"        return sorted(items)[:{rng.randint(1, 50)}]\n")
+    return "\n".join(body) + "\n"
+
+
+def _javascript_file(rng, index, lines):
+    body = [f"import React, {{ useState, useEffect }} from 'react';\n\nexport default function Widget{index}() {{",
+            "  const [items, setItems] = useState([]);"]
+    for i in range(max(1, lines // 4)):
+        body.append(f"  const load{i} = async () => {{ setItems(await fetch('/api/{i}').then(r => r.json())); }};")
+    body.append(f"  useEffect(() => {{ load0(); }}, []);\n  return <div>{{items.length}}</div>;\n}}")
+    return "\n".join(body) + "\n"
+
+
+def _markdown_file(rng, index, lines):
+    words = ["cache", "tree", "token", "prompt", "session", "stream", "request", "model"]
+    paragraphs = [" ".join(rng.choice(words) for _ in range(12)) for _ in range(max(1, lines // 3))]
+    return f"# Notes {index}\n\n" + "\n\n".join(paragraphs) + "\n"
+
+
+def _json_file(rng, index, lines):
+    entries = ",\n".join(f'  "key_{i}": {{"enabled": {str(rng.random() > 0.5).lower()}, "weight": {rng.randint(0, 100)}}}'
+                         for i in range(max(1, lines // 2)))
+    return "{\n" + entries + "\n}\n"
+
+
+WRITERS = {"py": _python_file, "js": _javascript_file, "md": _markdown_file, "json": _json_file}
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    mix = {}
+    for part in spec.split(","):
+        ext, _, weight = part.partition("=")
+        if ext not in WRITERS:
+            raise ValueError(f"Unknown extension '{ext}'; choose from {sorted(WRITERS)}")
+        mix[ext] = int(weight or 1)
+    return mix
+
+
+def generate_repo(path: str, files: int = 1000, mix: Dict[str, int] = None, lines: int = 60,
+                  files_per_dir: int = 25, ignored_files: int = 200, git: bool = True, seed: int = 7) -> Dict:
+    """Create the repository at `path` and return a short description of it."""
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    extensions = [ext for ext, weight in mix.items() for _ in range(weight)]
+    os.makedirs(path, exist_ok=True)
+    written = 0
+
+    with open(os.path.join(path, "README.md"), "w") as f:
+        f.write("# Synthetic benchmark repository\n\nGenerated for backend benchmarks.\n")
+    with open(os.path.join(path, ".gitignore"), "w") as f:
+        f.write("build/\n*.log\n")
+
+    for index in range(files):
+        directory = os.path.join(path, "src", f"pkg{index // (files_per_dir * files_per_dir)}", f"mod{index // files_per_dir}")
+        os.makedirs(directory, exist_ok=True)
+        ext = rng.choice(extensions)
+        file_lines = max(4, int(rng.gauss(lines, lines / 3)))
+        with open(os.path.join(directory, f"file{index}.{ext}"), "w") as f:
+            f.write(WRITERS[ext](rng, index, file_lines))
+        written += 1
+
+    # Generated output the ignore rules should keep out of every walk
+    build_dir = os.path.join(path, "build")
+    os.makedirs(build_dir, exist_ok=True)
+    for index in range(ignored_files):
+        with open(os.path.join(build_dir, f"bundle{index}.js"), "w") as f:
+            f.write("var x=1;" * 200)
+
+    if git:
+        env = {**os.environ, "GIT_AUTHOR_NAME": "bench", "GIT_AUTHOR_EMAIL": "bench@example.com",
+               "GIT_COMMITTER_NAME": "bench", "GIT_COMMITTER_EMAIL": "bench@example.com"}
+        for command in (["git", "init", "-q"], ["git", "add", "-A"], ["git", "commit", "-q", "-m", "Synthetic repository"]):
+            subprocess.run(command, cwd=path, env=env, check=True, capture_output=True)
+
+    return {"path": path, "files": written, "ignored_files": ignored_files, "mix": mix, "git": git}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path")
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. py=5,js=3,md=1,json=1")
+    parser.add_argument("--lines", type=int, default=60, help="mean lines per file")
+    parser.add_argument("--no-git", action="store_true")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    print(generate_repo(args.path, args.files, args.mix, args.lines, git=not args.no_git, seed=args.seed))
+
+
+if __name__ == "__main__":
+    main()
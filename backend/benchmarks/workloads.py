@@ -0,0 +1,266 @@
+"""
+End-to-end workloads against a running backend.
+
+Generates a synthetic repository, starts the mock provider and the backend
+(`uvicorn main:app`) as subprocesses wired to each other, then drives the
+endpoints the frontend hits hardest and reports throughput and p50/p95/p99
+latency per workload as JSON:
+
+  tree          GET /tree on the whole repository
+  file_content  fan-out of concurrent GET /file_content, as when files are selected
+  context_map   POST /repository-context/{repo}/initialize
+  analyze       POST /analyze-prompt against the generated context map
+  llm           multi-stage /llm_interaction runs across OpenAI, Anthropic and Gemini models
+
+    cd backend && python -m benchmarks.workloads --files 2000 --concurrency 8 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.synthetic_repo import DEFAULT_MIX, generate_repo, parse_mix
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_NAME = "speech-to-code-bench"
+WORKLOADS = ("tree", "file_content", "context_map", "analyze", "llm")
+# One model per provider, in the order a plan -> code -> review run would use them
+STAGE_MODELS = ("gpt-4.1-mini", "claude-sonnet-4-0", "gemini-2.0-flash")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(name, latencies, errors, elapsed, concurrency, items=None):
+    latencies = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None
+    result = {
+        "workload": name,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 50)),
+            "p95": ms(percentile(latencies, 95)),
+            "p99": ms(percentile(latencies, 99)),
+            "mean": ms(sum(latencies) / len(latencies)) if latencies else None,
+            "max": ms(latencies[-1]) if latencies else None,
+        },
+    }
+    if items is not None:
+        result["items_per_s"] = round(items / elapsed, 2) if elapsed else None
+    return result
+
+
+async def run_workload(name, operation, requests, concurrency):
+    """Run `operation(i)` `requests` times with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures, items = [], [], []
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                count = await operation(i)
+                latencies.append(time.perf_counter() - started)
+                if count is not None:
+                    items.append(count)
+            except Exception as e:
+                failures.append(repr(e))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    result = summarize(name, latencies, len(failures), time.perf_counter() - started, concurrency,
+                       sum(items) if items else None)
+    if failures:
+        result["first_error"] = failures[0][:500]
+    return result
+
+
+def _checked(response):
+    if response.is_error:
+        raise RuntimeError(f"{response.request.method} {response.request.url.path} -> {response.status_code}: {response.text[:300]}")
+    return response
+
+
+def tree_workload(client):
+    async def operation(_):
+        _checked(await client.get("/tree", params={"repository": REPO_NAME}))
+    return operation
+
+
+def file_content_workload(client, paths, fanout, seed):
+    rng = random.Random(seed)
+
+    async def operation(_):
+        batch = rng.sample(paths, min(fanout, len(paths)))
+        responses = await asyncio.gather(*(client.get("/file_content", params={"repository": REPO_NAME, "path": p})
+                                           for p in batch))
+        for response in responses:
+            _checked(response)
+        return len(batch)
+    return operation
+
+
+def context_map_workload(client):
+    async def operation(_):
+        _checked(await client.post(f"/repository-context/{REPO_NAME}/initialize"))
+    return operation
+
+
+def analyze_workload(client):
+    async def operation(i):
+        _checked(await client.post("/analyze-prompt", json={
+            "repository": REPO_NAME, "prompt": f"Add pagination to the handlers in module {i % 40}"}))
+    return operation
+
+
+def llm_workload(client, paths, files_per_run, models, seed):
+    rng = random.Random(seed)
+
+    async def operation(_):
+        included = rng.sample(paths, min(files_per_run, len(paths)))
+        contents = await asyncio.gather(*(client.get("/file_content", params={"repository": REPO_NAME, "path": p})
+                                          for p in included))
+        context = "\n\n".join(f"File: {p}\n{_checked(r).json()['content']}" for p, r in zip(included, contents))
+        messages = [{"role": "system", "content": "You are a senior engineer working in this repository."},
+                    {"role": "user", "content": f"{context}\n\nPlan a change that adds request tracing."}]
+        for model in models:
+            reply = _checked(await client.post("/llm_interaction", json={
+                "model": model, "messages": messages, "temperature": 0.2})).json()
+            messages = messages + [{"role": "assistant", "content": reply["response"]},
+                                   {"role": "user", "content": "Continue with the next step."}]
+    return operation
+
+
+def _start(command, env, log_path):
+    log = open(log_path, "w")
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def _wait_ready(url, process, log_path, timeout=60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            with open(log_path) as f:
+                raise RuntimeError(f"{url} exited early:\n{f.read()[-2000:]}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout}s")
+
+
+async def run_all(args, paths):
+    selected = [w.strip() for w in args.workloads.split(",")]
+    results = []
+    timeout = httpx.Timeout(600.0)
+    limits = httpx.Limits(max_connections=args.concurrency * max(args.fanout, 1) + 8)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.backend_port}", timeout=timeout,
+                                 limits=limits) as client:
+        plan = {
+            "tree": (tree_workload(client), args.requests, args.concurrency),
+            "file_content": (file_content_workload(client, paths, args.fanout, args.seed), args.requests, args.concurrency),
+            # Each initialize walks and parses the whole repository, so fewer, sequential runs
+            "context_map": (context_map_workload(client), args.context_map_runs, 1),
+            "analyze": (analyze_workload(client), args.requests, args.concurrency),
+            "llm": (llm_workload(client, paths, args.files_per_run, args.models.split(","), args.seed), args.llm_runs, args.concurrency),
+        }
+        for name in WORKLOADS:
+            if name not in selected:
+                continue
+            if name == "analyze" and "context_map" not in selected:
+                _checked(await client.post(f"/repository-context/{REPO_NAME}/initialize"))
+            operation, requests, concurrency = plan[name]
+            results.append(await run_workload(name, operation, requests, concurrency))
+            print(json.dumps(results[-1]), file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--files", type=int, default=2000, help="files in the synthetic repository")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="language mix, e.g. py=5,js=3,md=1,json=1")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS))
+    parser.add_argument("--requests", type=int, default=50, help="operations per workload")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--fanout", type=int, default=20, help="files fetched together per file_content operation")
+    parser.add_argument("--context-map-runs", type=int, default=3)
+    parser.add_argument("--llm-runs", type=int, default=10, help="multi-stage runs, one call per provider each")
+    parser.add_argument("--models", default=",".join(STAGE_MODELS), help="model of each llm stage, in order")
+    parser.add_argument("--files-per-run", type=int, default=10, help="files included in each llm run")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="mock provider time to first token")
+    parser.add_argument("--token-ms", type=float, default=2.0, help="mock provider delay between tokens")
+    parser.add_argument("--output-tokens", type=int, default=200)
+    parser.add_argument("--backend-port", type=int, default=8185)
+    parser.add_argument("--mock-port", type=int, default=9185)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="speech-to-code-bench-")
+    repo_path = os.path.join(workdir, REPO_NAME)
+    repo = generate_repo(repo_path, args.files, args.mix, seed=args.seed)
+    paths = sorted(os.path.relpath(os.path.join(d, f), repo_path)
+                   for d, _, files in os.walk(os.path.join(repo_path, "src")) for f in files)
+
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    env = {**os.environ, "REPO_PATH": workdir,
+           "OPENAI_API_KEY": "benchmark", "ANTHROPIC_API_KEY": "benchmark", "GOOGLE_API_KEY": "benchmark",
+           "OPENAI_BASE_URL": f"{mock_url}/v1", "ANTHROPIC_BASE_URL": mock_url, "GOOGLE_API_ENDPOINT": mock_url,
+           # Mock calls are priced like real ones; keep them out of the user's usage ledger and budgets
+           "USAGE_LEDGER_PATH": os.path.join(workdir, "usage.sqlite3")}
+    processes = []
+    try:
+        mock_log, backend_log = os.path.join(workdir, "mock.log"), os.path.join(workdir, "backend.log")
+        processes.append(_start([sys.executable, "-m", "benchmarks.mock_provider", "--port", str(args.mock_port),
+                                 "--latency-ms", str(args.latency_ms), "--token-ms", str(args.token_ms),
+                                 "--output-tokens", str(args.output_tokens)], env, mock_log))
+        _wait_ready(f"{mock_url}/health", processes[-1], mock_log)
+        processes.append(_start([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.backend_port),
+                                 "--log-level", "warning"], env, backend_log))
+        _wait_ready(f"http://127.0.0.1:{args.backend_port}/", processes[-1], backend_log)
+
+        results = asyncio.run(run_all(args, paths))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        # initialize writes the map next to the backend like any other repository's
+        try:
+            os.remove(os.path.join(BACKEND_DIR, "context_maps", f"{REPO_NAME}.json"))
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = json.dumps({
+        "repository": {"files": repo["files"], "mix": repo["mix"]},
+        "mock_provider": {"latency_ms": args.latency_ms, "token_ms": args.token_ms, "output_tokens": args.output_tokens},
+        "workloads": results,
+    }, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,136 @@
 # Filename: backend/llm_interaction.py
 from fastapi import HTTPException
-from openai import OpenAI
-from anthropic import Anthropic
-import google.generativeai as genai
 import os
-import tiktoken
+import threading
+from functools import lru_cache
+from typing import Optional
 from dotenv import load_dotenv
-from model_config import MODELS
+from model_config import MODELS, RATE_LIMITS, SHARED_CONTEXT_WINDOW, EXACT_TOKEN_COUNT_PROVIDERS
 from fastapi.concurrency import run_in_threadpool
+from utils.rate_limiter import ProviderScheduler, PRIORITIES, PRIORITY_INTERACTIVE, estimate_request_tokens
+from utils.prompt_packer import pack_messages, parse_file_priorities, ContextWindowExceeded
+from utils.history_compaction import CompactionStore, compact_history
+from utils.prompt_assembly import PROMPT_ASSEMBLY, AssembledPrompts, FileBlockCache, with_assembled
+from utils.shared_state import WORKERS, EnvFile, shared_cache, split_limits
+from utils.usage_ledger import USAGE_LEDGER, BudgetExceeded, UsageLedger, ledger_path
+from utils.app_config import backend_setting
+from utils.metrics import PROVIDER_SECONDS, TIME_TO_FIRST_TOKEN_SECONDS, get_logger, request_id_var, stage
+import time
 
 load_dotenv()
+# Written by /env_vars; other workers notice the change before building a client
+env_file = EnvFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
 
-# Initialize clients
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-anthropic_client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+logger = get_logger('llm')
 
+# Provider SDKs are heavy to import (google.generativeai pulls in grpc and
+# protobuf), so each one is imported and its client built on first use
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _build_client(provider: str):
+    if provider == 'OpenAI':
+        from openai import OpenAI
+        return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    if provider == 'Anthropic':
+        from anthropic import Anthropic
+        return Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    if provider == 'XAI':
+        from openai import OpenAI
+        return OpenAI(api_key=os.getenv("XAI_API_KEY"), base_url=os.getenv("XAI_BASE_URL", "https://api.x.ai/v1"))
+    if provider == 'Google':
+        import google.generativeai as genai
+        endpoint = os.getenv("GOOGLE_API_ENDPOINT")
+        if endpoint:
+            # Only the REST transport can talk to a plain-HTTP endpoint such as the benchmark mock
+            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"), transport="rest", client_options={"api_endpoint": endpoint})
+        else:
+            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        return genai
+    raise ValueError(f"Unsupported provider: {provider}")
+
+def get_client(provider: str):
+    if env_file.refresh():
+        reset_clients()
+    client = _clients.get(provider)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(provider)
+            if client is None:
+                client = _clients[provider] = _build_client(provider)
+    return client
+
+def reset_clients():
+    """Forget built clients so the next call picks up changed API keys."""
+    with _clients_lock:
+        _clients.clear()
+
+# Each worker process schedules its own share of the provider limits
+scheduler = ProviderScheduler(MODELS, split_limits(RATE_LIMITS, WORKERS))
+
+COMPACTION = backend_setting('compaction', {
+    "enabled": True,
+    "budget_tokens": 32000,
+    "keep_recent_turns": 4,
+    "summary_model": "gpt-4.1-nano",
+    # After a failed summary the extractive fallback is kept this long, doubling per failure, before retrying
+    "retry_backoff_seconds": 30
+})
+PACKING = backend_setting('packing', {
+    # Held back from the input budget of models approximated with cl100k_base
+    # (providers outside EXACT_TOKEN_COUNT_PROVIDERS), whose real tokenizers can produce more tokens
+    "approximate_count_margin": 0.15
+})
+
+def input_budget(provider: str, model: str) -> int:
+    """Tokens a prompt may use: the context window less the completion where they share it, less the margin."""
+    limits = MODELS[provider][model]
+    budget = limits['input_tokens']
+    if provider in SHARED_CONTEXT_WINDOW:
+        budget -= limits['output_tokens']
+    if provider not in EXACT_TOKEN_COUNT_PROVIDERS:
+        budget = int(budget * (1 - PACKING["approximate_count_margin"]))
+    return budget
+
+def token_count_is_exact(model: str) -> bool:
+    """Whether count_tokens uses the model's own tokenizer rather than approximating with cl100k_base."""
+    return any(model in MODELS[provider] for provider in EXACT_TOKEN_COUNT_PROVIDERS)
+
+compaction_store = CompactionStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "compaction"))
+
+# Prompts built by /prompts/assemble, sent later by handle instead of as text
+file_blocks = FileBlockCache(PROMPT_ASSEMBLY["cache_bytes"])
+assembled_prompts = AssembledPrompts(PROMPT_ASSEMBLY["handle_ttl_seconds"], PROMPT_ASSEMBLY["max_handles"], shared_cache)
+
+usage_ledger = UsageLedger(ledger_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "usage.sqlite3")),
+                           USAGE_LEDGER["flush_interval_seconds"], USAGE_LEDGER["batch_size"], USAGE_LEDGER["budgets"])
+
+def call_cost(provider: str, model: str, input_tokens: int, output_tokens: int) -> float:
+    prices = MODELS[provider][model]
+    return (input_tokens / 1_000_000) * prices['input'] + (output_tokens / 1_000_000) * prices['output']
+
+@lru_cache(maxsize=None)
 def get_encoding(model: str):
+    import tiktoken
     try:
         return tiktoken.encoding_for_model(model)
     except KeyError:
         return tiktoken.get_encoding("cl100k_base")
 
+def warm_tokenizers():
+    """Load the encoders of every configured model, meant to run off the request path at startup."""
+    started = time.perf_counter()
+    encodings = set()
+    for models in MODELS.values():
+        for model in models:
+            try:
+                encodings.add(get_encoding(model).name)
+            except Exception as e:
+                logger.warning("tokenizer warm-up failed", extra={"model": model, "error": str(e)})
+                return
+    logger.info("tokenizers warmed", extra={"encodings": sorted(encodings),
+                                           "duration_ms": round((time.perf_counter() - started) * 1000, 2)})
+
 def count_tokens(text: str, model: str) -> int:
     encoding = get_encoding(model)
     return len(encoding.encode(text))
@@ -36,6 +145,7 @@ def openai_completion(model: str, messages: list, max_tokens: int, temperature:
             elif msg["role"] == "system" and msg["content"].strip():  # Add non-empty system messages
                 formatted_messages.insert(0, msg)  # System message should be first
         
+        client = get_client('OpenAI')
         if model in ["o4-mini", "o3"]:
             # Use max_completion_tokens for o4-mini and o3, without temperature
             response = client.chat.completions.create(
@@ -93,7 +203,7 @@ def openai_completion(model: str, messages: list, max_tokens: int, temperature:
             }
         }
     except Exception as e:
-        print(f"Error in OpenAI completion: {str(e)}")
+        logger.error("openai completion failed", extra={"model": model, "error": str(e)})
         raise
 
 def anthropic_completion(model: str, messages: list, max_tokens: int, temperature: float):
@@ -142,15 +252,23 @@ def anthropic_completion(model: str, messages: list, max_tokens: int, temperatur
     if not final_messages:
         raise ValueError("No valid messages to send to the model.")
 
-    response = anthropic_client.messages.create(
+    response = get_client('Anthropic').messages.create(
         model=model,
         messages=final_messages,
         max_tokens=max_tokens,
         temperature=temperature
     )
-    return response.content[0].text
+    usage = getattr(response, "usage", None)
+    return {
+        "content": response.content[0].text,
+        "usage": {
+            "input_tokens": usage.input_tokens,
+            "output_tokens": usage.output_tokens
+        } if usage else None
+    }
 
 def google_completion(model: str, messages: list, max_tokens: int, temperature: float):
+    genai = get_client('Google')
     model = genai.GenerativeModel(model_name=model)
     prompt = "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in messages])
     response = model.generate_content(
@@ -160,15 +278,18 @@ def google_completion(model: str, messages: list, max_tokens: int, temperature:
             temperature=temperature
         )
     )
-    return response.text
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "content": response.text,
+        "usage": {
+            "input_tokens": usage.prompt_token_count,
+            "output_tokens": usage.candidates_token_count or 0
+        } if usage else None
+    }
 
 def xai_completion(model: str, messages: list, max_tokens: int, temperature: float):
-    # Create a new OpenAI client for XAI
-    xai_client = OpenAI(
-        api_key=os.getenv("XAI_API_KEY"),
-        base_url="https://api.x.ai/v1"
-    )
-    
+    xai_client = get_client('XAI')
+
     # Format messages for chat completion
     formatted_messages = []
     for msg in messages:
@@ -193,13 +314,83 @@ def xai_completion(model: str, messages: list, max_tokens: int, temperature: flo
             }
         }
     except Exception as e:
-        print(f"Error in XAI completion: {str(e)}")
+        logger.error("xai completion failed", extra={"model": model, "error": str(e)})
+        raise
+
+def estimate_usage(model: str, messages: list, output_text: str):
+    """Local token count, only used when a provider response carries no usage data."""
+    combined_prompt = " ".join([msg['content'] for msg in messages])
+    return {
+        "input_tokens": count_tokens(combined_prompt, model),
+        "output_tokens": count_tokens(output_text, model)
+    }
+
+async def _dispatch_completion(model: str, messages: list, max_tokens: int, temperature: float):
+    if model in MODELS['OpenAI']:
+        completion = openai_completion
+    elif model in MODELS['Anthropic']:
+        completion = anthropic_completion
+    elif model in MODELS['Google']:
+        completion = google_completion
+    elif model in MODELS['XAI']:
+        completion = xai_completion
+    else:
+        raise ValueError(f"Unsupported model: {model}")
+
+    provider = next(name for name, models in MODELS.items() if model in models)
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        response = await run_in_threadpool(completion, model, messages, max_tokens, temperature)
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - started
+        PROVIDER_SECONDS.labels(provider, model, outcome).observe(elapsed)
+        logger.info("provider call finished", extra={"provider": provider, "model": model, "outcome": outcome,
+                                                     "duration_ms": round(elapsed * 1000, 2)})
+    # Responses are not streamed, so the first token arrives with the whole completion
+    TIME_TO_FIRST_TOKEN_SECONDS.labels(provider, model).observe(elapsed)
+    usage = response["usage"]
+    if not usage:
+        usage = await run_in_threadpool(estimate_usage, model, messages, response["content"])
+    return response["content"], usage["input_tokens"], usage["output_tokens"]
+
+async def summarize_turns(previous_summary: str, turns: list, priority: str = "interactive",
+                          session_id: Optional[str] = None) -> str:
+    """
+    Fold `turns` into the running summary. It runs on the request that needs
+    it, so it is scheduled at that request's priority and billed to its
+    session; compaction is off for the summary call itself.
+    """
+    transcript = "\n\n".join(f"{turn['role'].capitalize()}: {turn.get('content') or ''}" for turn in turns)
+    messages = [{
+        "role": "system",
+        "content": "Condense the conversation below into a brief running summary for a coding assistant. "
+                   "Keep decisions, requirements, file names and open questions; drop pleasantries and code bodies."
+    }, {
+        "role": "user",
+        "content": f"Existing summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}"
+    }]
+    try:
+        response = await handle_llm_interaction({
+            "model": COMPACTION["summary_model"],
+            "messages": messages,
+            "temperature": 0.2,
+            "priority": priority,
+            "session_id": session_id,
+            "compaction": False
+        })
+        return response["response"]
+    except Exception as e:
+        # compact_history falls back to an extractive summary and retries on the next request
+        logger.warning("summarizing history failed, using extractive summary", extra={"error": str(e)})
         raise
 
 async def handle_llm_interaction(request: dict):
     model = request.get('model', 'gpt-3.5-turbo')
     messages = request.get('messages', [])
     temperature = request.get('temperature', 0.7)
+    priority = PRIORITIES.get(request.get('priority'), PRIORITY_INTERACTIVE)
 
     for provider, models in MODELS.items():
         if model in models:
@@ -209,35 +400,56 @@ async def handle_llm_interaction(request: dict):
         raise ValueError(f"Unsupported model: {model}")
 
     try:
-        if model in MODELS['OpenAI']:
-            response = await run_in_threadpool(openai_completion, model, messages, max_tokens, temperature)
-            output_text = response["content"]
-            input_tokens = response["usage"]["input_tokens"]
-            output_tokens = response["usage"]["output_tokens"]
-        elif model in MODELS['Anthropic']:
-            output_text = await run_in_threadpool(anthropic_completion, model, messages, max_tokens, temperature)
-            # Calculate tokens for non-OpenAI responses
-            combined_prompt = " ".join([msg['content'] for msg in messages])
-            input_tokens = count_tokens(combined_prompt, model)
-            output_tokens = count_tokens(output_text, model)
-        elif model in MODELS['Google']:
-            output_text = await run_in_threadpool(google_completion, model, messages, max_tokens, temperature)
-            # Calculate tokens for non-OpenAI responses
-            combined_prompt = " ".join([msg['content'] for msg in messages])
-            input_tokens = count_tokens(combined_prompt, model)
-            output_tokens = count_tokens(output_text, model)
-        elif model in MODELS['XAI']:
-            response = await run_in_threadpool(xai_completion, model, messages, max_tokens, temperature)
-            output_text = response["content"]
-            input_tokens = response["usage"]["input_tokens"]
-            output_tokens = response["usage"]["output_tokens"]
-        else:
-            raise ValueError(f"Unsupported model: {model}")
+        file_priorities = parse_file_priorities(request.get('file_priorities'))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        provider = next(provider for provider, models in MODELS.items() if model in models)
-        input_cost = (input_tokens / 1_000_000) * MODELS[provider][model]['input']
-        output_cost = (output_tokens / 1_000_000) * MODELS[provider][model]['output']
-        total_cost = input_cost + output_cost
+    handle = request.get('prompt_handle')
+    if handle:
+        # With several workers this may read the shared SQLite cache
+        assembled = await run_in_threadpool(assembled_prompts.get, handle)
+        if assembled is None:
+            raise HTTPException(status_code=404, detail=f"Unknown or expired prompt handle: {handle}")
+        messages = with_assembled(messages, assembled)
+
+    compaction = None
+    session_id = request.get('session_id')
+    if session_id and COMPACTION["enabled"] and request.get('compaction', True):
+        with stage("compaction"):
+            messages, compaction = await compact_history(
+                messages, session_id, compaction_store,
+                lambda text: len(text) // 4,
+                lambda summary, turns: summarize_turns(summary, turns, request.get('priority') or 'interactive', session_id),
+                COMPACTION["budget_tokens"], COMPACTION["keep_recent_turns"], COMPACTION["retry_backoff_seconds"])
+
+    try:
+        with stage("pack"):
+            messages, packing = await run_in_threadpool(
+                pack_messages, messages, input_budget(provider, model),
+                lambda text: count_tokens(text, model), file_priorities)
+        packing['token_count_exact'] = provider in EXACT_TOKEN_COUNT_PROVIDERS
+    except ContextWindowExceeded as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    estimated_tokens = estimate_request_tokens(messages)
+    try:
+        # The prompt's cost is known up front; the completion's is not. It is held
+        # against the budgets while the call is in flight.
+        budget_hold = await run_in_threadpool(usage_ledger.reserve, provider, model,
+                                              call_cost(provider, model, estimated_tokens, 0), session_id)
+    except BudgetExceeded as e:
+        raise HTTPException(status_code=402, detail=str(e))
+
+    try:
+        async with scheduler.reserve(provider, model, estimated_tokens, priority) as reservation:
+            with stage("llm"):
+                output_text, input_tokens, output_tokens = await _dispatch_completion(model, messages, max_tokens, temperature)
+            reservation.settle(input_tokens + output_tokens)
+
+        total_cost = call_cost(provider, model, input_tokens, output_tokens)
+        usage_ledger.record(provider, model, input_tokens, output_tokens, total_cost, session_id=session_id,
+                            request_id=request_id_var.get(), priority=request.get('priority') or 'interactive',
+                            reservation=budget_hold)
 
         return {
             "response": output_text,
@@ -245,12 +457,20 @@ async def handle_llm_interaction(request: dict):
                 "input": input_tokens,
                 "output": output_tokens
             },
-            "cost": total_cost
+            "cost": total_cost,
+            "packing": packing,
+            "compaction": compaction
         }
 
     except Exception as e:
-        print(f"Error in LLM interaction: {str(e)}")
+        logger.error("llm interaction failed", extra={"model": model, "error": str(e)})
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # A no-op once the call is recorded
+        usage_ledger.release(budget_hold)
+
+async def get_scheduler_metrics():
+    return scheduler.metrics()
 
 async def get_available_models():
     return MODELS
\ No newline at end of file
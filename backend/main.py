@@ -1,24 +1,46 @@
 # uvicorn main:app --reload --port 8085 --log-level debug
-from fastapi import FastAPI, HTTPException, Query, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query, BackgroundTasks, Request, Response, WebSocket
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from utils.tree_structure import get_tree_structure, should_skip_token_count
-import os, json, re
-from dotenv import load_dotenv, set_key
+from fastapi.responses import PlainTextResponse
+from utils.tree_structure import get_tree_structure, get_tree_signature, should_skip_token_count
+import os, json, re, time, threading, asyncio
+from dotenv import load_dotenv
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
+from contextvars import ContextVar
+import anyio
 from datetime import datetime
 import uuid
-from llm_interaction import handle_llm_interaction, get_available_models
-from utils.context_map import generate_context_map,save_context_map,load_context_map
+from llm_interaction import (handle_llm_interaction, get_available_models, get_scheduler_metrics, reset_clients, warm_tokenizers,
+                             assembled_prompts, env_file, file_blocks, get_encoding, usage_ledger, count_tokens as count_model_tokens,
+                             token_count_is_exact)
+from utils.context_map import generate_context_map,save_context_map,load_context_map,context_map_path,refresh_context_map as refresh_saved_context_map
 from utils.git_operations import get_git_info, validate_repository_name
+from utils.git_changes import get_change_feed, relevance_boosts
+from utils.file_reader import (FILE_CONTENT_LIMITS, RangeNotSatisfiable, build_preview, parse_range_header,
+                               line_index, read_byte_range, read_line_window)
+from utils.token_estimation import TOKEN_ESTIMATION, ExactTokenCounts, estimate_file_tokens
+from utils.repository_summary import RepositorySummaries
+from utils.app_config import load_config, backend_setting
+from utils.http_cache import ResponseCache, make_etag, not_modified, validator_headers
+from utils.serialization import FastJSONResponse, dumps, loads
+from utils.shared_state import WORKERS, shared_cache
+from utils.compression import CompressionMiddleware
+from utils.live_updates import LiveUpdates
+from utils.profiling import PROFILING, ProfileStore, SamplingProfiler
+from utils.prompt_assembly import (PROMPT_ASSEMBLY, AssemblyError, extract_symbol, file_block, format_tree,
+                                   render_user_message)
+from utils.metrics import (REGISTRY, HTTP_REQUEST_SECONDS, TREE_BYTES_READ, Gauge, configure_logging, get_logger,
+                           request_id_var, stage)
+from utils.session_store import SessionStore
+from utils.prompt_store import PromptRegistry, step_sort_key
 import os.path as osp
 
 try:
-    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    with open(os.path.join(root_dir, 'config.json'), 'r') as f:
-        config = json.load(f)
-        BACKEND_PORT = config['backend']['port']
-        FRONTEND_PORT = config['frontend']['port']
+    config = load_config()
+    BACKEND_PORT = config['backend']['port']
+    FRONTEND_PORT = config['frontend']['port']
 except Exception as e:
     raise RuntimeError(f"Failed to load config.json: {str(e)}")
 
@@ -31,22 +53,119 @@ print(f"DEBUG: REPO_PATH exists: {os.path.exists(REPO_PATH) if REPO_PATH else Fa
 if REPO_PATH is None or REPO_PATH.strip() == "":
     raise ValueError("REPO_PATH environment variable is not set or is empty")
 
-app = FastAPI()
+# Browsers only let the frontend call the API; WebSockets check the Origin themselves
+ALLOWED_ORIGINS = [f"http://localhost:{FRONTEND_PORT}"]
+
+app = FastAPI(default_response_class=FastJSONResponse)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[f"http://localhost:{FRONTEND_PORT}"],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "X-Profile-Id"],
 )
+app.add_middleware(CompressionMiddleware)
+
+configure_logging(backend_setting('log_level', 'INFO'))
+logger = get_logger('api')
+
+@app.on_event("startup")
+async def warm_up():
+    # tiktoken encoders take a while to load; do it before the first request needs one
+    threading.Thread(target=warm_tokenizers, name="tokenizer-warmup", daemon=True).start()
+
+@app.on_event("shutdown")
+async def flush_usage():
+    # Calls still queued for the ledger would otherwise be lost
+    usage_ledger.close()
+
+profile_store = ProfileStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "profiles"), PROFILING['keep'])
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Sample the stacks of requests sent with `X-Profile: 1` or `?profile=1` when profiling is enabled."""
+    wanted = request.headers.get("x-profile") == "1" or request.query_params.get("profile") == "1"
+    if not (PROFILING['enabled'] and wanted):
+        return await call_next(request)
+    profiler = SamplingProfiler(PROFILING['interval_ms'] / 1000)
+    started = time.perf_counter()
+    profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        samples = profiler.stop()
+    route = request.scope.get("route")
+    profile_id = profile_store.save(samples, {
+        "request_id": request_id_var.get(),
+        "method": request.method,
+        "route": route.path if route is not None else request.url.path,
+        "status": response.status_code,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        "created_at": datetime.now().isoformat(),
+    })
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+REQUEST_ID_PATTERN = re.compile(r'^[0-9A-Za-z_.-]{1,64}$')
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """Tag the request with an id (taken from X-Request-ID if sent) and record its latency."""
+    request_id = request.headers.get("x-request-id", "")
+    if not REQUEST_ID_PATTERN.match(request_id):
+        # Ids end up in log lines and profile file names; anything unusual is replaced
+        request_id = uuid.uuid4().hex[:12]
+    token = request_id_var.set(request_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.labels(request.method, path, status).observe(elapsed)
+        logger.info("request finished", extra={"method": request.method, "route": path, "status": status,
+                                               "duration_ms": round(elapsed * 1000, 2)})
+        request_id_var.reset(token)
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 SYSTEM_PROMPTS_FILE = os.path.join(SCRIPT_DIR, "system_prompts.json")
 CONTEXT_MAPS_DIR = osp.join(SCRIPT_DIR,"context_maps")
 
-if not os.path.exists(SYSTEM_PROMPTS_FILE):
-    with open(SYSTEM_PROMPTS_FILE, 'w') as f:
-        json.dump([], f)
+prompt_registry = PromptRegistry(SYSTEM_PROMPTS_FILE)
+repository_summaries = RepositorySummaries(REPO_PATH)
+exact_token_counts = ExactTokenCounts(shared_cache)
+tree_responses = ResponseCache('tree_response', shared_cache)
+
+# Bytes read by the token counting of the /tree request in progress
+tree_bytes_read: ContextVar[Optional[List[int]]] = ContextVar('tree_bytes_read', default=None)
+
+def _count_bytes_read(size):
+    counter = tree_bytes_read.get()
+    if counter is not None:
+        counter[0] += size
+
+def _threadpool_usage():
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    return {("busy",): limiter.borrowed_tokens, ("capacity",): limiter.total_tokens}
+
+def _scheduler_gauges():
+    from llm_interaction import scheduler
+    values = {}
+    for provider, stats in scheduler.metrics().items():
+        values[(provider, "queued")] = stats["queue_depth"]
+        values[(provider, "active")] = stats["active"]
+    return values
+
+REGISTRY.register(Gauge('threadpool_threads', 'Worker threads of the default threadpool in use and available.',
+                        ('state',), callback=_threadpool_usage))
+REGISTRY.register(Gauge('llm_scheduler_requests', 'LLM requests waiting for or holding a provider slot.',
+                        ('provider', 'state'), callback=_scheduler_gauges))
 
 class TokenRequest(BaseModel):
     text: str
@@ -67,24 +186,6 @@ class SystemPromptCreate(BaseModel):
     content: str
     is_default: bool
 
-def load_system_prompts():
-    try:
-        with open(SYSTEM_PROMPTS_FILE, 'r') as f:
-            content = f.read().strip()
-            if content:
-                return json.loads(content)
-            else:
-                return []
-    except json.JSONDecodeError:
-        return []
-    except FileNotFoundError:
-        save_system_prompts([])
-        return []
-
-def save_system_prompts(prompts):
-    with open(SYSTEM_PROMPTS_FILE, 'w') as f:
-        json.dump(prompts, f, indent=2)
-
 def approximate_token_count(text: str) -> int:
     """
     Fast, offline token count approximation that works without external dependencies.
@@ -118,27 +219,44 @@ async def count_tokens(request: TokenRequest):
 async def root():
     return {"message": "Welcome to Speech-to-Code!"}
 
-def count_tokens_for_file(file_path):
+def count_tokens_for_file(file_path, estimated=None):
+    """
+    Token count of one file. When `estimated` is a dict, files above
+    `sample_above_bytes` without a known exact count are sampled instead of
+    read in full, and their confidence margin is recorded in it by path.
+    """
     if should_skip_token_count(file_path):
         return 0
         
     try:
         with open(file_path, 'rb') as f:
             sample = f.read(1024)
+            _count_bytes_read(len(sample))
             try:
                 sample.decode('utf-8')
             except UnicodeDecodeError:
                 return 0
+
+        if estimated is not None:
+            size = os.path.getsize(file_path)
+            if size > TOKEN_ESTIMATION['sample_above_bytes']:
+                exact = exact_token_counts.get(file_path)
+                if exact is not None:
+                    return exact
+                estimate, estimated[file_path] = estimate_file_tokens(file_path, size, approximate_token_count)
+                _count_bytes_read(min(size, TOKEN_ESTIMATION['sample_windows'] * TOKEN_ESTIMATION['window_bytes']))
+                return estimate
         
         with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
             content = file.read()
+            _count_bytes_read(os.fstat(file.fileno()).st_size)
             if not content.strip():
                 return 0
             return approximate_token_count(content)
     except Exception as e:
         return 0
 
-def update_token_counts(node, base_path):
+def update_token_counts(node, base_path, estimated=None):
     full_path = os.path.join(base_path, node['path'])
     
     if node['type'] == 'file' and should_skip_token_count(full_path):
@@ -147,26 +265,145 @@ def update_token_counts(node, base_path):
         return
         
     if node['type'] == 'file':
-        node['token_count'] = count_tokens_for_file(full_path)
+        node['token_count'] = count_tokens_for_file(full_path, estimated)
         node['skip_token_count'] = False
+        if estimated and full_path in estimated:
+            node['token_count_estimated'] = True
+            node['token_count_margin'] = estimated[full_path]
     else:
         total_tokens = 0
+        margin = 0
         for child in node.get('children', []):
-            update_token_counts(child, base_path)
+            update_token_counts(child, base_path, estimated)
             if not child.get('skip_token_count', False):
                 total_tokens += child.get('token_count', 0)
+                margin += child.get('token_count_margin', 0)
         node['token_count'] = total_tokens
+        if margin or any(child.get('token_count_estimated') for child in node.get('children', [])):
+            node['token_count_estimated'] = True
+            node['token_count_margin'] = margin
+
+def _tree_version(repository: str, estimate: bool = True):
+    """(ETag, newest mtime) of a repository's /tree body, from a stat-only signature."""
+    signature, last_modified = get_tree_signature(os.path.join(REPO_PATH, repository))
+    # Background exact counts change the body without touching any file
+    return make_etag(repository, estimate, signature, exact_token_counts.generation(repository) if estimate else None), last_modified
+
+def _tree_body(repository: str, etag: str, estimate: bool = True):
+    """
+    The /tree body for `etag`, from the last one built if it is still current.
+    Returns (body, paths still awaiting an exact count) so the caller decides
+    when to count them.
+    """
+    cache_key = f"{repository}:{int(estimate)}"
+    body = tree_responses.get(cache_key, etag)
+    if body is not None:
+        return body, None
+
+    base_path = os.path.join(REPO_PATH, repository)
+    with stage("walk"):
+        tree = get_tree_structure(base_path)
+    estimated = {} if estimate else None
+    bytes_read = [0]
+    token = tree_bytes_read.set(bytes_read)
+    try:
+        with stage("count"):
+            update_token_counts(tree, base_path, estimated)
+    finally:
+        tree_bytes_read.reset(token)
+    TREE_BYTES_READ.observe(bytes_read[0])
+    repository_summaries.record_tree(repository, tree['item_count'], tree['token_count'])
+    body = dumps({"tree": tree})
+    tree_responses.put(cache_key, etag, body)
+    pending = estimated if estimated and TOKEN_ESTIMATION['exact_in_background'] else None
+    return body, pending
 
 @app.get("/tree")
-async def get_tree(background_tasks: BackgroundTasks, repository: str = Query(..., description="The name of the repository")):
+async def get_tree(request: Request, background_tasks: BackgroundTasks,
+                   repository: str = Query(..., description="The name of the repository"),
+                   estimate: bool = Query(True, description="Sample very large files instead of reading them in full")):
+    """
+    Conditional on a stat-only signature of the listed files: a matching
+    If-None-Match gets a 304, and an unchanged tree is served from the last
+    body built for it instead of being recounted.
+    """
     if not repository:
         raise HTTPException(status_code=400, detail="Repository name is required")
     base_path = os.path.join(REPO_PATH, repository)
     if not os.path.exists(base_path):
         raise HTTPException(status_code=404, detail=f"Repository '{repository}' not found")
-    tree = json.loads(get_tree_structure(base_path))
-    update_token_counts(tree, base_path)
-    return {"tree": json.dumps(tree)}
+    # The walk, and with several workers the shared cache, block; keep them off the event loop
+    with stage("signature"):
+        etag, last_modified = await run_in_threadpool(_tree_version, repository, estimate)
+    unchanged = not_modified(request, etag, last_modified)
+    if unchanged is not None:
+        return unchanged
+    body, pending = await run_in_threadpool(_tree_body, repository, etag, estimate)
+    if pending:
+        # Exact counts replace the estimates on a later /tree once they are ready
+        background_tasks.add_task(_count_exact_tokens, repository, pending)
+    return Response(content=body, media_type="application/json", headers=validator_headers(etag, last_modified))
+
+def _count_exact_tokens(repository: str, paths) -> None:
+    """
+    Exact counts for the paths no other request or worker is already counting;
+    runs in a thread. Only `repository`'s tree version changes when they land.
+    """
+    exact_token_counts.compute(exact_token_counts.claim(paths), approximate_token_count, repository)
+
+def _live_tree(repository: str) -> Dict:
+    """The tree /tree would send now; exact counts are taken in another thread, the next diff carries them."""
+    body, pending = _tree_body(repository, _tree_version(repository)[0])
+    if pending:
+        threading.Thread(target=_count_exact_tokens, args=(repository, pending), name="exact-token-counts", daemon=True).start()
+    return loads(body)["tree"]
+
+live_updates = LiveUpdates(path=lambda repository: os.path.join(REPO_PATH, repository),
+                           version=lambda repository: _tree_version(repository)[0], load_tree=_live_tree,
+                           git_info=lambda repository: get_git_info(os.path.join(REPO_PATH, repository)))
+REGISTRY.register(Gauge('live_update_subscribers', 'WebSocket clients subscribed to repository updates.',
+                        ('repository',), callback=lambda: {(repository,): count for repository, count
+                                                           in live_updates.subscribers().items()}))
+
+@app.websocket("/ws/repository/{repository}")
+async def repository_updates(websocket: WebSocket, repository: str):
+    """
+    Pushes what changed in a repository instead of making clients poll:
+    "ready" with the git info once the watch has its baseline, then "diff"
+    messages with changed counts, added and removed nodes and new git info.
+    A client that receives "resync" or "error" should reload the tree; after
+    "error" the socket is closed and the client should reconnect.
+    """
+    # CORS does not apply to WebSockets: without this any page could read the tree.
+    # Browsers always send Origin, so a missing one is a local non-browser client.
+    origin = websocket.headers.get("origin")
+    if origin is not None and origin not in ALLOWED_ORIGINS:
+        await websocket.close(code=1008)
+        return
+    if not validate_repository_name(repository) or not os.path.isdir(os.path.join(REPO_PATH, repository)):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    async with live_updates.subscribe(repository) as queue:
+        async def forward():
+            while True:
+                message = await queue.get()
+                if message is None:
+                    await websocket.close(code=1011)
+                    return
+                await websocket.send_text(dumps(message).decode('utf-8'))
+
+        async def until_closed():
+            while (await websocket.receive())['type'] != 'websocket.disconnect':
+                pass
+
+        tasks = [asyncio.create_task(forward()), asyncio.create_task(until_closed())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
 @app.get("/directories")
 async def get_directories():
@@ -176,6 +413,14 @@ async def get_directories():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/repositories/summary")
+async def get_repositories_summary(refresh: bool = False):
+    """Branch, commit, dirty state, tracked file count and last known tree totals of every repository."""
+    try:
+        return {"repositories": await repository_summaries.summarize_all(refresh)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/git-info/{repository}")
 async def get_repository_git_info(repository: str):
     """Get git information for a specific repository."""
@@ -196,9 +441,33 @@ async def get_repository_git_info(repository: str):
     except Exception as e:
         # For local development, it's okay to show the actual error
         raise HTTPException(status_code=500, detail=f"Failed to get git info: {str(e)}")
+
+@app.get("/git-changes/{repository}")
+async def get_repository_git_changes(repository: str):
+    """Staged, unstaged and untracked files plus per-file churn over recent commits."""
+    try:
+        if not validate_repository_name(repository):
+            raise HTTPException(status_code=400, detail="Invalid repository name")
+        repo_path = os.path.join(REPO_PATH, repository)
+        if not os.path.isdir(repo_path):
+            raise HTTPException(status_code=404, detail=f"Repository '{repository}' not found")
+        feed = await run_in_threadpool(get_change_feed, repo_path)
+        if feed is None:
+            raise HTTPException(status_code=400, detail="Not a git repository")
+        return feed
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get git changes: {str(e)}")
     
 @app.get("/file_content")
-async def get_file_content(repository: str = Query(...), path: str = Query(...)):
+async def get_file_content(request: Request, repository: str = Query(...), path: str = Query(...),
+                           offset: Optional[int] = Query(None, ge=0), limit: Optional[int] = Query(None, ge=1)):
+    """
+    Whole file content, or part of it: a line window with `offset`/`limit`,
+    or raw bytes for an HTTP `Range` header (206). Files larger than
+    `max_full_bytes` get a head/tail preview unless a part is requested.
+    """
     file_path = os.path.join(REPO_PATH, repository, path)
     
     if not os.path.exists(file_path):
@@ -214,14 +483,35 @@ async def get_file_content(repository: str = Query(...), path: str = Query(...))
                 sample.decode('utf-8')
             except UnicodeDecodeError:
                 return {"content": "", "token_count": 0, "is_binary": True}
-        
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
+
+        size = os.path.getsize(file_path)
+        range_header = request.headers.get("range")
+        if range_header:
+            try:
+                start, end = parse_range_header(range_header, size)
+            except RangeNotSatisfiable:
+                raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+            data = await run_in_threadpool(read_byte_range, file_path, start, end)
+            return Response(content=data, status_code=206, media_type="text/plain; charset=utf-8",
+                            headers={"Content-Range": f"bytes {start}-{end}/{size}", "Accept-Ranges": "bytes"})
+
+        if offset is not None or limit is not None:
+            window = await run_in_threadpool(read_line_window, file_path, offset or 0, limit or FILE_CONTENT_LIMITS['max_window_lines'])
+            window["token_count"] = approximate_token_count(window["content"])
+            return window
+
+        if size > FILE_CONTENT_LIMITS['max_full_bytes']:
+            return await run_in_threadpool(build_preview, file_path, size, approximate_token_count)
+
+        with stage("read"), open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
             content = file.read()
             if not content.strip():
                 return {"content": "", "token_count": 0}
                 
             token_count = approximate_token_count(content)
             return {"content": content, "token_count": token_count}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -229,26 +519,50 @@ async def get_file_content(repository: str = Query(...), path: str = Query(...))
 async def get_file_lines(repository: str, file_path: str):
     full_path = os.path.join(REPO_PATH, repository, file_path)
     try:
-        with open(full_path, 'r', encoding='utf-8', errors='ignore') as file:
-            return {"line_count": sum(1 for _ in file)}
+        offsets = await run_in_threadpool(line_index.get, full_path)
+        return {"line_count": len(offsets) - 1}
     except Exception as e:
         return {"error": str(e)}
 
+def _prompts_validators(*parts):
+    """
+    ETag and Last-Modified of system_prompts.json as currently loaded. This
+    reloads the file (under its cross-process lock) if another worker changed
+    it, so handlers call it in the threadpool; the mutations run there too.
+    """
+    version = prompt_registry.version()
+    last_modified = version[0] / 1e9 if version else None
+    return make_etag("system_prompts", version, *parts), last_modified
+
 @app.get("/system_prompts", response_model=List[SystemPrompt])
-async def get_system_prompts():
-    prompts = load_system_prompts()
-    def safe_sort_key(x):
-        try:
-            return int(x['step'].split()[-1])
-        except (ValueError, IndexError):
-            return float('inf')
-    return sorted(prompts, key=safe_sort_key)
+async def get_system_prompts(request: Request, response: Response):
+    etag, last_modified = await run_in_threadpool(_prompts_validators)
+    unchanged = not_modified(request, etag, last_modified)
+    if unchanged is not None:
+        return unchanged
+    response.headers.update(validator_headers(etag, last_modified))
+    return prompt_registry.list()
+
+@app.get("/system_prompts/defaults", response_model=Dict[str, SystemPrompt])
+async def get_default_system_prompts(request: Request, response: Response, step: Optional[str] = None):
+    """The default prompt of every step (or of one `step`), keyed by step."""
+    etag, last_modified = await run_in_threadpool(_prompts_validators, step)
+    unchanged = not_modified(request, etag, last_modified)
+    if unchanged is not None:
+        return unchanged
+    response.headers.update(validator_headers(etag, last_modified))
+    defaults = prompt_registry.index.defaults
+    if step is None:
+        return defaults
+    if not step.startswith("Step "):
+        step = f"Step {step}"
+    if step not in defaults:
+        raise HTTPException(status_code=404, detail=f"No prompt for {step}")
+    return {step: defaults[step]}
 
 @app.post("/system_prompts", response_model=SystemPrompt)
 async def create_system_prompt(prompt: SystemPromptCreate):
     try:
-        prompts = load_system_prompts()
-        
         if not prompt.step.startswith("Step "):
             prompt.step = f"Step {prompt.step}"
         
@@ -257,9 +571,6 @@ async def create_system_prompt(prompt: SystemPromptCreate):
         except ValueError:
             raise HTTPException(status_code=400, detail="Step must be a number or 'Step X' where X is a number")
         
-        if any(p['step'] == prompt.step for p in prompts):
-            raise HTTPException(status_code=400, detail=f"Prompt for {prompt.step} already exists")
-        
         new_prompt = SystemPrompt(
             id=str(uuid.uuid4()),
             name=prompt.name,
@@ -269,70 +580,260 @@ async def create_system_prompt(prompt: SystemPromptCreate):
             timestamp=datetime.now().isoformat(),
             token_count=approximate_token_count(prompt.content)
         )
-        prompts.append(new_prompt.dict())
-        prompts.sort(key=lambda x: int(x['step'].split()[-1]))
-        save_system_prompts(prompts)
+
+        def add(index):
+            if prompt.step in index.by_step:
+                raise HTTPException(status_code=400, detail=f"Prompt for {prompt.step} already exists")
+            index.prompts.append(new_prompt.dict())
+            index.prompts.sort(key=step_sort_key)
+
+        await run_in_threadpool(prompt_registry.mutate, add)
         return new_prompt
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save prompt: {str(e)}")
 
 @app.delete("/system_prompts/{prompt_id}")
 async def delete_system_prompt(prompt_id: str):
-    prompts = load_system_prompts()
-    prompts = [p for p in prompts if p['id'] != prompt_id]
-    save_system_prompts(prompts)
+    def remove(index):
+        if prompt_id in index.by_id:
+            index.prompts.remove(index.by_id[prompt_id])
+
+    await run_in_threadpool(prompt_registry.mutate, remove)
     return {"message": "Prompt deleted successfully"}
     
 @app.put("/system_prompts/{prompt_id}", response_model=SystemPrompt)
 async def update_system_prompt(prompt_id: str, prompt: SystemPromptCreate):
-    prompts = load_system_prompts()
-    updated_prompt = None
-    for i, p in enumerate(prompts):
-        if p['id'] == prompt_id:
-            if any(other_p['name'] == prompt.name and other_p['id'] != prompt_id for other_p in prompts):
-                raise HTTPException(status_code=400, detail="Prompt name must be unique")
-            
-            if prompt.is_default:
-                for other_p in prompts:
-                    if other_p['step'] == p['step'] and other_p['id'] != prompt_id:
-                        other_p['is_default'] = False
-            
-            updated_prompt = SystemPrompt(
-                id=prompt_id,
-                name=prompt.name,
-                step=p['step'],
-                content=prompt.content,
-                is_default=prompt.is_default,
-                timestamp=datetime.now().isoformat(),
-                token_count=approximate_token_count(prompt.content)
-            )
-            prompts[i] = updated_prompt.dict()
-            break
-    
-    if updated_prompt:
-        save_system_prompts(prompts)
+    def update(index):
+        existing = index.by_id.get(prompt_id)
+        if existing is None:
+            raise HTTPException(status_code=404, detail="Prompt not found")
+
+        same_name = index.by_name.get(prompt.name)
+        if same_name is not None and same_name['id'] != prompt_id:
+            raise HTTPException(status_code=400, detail="Prompt name must be unique")
+        
+        if prompt.is_default:
+            for other_p in index.by_step[existing['step']]:
+                if other_p['id'] != prompt_id:
+                    other_p['is_default'] = False
+        
+        updated_prompt = SystemPrompt(
+            id=prompt_id,
+            name=prompt.name,
+            step=existing['step'],
+            content=prompt.content,
+            is_default=prompt.is_default,
+            timestamp=datetime.now().isoformat(),
+            token_count=approximate_token_count(prompt.content)
+        )
+        existing.update(updated_prompt.dict())
         return updated_prompt
-    raise HTTPException(status_code=404, detail="Prompt not found")
+
+    return await run_in_threadpool(prompt_registry.mutate, update)
 
 @app.post("/llm_interaction") 
 async def llm_interaction(request: dict):
-    request_id = str(uuid.uuid4())[:8]
+    return await handle_llm_interaction(request)
+
+class SymbolReference(BaseModel):
+    path: str
+    name: str
+
+class PromptAssembleRequest(BaseModel):
+    repository: str
+    template: str = ""
+    files: List[str] = []
+    # Files above max_full_bytes to include whole rather than as a preview, up to max_full_read_bytes
+    full_files: List[str] = []
+    symbols: List[SymbolReference] = []
+    system_prompt_id: Optional[str] = None
+    include_tree: bool = False
+    model: str = "gpt-4.1"
+    include_messages: bool = False
+
+def _repository_file(repo_path: str, path: str) -> str:
+    full_path = osp.realpath(osp.join(repo_path, path))
+    if osp.commonpath([full_path, repo_path]) != repo_path:
+        raise AssemblyError(f"Path is outside the repository: {path}")
+    return full_path
+
+def assemble_prompt(request: PromptAssembleRequest) -> Dict:
+    if not validate_repository_name(request.repository):
+        raise HTTPException(status_code=400, detail="Invalid repository name")
+    repo_path = osp.realpath(osp.join(REPO_PATH, request.repository))
+    repo_root = osp.realpath(REPO_PATH)
+    if osp.commonpath([repo_path, repo_root]) != repo_root or repo_path == repo_root:
+        raise HTTPException(status_code=400, detail="Invalid repository name")
+    if not osp.isdir(repo_path):
+        raise HTTPException(status_code=404, detail=f"Repository '{request.repository}' not found")
+    encoding = get_encoding(request.model).name
+    count = lambda text: count_model_tokens(text, request.model)
+    blocks, files, skipped = [], [], []
+
+    for path in dict.fromkeys(request.files):
+        full_path = _repository_file(repo_path, path)
+        if not osp.isfile(full_path):
+            skipped.append({"path": path, "reason": "not found"})
+            continue
+        if should_skip_token_count(full_path):
+            skipped.append({"path": path, "reason": "binary"})
+            continue
+        size = osp.getsize(full_path)
+        if size > FILE_CONTENT_LIMITS['max_full_bytes'] and path not in request.full_files:
+            # The same head/tail preview /file_content shows for the file
+            preview = build_preview(full_path, size, count)
+            blocks.append(file_block(path, preview['content']))
+            files.append({"path": path, "token_count": preview['token_count'], "truncated": True,
+                          "estimated_token_count": preview['estimated_token_count'], "size": size})
+            continue
+        if size > FILE_CONTENT_LIMITS['max_full_read_bytes']:
+            skipped.append({"path": path, "reason": "too large to include whole; reference a symbol instead"})
+            continue
+        try:
+            digest, content = file_blocks.read(full_path)
+        except UnicodeDecodeError:
+            skipped.append({"path": path, "reason": "binary"})
+            continue
+        if not content.strip():
+            skipped.append({"path": path, "reason": "empty"})
+            continue
+        blocks.append(file_block(path, content))
+        files.append({"path": path, "hash": digest, "token_count": file_blocks.token_count(digest, encoding, content, count)})
+
+    for symbol in request.symbols:
+        full_path = _repository_file(repo_path, symbol.path)
+        if not osp.isfile(full_path):
+            raise AssemblyError(f"File not found: {symbol.path}")
+        if osp.getsize(full_path) > FILE_CONTENT_LIMITS['max_full_bytes']:
+            raise AssemblyError(f"File is too large to read symbols from: {symbol.path}")
+        try:
+            digest, content = file_blocks.read(full_path)
+        except UnicodeDecodeError:
+            raise AssemblyError(f"File is not UTF-8 text: {symbol.path}")
+        source, first, last = extract_symbol(symbol.path, content, symbol.name)
+        label = f"{symbol.path}#{symbol.name}"
+        blocks.append(file_block(label, source))
+        files.append({"path": label, "hash": digest, "lines": [first, last],
+                      "token_count": file_blocks.token_count(digest, encoding, source, count, symbol.name)})
+
+    tree = format_tree(get_tree_structure(repo_path)) if request.include_tree else None
+    messages = []
+    if request.system_prompt_id:
+        prompt = prompt_registry.get(request.system_prompt_id)
+        if prompt is None:
+            raise HTTPException(status_code=404, detail=f"System prompt not found: {request.system_prompt_id}")
+        messages.append({"role": "system", "content": prompt['content']})
+    messages.append({"role": "user", "content": render_user_message(request.template, blocks, tree)})
+
+    token_counts = {message["role"]: count(message["content"]) for message in messages}
+    result = {
+        "handle": assembled_prompts.put(messages),
+        "model": request.model,
+        "token_count": sum(token_counts.values()),
+        "token_counts": token_counts,
+        # False for Anthropic, Gemini and other models counted with cl100k_base
+        "token_count_exact": token_count_is_exact(request.model),
+        "files": files,
+        "skipped": skipped,
+        "expires_in_seconds": PROMPT_ASSEMBLY['handle_ttl_seconds'],
+    }
+    if request.include_messages:
+        result["messages"] = messages
+    return result
+
+@app.post("/prompts/assemble")
+async def assemble_prompt_endpoint(request: PromptAssembleRequest):
+    """
+    Build the messages for a prompt from repository files, symbols and a
+    system prompt on the server. Returns their token count (exact only where
+    `token_count_exact` says so) and a handle to pass to /llm_interaction as
+    `prompt_handle` instead of the text.
+    """
     try:
-        response = await handle_llm_interaction(request)
-        return response
-    except Exception as e:
+        return await run_in_threadpool(assemble_prompt, request)
+    except HTTPException:
         raise
+    except AssemblyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to assemble prompt: {str(e)}")
 
 @app.get("/available_models")
 async def available_models():
     return await get_available_models()
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of latency histograms, cache hit counters and pool gauges."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/profiles")
+async def list_profiles(limit: int = Query(20, ge=1, le=200)):
+    """Most recent request profiles, newest first."""
+    return {"enabled": PROFILING['enabled'], "profiles": profile_store.list(limit)}
+
+@app.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str):
+    """One profile in collapsed-stack format, ready for flamegraph.pl or speedscope."""
+    path = profile_store.path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile '{profile_id}' not found")
+    with open(path, 'r') as f:
+        return PlainTextResponse(f.read())
+
+@app.get("/scheduler/metrics")
+async def scheduler_metrics():
+    """Queue depth, concurrency and wait times of the LLM admission scheduler."""
+    return await get_scheduler_metrics()
+
+@app.get("/usage/summary")
+async def usage_summary(days: int = Query(30, ge=1, le=366)):
+    """Spend and tokens today, this month and over the last `days` days by model and provider, with budget status."""
+    try:
+        return await run_in_threadpool(usage_ledger.summary, days)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/usage/daily")
+async def usage_daily(days: int = Query(30, ge=1, le=366), group_by: str = Query("model")):
+    """One row per day and model (or provider)."""
+    try:
+        return {"days": await run_in_threadpool(usage_ledger.daily, days, group_by)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/usage/sessions")
+async def usage_sessions(limit: int = Query(20, ge=1, le=500)):
+    """Sessions with the highest spend."""
+    try:
+        return {"sessions": await run_in_threadpool(usage_ledger.sessions, limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/usage/sessions/{session_id}")
+async def usage_session(session_id: str):
+    try:
+        usage = await run_in_threadpool(usage_ledger.session, session_id)
+        if usage is None:
+            raise HTTPException(status_code=404, detail=f"No usage recorded for session '{session_id}'")
+        return usage
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 class EnvVarUpdate(BaseModel):
     key: str
     value: str
 
 @app.get("/env_vars")
 async def get_env_vars():
+    if env_file.refresh():
+        reset_clients()
     return {
         "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", ""),
         "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", ""),
@@ -343,9 +844,8 @@ async def get_env_vars():
 @app.post("/env_vars")
 async def update_env_var(env_var: dict):
    key, value = next(iter(env_var.items()))
-   env_file = os.path.join(os.path.dirname(__file__), ".env")
-   set_key(env_file, key, value)
-   os.environ[key] = value
+   env_file.set(key, value)
+   reset_clients()
    return {"message": f"{key} updated successfully"}
 
 @app.post("/repository-context/{repository}/initialize")
@@ -366,18 +866,31 @@ async def refresh_context_map(repository:str):
    if not osp.exists(repo_path):
        raise HTTPException(status_code=404,detail=f"Repository '{repository}' not found")
    try:
-       context_map=generate_context_map(repo_path,repository)
+       existing=load_context_map(repository,CONTEXT_MAPS_DIR)
+       context_map=refresh_saved_context_map(repo_path,repository,existing)
        save_context_map(context_map,CONTEXT_MAPS_DIR)
        return{"message":"Context map refreshed successfully","repositoryId":repository}
    except Exception as e:
        raise HTTPException(status_code=500,detail=f"Failed to refresh context map: {str(e)}")
 
 @app.get("/repository-context/{repository}")
-async def get_context_map(repository:str):
-   context_map=load_context_map(repository,CONTEXT_MAPS_DIR)
-   if not context_map:
+async def get_context_map(request:Request,repository:str):
+   # Versioned by the saved file itself, which is served as stored rather than parsed and re-encoded
+   filepath=context_map_path(repository,CONTEXT_MAPS_DIR)
+   try:
+       stat=os.stat(filepath)
+   except OSError:
        raise HTTPException(status_code=404,detail=f"Context map for repository '{repository}' not found")
-   return context_map
+   etag=make_etag("context_map",repository,stat.st_mtime_ns,stat.st_size)
+   unchanged=not_modified(request,etag,stat.st_mtime)
+   if unchanged is not None:
+       return unchanged
+   with open(filepath,'rb')as f:
+       body=f.read()
+   return Response(content=body,media_type="application/json",headers=validator_headers(etag,stat.st_mtime))
+
+# The model must be one of MODELS; it used to be a model the backend doesn't offer
+ANALYZE_PROMPT_MODEL = backend_setting('analyze_prompt_model', 'gpt-4.1-mini')
 
 class AnalyzePromptRequest(BaseModel):
    repository: str
@@ -385,12 +898,15 @@ class AnalyzePromptRequest(BaseModel):
 
 @app.post("/analyze-prompt")
 async def analyze_prompt(request: AnalyzePromptRequest):
-   request_id = str(uuid.uuid4())[:8]
    context_map = load_context_map(request.repository, CONTEXT_MAPS_DIR)
    if not context_map:
        raise HTTPException(status_code=404, detail=f"Context map for repository '{request.repository}' not found")
 
    files_json = json.dumps({k: v['summary'] for k, v in context_map['files'].items()}, indent=2)
+   boosts = relevance_boosts(await run_in_threadpool(get_change_feed, osp.join(REPO_PATH, request.repository)))
+   boosts = {path: score for path, score in boosts.items() if path in context_map['files']}
+   recent_files = sorted(boosts, key=boosts.get, reverse=True)[:20]
+   recent_hint = "\n\nFiles recently changed in git (most active first):\n" + "\n".join(recent_files) if recent_files else ""
 
    messages = [{
        "role": "system",
@@ -426,14 +942,15 @@ Guidelines:
 """
    }, {
        "role": "user",
-       "content": f"""Repository files with summaries:\n{files_json}\n\nUser prompt:\n{request.prompt}\n\nProvide file suggestions in the specified JSON format."""
+       "content": f"""Repository files with summaries:\n{files_json}{recent_hint}\n\nUser prompt:\n{request.prompt}\n\nProvide file suggestions in the specified JSON format."""
    }]
 
    try:
        response = await handle_llm_interaction({
-           "model": "gpt-4o-mini",
+           "model": ANALYZE_PROMPT_MODEL,
            "messages": messages,
-           "temperature": 0.1
+           "temperature": 0.1,
+           "priority": "background"
        })
 
        try:
@@ -447,9 +964,11 @@ Guidelines:
 
        all_files = context_map['files'].keys()
        for confidence in required_keys:
-           for item in suggestions[confidence]:
-               if item["file"] not in all_files:
-                   suggestions[confidence].remove(item)
+           items = [item for item in suggestions[confidence] if item["file"] in all_files]
+           for item in items:
+               item["recently_changed"] = item["file"] in boosts
+           # Within a confidence level, files with recent git activity come first
+           suggestions[confidence] = sorted(items, key=lambda item: -boosts.get(item["file"], 0.0))
 
        result = {
            "suggestions": suggestions,
@@ -471,23 +990,37 @@ class ChatSession(BaseModel):
     included_files: List[str]
     deleted_at: Optional[str] = None
 
+class ChatSessionDelta(BaseModel):
+    messages: List[dict] = []
+    stages: List[dict] = []
+    included_files: List[str] = []
+    title: Optional[str] = None
+    deleted_at: Optional[str] = None
+
 LOGS_DIR = os.path.join(SCRIPT_DIR, "logs")
 SESSIONS_DIR = os.path.join(LOGS_DIR, "sessions")
 
 # Create directories if they don't exist
 os.makedirs(SESSIONS_DIR, exist_ok=True)
 
+# Store calls take a cross-process lock, hit SQLite and fsync, so handlers run them in the threadpool
+session_store = SessionStore(SESSIONS_DIR, os.path.join(LOGS_DIR, "sessions.sqlite3"))
+
 @app.get("/chat-sessions")
-async def list_chat_sessions():
+async def list_chat_sessions(limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
+    """One page of session metadata; pass `next_cursor` back as `cursor` for the next page."""
+    try:
+        return await run_in_threadpool(session_store.list, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/chat-sessions/search")
+async def search_chat_sessions(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=100)):
+    """Full-text search over session titles, messages and included file paths."""
     try:
-        sessions = []
-        for filename in os.listdir(SESSIONS_DIR):
-            if filename.endswith('.json'):
-                with open(os.path.join(SESSIONS_DIR, filename), 'r') as f:
-                    session = json.load(f)
-                    if not session.get('deleted_at'):  # Only include non-deleted sessions
-                        sessions.append(session)
-        return sorted(sessions, key=lambda x: x['updated_at'], reverse=True)
+        return {"results": await run_in_threadpool(session_store.search, q, limit)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -507,60 +1040,71 @@ async def create_chat_session(title: str = "New Chat"):
             "included_files": []
         }
         
-        with open(os.path.join(SESSIONS_DIR, f"{session_id}.json"), 'w') as f:
-            json.dump(session, f, indent=2)
-        
-        return session
+        return await run_in_threadpool(session_store.save, session)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/chat-sessions/{session_id}")
 async def get_chat_session(session_id: str):
     try:
-        with open(os.path.join(SESSIONS_DIR, f"{session_id}.json"), 'r') as f:
-            session = json.load(f)
-            if session.get('deleted_at'):  # Return 404 if session is soft-deleted
-                raise HTTPException(status_code=404, detail="Session not found")
-            return session
-    except FileNotFoundError:
-        raise HTTPException(status_code=404, detail="Session not found")
+        session = await run_in_threadpool(session_store.get, session_id)
+        if not session or session.get('deleted_at'):  # Return 404 if session is missing or soft-deleted
+            raise HTTPException(status_code=404, detail="Session not found")
+        return session
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/chat-sessions/{session_id}")
 async def update_chat_session(session_id: str, session: ChatSession):
     try:
+        if not await run_in_threadpool(session_store.exists, session_id):
+            raise HTTPException(status_code=404, detail="Session not found")
         session_dict = session.dict()
+        session_dict["id"] = session_id
         session_dict["updated_at"] = datetime.utcnow().isoformat()
         
-        with open(os.path.join(SESSIONS_DIR, f"{session_id}.json"), 'w') as f:
-            json.dump(session_dict, f, indent=2)
-        
-        return session_dict
-    except FileNotFoundError:
-        raise HTTPException(status_code=404, detail="Session not found")
+        return await run_in_threadpool(session_store.save, session_dict)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.patch("/chat-sessions/{session_id}")
+async def append_to_chat_session(session_id: str, delta: ChatSessionDelta):
+    """Append new messages, stages and files without resending the whole session."""
+    try:
+        delta_dict = delta.dict()
+        delta_dict["updated_at"] = datetime.utcnow().isoformat()
+        metadata = await run_in_threadpool(session_store.append, session_id, delta_dict)
+        if metadata is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return metadata
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/chat-sessions/{session_id}")
 async def delete_chat_session(session_id: str):
     try:
-        file_path = os.path.join(SESSIONS_DIR, f"{session_id}.json")
-        with open(file_path, 'r') as f:
-            session = json.load(f)
+        session = await run_in_threadpool(session_store.get, session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
         
         session["deleted_at"] = datetime.utcnow().isoformat()
         session["updated_at"] = session["deleted_at"]
-        
-        with open(file_path, 'w') as f:
-            json.dump(session, f, indent=2)
+        await run_in_threadpool(session_store.save, session)
             
         return {"message": "Session soft deleted"}
-    except FileNotFoundError:
-        raise HTTPException(status_code=404, detail="Session not found")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
    import uvicorn
-   uvicorn.run(app, host="0.0.0.0", port=BACKEND_PORT, log_level="debug", log_config=None)
\ No newline at end of file
+   # Several workers need the app as an import string so each process can load it
+   uvicorn.run("main:app" if WORKERS > 1 else app, host="0.0.0.0", port=BACKEND_PORT, workers=WORKERS,
+               log_level="debug", log_config=None)
\ No newline at end of file
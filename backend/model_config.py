@@ -21,4 +21,22 @@ MODELS = {
         "grok-3-mini": {"input": 0.3, "output": 0.5, "input_tokens": 128000, "output_tokens": 32768},
         "grok-3-mini-fast": {"input": 0.6, "output": 0.4, "input_tokens": 128000, "output_tokens": 32768}
     }
-}
\ No newline at end of file
+}
+
+# Admission-control limits used by utils/rate_limiter.py. Provider entries cap the
+# whole account; a model entry in MODELS may add its own "rpm"/"tpm" (from the
+# provider's rate-limit page for your account tier) to cap that model further.
+RATE_LIMITS = {
+    "OpenAI": {"rpm": 500, "tpm": 800000, "max_concurrent": 8},
+    "Anthropic": {"rpm": 50, "tpm": 40000, "max_concurrent": 4},
+    "Google": {"rpm": 60, "tpm": 1000000, "max_concurrent": 4},
+    "XAI": {"rpm": 60, "tpm": 200000, "max_concurrent": 4}
+}
+
+# Providers whose "input_tokens" is the whole context window, which the
+# completion's "output_tokens" share; for Google it limits the prompt alone.
+SHARED_CONTEXT_WINDOW = {"OpenAI", "Anthropic", "XAI"}
+
+# Only OpenAI models have their own tokenizer in tiktoken; the others are
+# counted with cl100k_base, which approximates their real token counts.
+EXACT_TOKEN_COUNT_PROVIDERS = {"OpenAI"}
@@ -0,0 +1,29 @@
+import os
+import json
+from functools import lru_cache
+from typing import Any
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CONFIG_FILE = os.path.join(ROOT_DIR, 'config.json')
+
+
+@lru_cache(maxsize=1)
+def load_config() -> dict:
+    """Parse the shared config.json once per process."""
+    with open(CONFIG_FILE, 'r') as f:
+        return json.load(f)
+
+
+def backend_setting(name: str, default: Any = None) -> Any:
+    """
+    Read an optional key from the "backend" section of config.json.
+    Dict defaults are merged with the configured values, so a partial
+    section only overrides the keys it names.
+    """
+    try:
+        value = load_config().get('backend', {}).get(name)
+    except (OSError, ValueError):
+        value = None
+    if isinstance(default, dict):
+        return {**default, **(value or {})}
+    return default if value is None else value
@@ -0,0 +1,87 @@
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.app_config import backend_setting
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSION = backend_setting('compression', {
+    # Smaller responses are sent as they are
+    'minimum_size': 1024,
+    'gzip_level': 6,
+    'brotli_quality': 4,
+})
+
+
+def _accepted(accept_encoding: str) -> set:
+    """Codings the client accepts; a q=0 parameter rules one out."""
+    accepted = set()
+    for part in accept_encoding.lower().split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip())
+    return accepted
+
+
+class _PassThroughPartial:
+    """Leaves 206 and 304 responses alone: their headers describe the uncompressed body."""
+
+    async def send_with_compression(self, message: Message) -> None:
+        if message['type'] == 'http.response.start':
+            await super().send_with_compression(message)
+            if message['status'] in (206, 304) or 'content-range' in Headers(raw=message['headers']):
+                self.content_encoding_set = True
+            return
+        await super().send_with_compression(message)
+
+
+class _GZipResponder(_PassThroughPartial, GZipResponder):
+    pass
+
+
+class _BrotliResponder(_PassThroughPartial, IdentityResponder):
+    content_encoding = 'br'
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int):
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        # Flushing every chunk keeps streamed responses streaming
+        output = self.compressor.process(body)
+        return output + (self.compressor.flush() if more_body else self.compressor.finish())
+
+
+class CompressionMiddleware:
+    """
+    Brotli when the client accepts it and the module is installed, gzip
+    otherwise, for responses of at least `minimum_size` bytes. Event
+    streams and already encoded responses pass through untouched.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION['minimum_size'],
+                 gzip_level: int = COMPRESSION['gzip_level'], brotli_quality: int = COMPRESSION['brotli_quality']):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        accepted = _accepted(Headers(scope=scope).get('accept-encoding', ''))
+        if brotli is not None and 'br' in accepted:
+            responder = _BrotliResponder(self.app, self.minimum_size, self.brotli_quality)
+        elif 'gzip' in accepted:
+            responder = _GZipResponder(self.app, self.minimum_size, compresslevel=self.gzip_level)
+        else:
+            await self.app(scope, receive, send)
+            return
+        await responder(scope, receive, send)
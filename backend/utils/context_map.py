@@ -1,6 +1,9 @@
-import os,json,time,ast
+import os,time,ast
 from typing import Dict,List,Optional
 from datetime import datetime
+from utils.git_changes import get_change_feed,files_changed_since
+from utils.ignore_matcher import IgnoreMatcher,CONTEXT_MAP_PATTERNS
+from utils.serialization import read_json,write_json
 
 def parse_python_file(content:str)->List[str]:
     try:
@@ -106,59 +109,19 @@ def get_file_metadata(filepath:str,content:str)->Dict:
         'summary':summary
     }
 
+def _add_file(context_map:Dict,repo_path:str,relpath:str)->None:
+    filepath=os.path.join(repo_path,relpath)
+    with open(filepath,'r',encoding='utf-8')as f:
+        content=f.read()
+    if os.path.basename(relpath).lower()=='readme.md':
+        context_map['projectDescription']=extract_readme_description(content)
+    else:
+        context_map['files'][relpath]=get_file_metadata(filepath,content)
+
 def generate_context_map(repo_path:str,repo_name:str)->Dict:
     if not os.path.exists(repo_path):
         raise ValueError(f"Repository path not found: {repo_path}")
-    
-    # Directories to exclude
-    EXCLUDED_DIRS = {
-        '.git', 'node_modules', 'venv', '.venv', '__pycache__',
-        '.next', # Next.js build output
-        'out', # Next.js static export
-        'build', # Build directories
-        'dist',
-        'coverage', # Test coverage
-        '.vercel', # Vercel deployment
-        'public/static', # Static assets
-        '.turbo', # Turborepo cache
-        '.mypy_cache', # MyPy cache
-        '.pytest_cache', # Pytest cache
-        '.ruff_cache', # Ruff cache
-        'certs', # Certificate files
-        'logs', # Log files
-    }
 
-    # File extensions to exclude
-    EXCLUDED_EXTENSIONS = {
-        # Build artifacts
-        'map', # Source maps
-        'min.js', 'min.css', # Minified files
-        # Binary and media files
-        'jpg', 'jpeg', 'png', 'gif', 'ico', 'svg', 'webp',
-        'mp3', 'mp4', 'wav', 'ogg', 'webm',
-        'pdf', 'doc', 'docx', 'xls', 'xlsx',
-        'ttf', 'woff', 'woff2', 'eot',
-        # Cache and temporary files
-        'cache', 'log', 'tmp',
-        # Package management
-        'lock', 'yarn.lock',
-    }
-
-    # Specific files to exclude
-    EXCLUDED_FILES = {
-        'package-lock.json',
-        'yarn.lock',
-        '.npmrc',
-        '.yarnrc',
-        '.env',
-        '.env.local',
-        '.env.development',
-        '.env.production',
-        '.env.test',
-        'tsconfig.tsbuildinfo',
-        '.eslintcache',
-    }
-    
     context_map={
         'repositoryId':repo_name,
         'lastUpdated':datetime.now().isoformat(),
@@ -166,41 +129,59 @@ def generate_context_map(repo_path:str,repo_name:str)->Dict:
         'projectDescription':''
     }
 
-    for root,_,files in os.walk(repo_path):
-        # Skip excluded directories
-        if any(x in root.split(os.sep) for x in EXCLUDED_DIRS):
-            continue
-        
+    # Ignored directories (defaults and .gitignore) are pruned, never entered
+    for root,_,files in IgnoreMatcher(repo_path,CONTEXT_MAP_PATTERNS).walk():
         for file in files:
-            # Skip files starting with dot, excluded files, and excluded extensions
-            if (file.startswith('.') or 
-                file in EXCLUDED_FILES or 
-                any(file.endswith(f'.{ext}') for ext in EXCLUDED_EXTENSIONS)):
-                continue
-
-            filepath=os.path.join(root,file)
-            relpath=os.path.relpath(filepath,repo_path)
-            
             try:
-                with open(filepath,'r',encoding='utf-8')as f:
-                    content=f.read()
-                
-                if file.lower()=='readme.md':
-                    context_map['projectDescription']=extract_readme_description(content)
-                else:
-                    context_map['files'][relpath]=get_file_metadata(filepath,content)
+                _add_file(context_map,repo_path,os.path.join(root,file))
             except:continue
 
+    _record_git_state(context_map,repo_path)
     return context_map
 
+def _record_git_state(context_map:Dict,repo_path:str)->None:
+    # Remember what the map was built from so the next refresh can be selective
+    feed=get_change_feed(repo_path)
+    context_map['gitHead']=feed['head'] if feed else None
+    context_map['dirtyFiles']=sorted(set(feed['staged']+feed['unstaged']+feed['untracked'])) if feed else []
+
+def update_context_map(context_map:Dict,repo_path:str,paths)->Dict:
+    """Re-read only `paths`; files that are gone or now excluded are dropped."""
+    matcher=IgnoreMatcher(repo_path,CONTEXT_MAP_PATTERNS)
+    for relpath in paths:
+        relpath=os.path.normpath(relpath)
+        context_map['files'].pop(relpath,None)
+        if matcher.is_ignored(relpath) or not os.path.isfile(os.path.join(repo_path,relpath)):
+            continue
+        try:
+            _add_file(context_map,repo_path,relpath)
+        except:continue
+    context_map['lastUpdated']=datetime.now().isoformat()
+    _record_git_state(context_map,repo_path)
+    return context_map
+
+def refresh_context_map(repo_path:str,repo_name:str,existing:Optional[Dict])->Dict:
+    """
+    Bring a saved map up to date. When it records the commit it was built
+    from, only files changed since then (plus files that were dirty at the
+    time) are re-read; otherwise the map is rebuilt from scratch.
+    """
+    if not existing or not existing.get('gitHead'):
+        return generate_context_map(repo_path,repo_name)
+    changed=files_changed_since(repo_path,existing['gitHead'])
+    if changed is None:
+        return generate_context_map(repo_path,repo_name)
+    changed.update(existing.get('dirtyFiles',[]))
+    return update_context_map(existing,repo_path,changed)
+
+def context_map_path(repo_name:str,base_path:str)->str:
+    return os.path.join(base_path,f"{repo_name}.json")
+
 def save_context_map(context_map:Dict,base_path:str)->None:
     os.makedirs(base_path,exist_ok=True)
-    filepath=os.path.join(base_path,f"{context_map['repositoryId']}.json")
-    with open(filepath,'w')as f:
-        json.dump(context_map,f,indent=2)
+    write_json(context_map_path(context_map['repositoryId'],base_path),context_map)
 
 def load_context_map(repo_name:str,base_path:str)->Optional[Dict]:
-    filepath=os.path.join(base_path,f"{repo_name}.json")
+    filepath=context_map_path(repo_name,base_path)
     if not os.path.exists(filepath):return None
-    with open(filepath)as f:
-        return json.load(f)
\ No newline at end of file
+    return read_json(filepath)
\ No newline at end of file
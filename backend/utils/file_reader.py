@@ -0,0 +1,162 @@
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+
+from utils.app_config import backend_setting
+from utils.metrics import record_cache
+
+FILE_CONTENT_LIMITS = backend_setting('file_content', {
+    # Files above this are answered with a head/tail preview unless a window is requested
+    'max_full_bytes': 2 * 1024 * 1024,
+    'preview_head_bytes': 32 * 1024,
+    'preview_tail_bytes': 8 * 1024,
+    'max_window_lines': 5000,
+    'max_range_bytes': 4 * 1024 * 1024,
+    # Hard cap on reading an oversized file whole, which a user has to ask for explicitly
+    'max_full_read_bytes': 16 * 1024 * 1024,
+    'line_index_cache_entries': 32,
+})
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+class LineIndexCache:
+    """
+    Byte offset of every line start, built in one chunked pass per file and
+    kept for the most recently used files until their mtime or size changes.
+    An index costs 8 bytes per line, never the file contents.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[tuple, array]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _build(path: str) -> array:
+        offsets = array('Q', [0])
+        position = 0
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                start = chunk.find(b'\n')
+                while start != -1:
+                    offsets.append(position + start + 1)
+                    start = chunk.find(b'\n', start + 1)
+                position += len(chunk)
+        # A trailing newline does not start another line
+        if offsets[-1] == position:
+            offsets.pop()
+        offsets.append(position)
+        return offsets
+
+    def get(self, path: str) -> array:
+        """Offsets of each line start followed by the file size, so line i spans [i, i+1)."""
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached and cached[0] == signature:
+                self._entries.move_to_end(path)
+                record_cache('line_index', True)
+                return cached[1]
+        record_cache('line_index', False)
+        offsets = self._build(path)
+        with self._lock:
+            self._entries[path] = (signature, offsets)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return offsets
+
+
+line_index = LineIndexCache(FILE_CONTENT_LIMITS['line_index_cache_entries'])
+
+
+def read_line_window(path: str, offset: int, limit: int) -> Dict:
+    """Lines [offset, offset + limit) of a file, read with a single seek."""
+    limit = min(limit, FILE_CONTENT_LIMITS['max_window_lines'])
+    offsets = line_index.get(path)
+    total_lines = len(offsets) - 1
+    start = min(offset, total_lines)
+    end = min(start + limit, total_lines)
+    with open(path, 'rb') as f:
+        f.seek(offsets[start])
+        data = f.read(offsets[end] - offsets[start])
+    return {
+        'content': data.decode('utf-8', errors='ignore'),
+        'offset': start,
+        'limit': limit,
+        'returned_lines': end - start,
+        'total_lines': total_lines,
+        'has_more': end < total_lines,
+    }
+
+
+def parse_range_header(header: str, size: int) -> Tuple[int, int]:
+    """Inclusive (start, end) for a single `bytes=` range; multi-range requests are not supported."""
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        raise RangeNotSatisfiable(header)
+    first, _, last = spec.strip().partition('-')
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable(header)
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        raise RangeNotSatisfiable(header)
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    end = min(end, start + FILE_CONTENT_LIMITS['max_range_bytes'] - 1)
+    return start, end
+
+
+def read_byte_range(path: str, start: int, end: int) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start + 1)
+
+
+def build_preview(path: str, size: int, count_tokens: Callable[[str], int]) -> Dict:
+    """
+    Head and tail of an oversized file, cut at line boundaries, plus an
+    estimate of the whole file's tokens extrapolated from the head.
+    """
+    head_bytes = FILE_CONTENT_LIMITS['preview_head_bytes']
+    tail_bytes = FILE_CONTENT_LIMITS['preview_tail_bytes']
+    with open(path, 'rb') as f:
+        head = f.read(head_bytes)
+        f.seek(max(size - tail_bytes, len(head)))
+        tail = f.read()
+    if b'\n' in head:
+        head = head[:head.rindex(b'\n') + 1]
+    if b'\n' in tail:
+        tail = tail[tail.index(b'\n') + 1:]
+    head_text = head.decode('utf-8', errors='ignore')
+    tail_text = tail.decode('utf-8', errors='ignore')
+    omitted = size - len(head) - len(tail)
+    marker = f"\n... [{omitted} bytes omitted; request offset/limit or a byte Range for the rest] ...\n"
+    content = head_text + marker + tail_text
+    head_tokens = count_tokens(head_text)
+    estimate = int(head_tokens * size / len(head)) if head else 0
+    return {
+        'content': content,
+        'token_count': count_tokens(content),
+        'estimated_token_count': estimate,
+        'is_truncated': True,
+        'size': size,
+    }
+
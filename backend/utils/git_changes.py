@@ -0,0 +1,140 @@
+import os
+import time
+import subprocess
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
+from utils.git_operations import resolve_git_dir, resolve_head
+from utils.metrics import record_cache
+
+# Working-tree status is re-read at most this often for an unchanged index/HEAD
+STATUS_TTL_SECONDS = 5.0
+CHURN_COMMITS = 30
+
+# repo_path -> (HEAD, churn); repo_path -> (signature, checked_at, status)
+_churn_cache: Dict[str, tuple] = {}
+_status_cache: Dict[str, tuple] = {}
+
+
+def _git(repo_path: str, *args: str) -> Optional[str]:
+    try:
+        result = subprocess.run(["git", *args], cwd=repo_path, capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def head_commit(repo_path: str) -> Optional[str]:
+    # Reading .git directly avoids a subprocess per call; the CLI covers layouts the reader skips
+    head = resolve_head(repo_path)
+    if head is not None:
+        return head[1]
+    output = _git(repo_path, "rev-parse", "HEAD")
+    return output.strip() if output else None
+
+
+def parse_porcelain_status(output: str) -> Dict[str, List[str]]:
+    """Split `git status --porcelain -z` output into staged, unstaged and untracked paths."""
+    status = {"staged": [], "unstaged": [], "untracked": []}
+    entries = output.split('\0')
+    i = 0
+    while i < len(entries):
+        entry = entries[i]
+        i += 1
+        if len(entry) < 4:
+            continue
+        code, path = entry[:2], entry[3:]
+        if code == '??':
+            status["untracked"].append(path)
+            continue
+        if code[0] in 'RC':
+            i += 1  # the original path of a rename/copy follows as its own entry
+        if code[0] not in ' ?':
+            status["staged"].append(path)
+        if code[1] not in ' ?':
+            status["unstaged"].append(path)
+    return status
+
+
+def get_working_tree_status(repo_path: str, git_dir: str) -> Dict[str, List[str]]:
+    signature = (_mtime(os.path.join(git_dir, 'index')), _mtime(os.path.join(git_dir, 'HEAD')))
+    cached = _status_cache.get(repo_path)
+    hit = bool(cached and cached[0] == signature and time.monotonic() - cached[1] < STATUS_TTL_SECONDS)
+    record_cache('git_status', hit)
+    if hit:
+        return cached[2]
+    # "all" lists the files inside new directories instead of just "newdir/"
+    output = _git(repo_path, "status", "--porcelain", "-z", "--untracked-files=all")
+    status = parse_porcelain_status(output) if output is not None else {"staged": [], "unstaged": [], "untracked": []}
+    _status_cache[repo_path] = (signature, time.monotonic(), status)
+    return status
+
+
+def get_commit_churn(repo_path: str, head: str, commits: int = CHURN_COMMITS) -> Dict[str, int]:
+    """How often each file was touched in the last `commits` commits, cached per HEAD."""
+    cached = _churn_cache.get(repo_path)
+    record_cache('git_churn', bool(cached and cached[0] == head))
+    if cached and cached[0] == head:
+        return cached[1]
+    output = _git(repo_path, "log", f"-n{commits}", "--name-only", "--format=", "--no-renames")
+    churn = dict(Counter(line for line in (output or '').splitlines() if line))
+    _churn_cache[repo_path] = (head, churn)
+    return churn
+
+
+def get_change_feed(repo_path: str) -> Optional[Dict]:
+    """
+    Files that changed recently in a checkout: staged, unstaged and untracked
+    paths plus file churn over the last commits. Returns None when the
+    directory is not a git repository.
+    """
+    git_dir = resolve_git_dir(repo_path)
+    if git_dir is None:
+        return None
+    head = head_commit(repo_path)
+    status = get_working_tree_status(repo_path, git_dir)
+    churn = get_commit_churn(repo_path, head) if head else {}
+    return {"head": head, **status, "churn": churn}
+
+
+def relevance_boosts(feed: Optional[Dict]) -> Dict[str, float]:
+    """
+    A 0..1 relevance score per path: files being edited right now score
+    highest, then new files, then files with recent commit churn.
+    """
+    if not feed:
+        return {}
+    boosts: Dict[str, float] = {}
+    churn = feed.get("churn", {})
+    if churn:
+        most = max(churn.values())
+        for path, count in churn.items():
+            boosts[path] = 0.5 * count / most
+    for path in feed.get("untracked", []):
+        boosts[path] = max(boosts.get(path, 0.0), 0.8)
+    for path in feed.get("staged", []) + feed.get("unstaged", []):
+        boosts[path] = 1.0
+    return boosts
+
+
+def files_changed_since(repo_path: str, commit: str) -> Optional[Set[str]]:
+    """
+    Paths that differ between `commit` and the current working tree, including
+    untracked files. None if `commit` is unknown (e.g. after a history rewrite),
+    in which case callers should rebuild whatever they cached in full.
+    """
+    output = _git(repo_path, "diff", "--name-only", "-z", "--no-renames", commit)
+    if output is None:
+        return None
+    changed = {path for path in output.split('\0') if path}
+    git_dir = resolve_git_dir(repo_path)
+    if git_dir:
+        changed.update(get_working_tree_status(repo_path, git_dir)["untracked"])
+    return changed
@@ -1,8 +1,10 @@
 import subprocess
 import os
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 import re
 
+from utils.metrics import record_cache
+
 def validate_repository_name(repo_name: str) -> bool:
     """
     Simple validation for repository names in a local development environment.
@@ -19,9 +21,138 @@ def validate_repository_name(repo_name: str) -> bool:
     pattern = r'^[a-zA-Z0-9._-]+$'
     return bool(re.match(pattern, repo_name)) and len(repo_name) <= 100
 
+# Short hashes match git's default abbreviation length
+SHORT_HASH_LENGTH = 7
+
+# repo_path -> (signature of the files the answer was read from, git info, full commit hash)
+_git_info_cache: Dict[str, Tuple[tuple, Dict[str, Optional[str]], Optional[str]]] = {}
+
+
+def resolve_git_dir(repo_path: str) -> Optional[str]:
+    """
+    Locate the git directory of a checkout. `.git` is usually a directory, but
+    linked worktrees and submodules use a `.git` file holding "gitdir: <path>".
+    """
+    dot_git = os.path.join(repo_path, '.git')
+    if os.path.isdir(dot_git):
+        return dot_git
+    if os.path.isfile(dot_git):
+        with open(dot_git, 'r') as f:
+            content = f.read().strip()
+        if content.startswith('gitdir:'):
+            git_dir = content[len('gitdir:'):].strip()
+            return os.path.normpath(os.path.join(repo_path, git_dir))
+    return None
+
+
+def _common_dir(git_dir: str) -> str:
+    """Worktrees keep HEAD locally but share refs with the main repository."""
+    commondir_file = os.path.join(git_dir, 'commondir')
+    if os.path.isfile(commondir_file):
+        with open(commondir_file, 'r') as f:
+            return os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    return git_dir
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _read_packed_ref(common_dir: str, ref: str) -> Optional[str]:
+    try:
+        with open(os.path.join(common_dir, 'packed-refs'), 'r') as f:
+            for line in f:
+                if line.startswith(('#', '^')):
+                    continue
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def _signature(git_dir: str, common_dir: str, ref: Optional[str]) -> tuple:
+    paths = [os.path.join(git_dir, 'HEAD'), os.path.join(common_dir, 'packed-refs')]
+    if ref:
+        paths.append(os.path.join(common_dir, ref))
+    return tuple((path, _mtime(path)) for path in paths)
+
+
+def read_git_head(repo_path: str) -> Optional[Dict[str, Optional[str]]]:
+    """
+    Resolve branch and commit by reading HEAD, loose refs and packed-refs
+    directly. Results are cached until one of those files changes. Returns
+    None for layouts this reader does not handle (reftable, symbolic refs
+    outside refs/heads, unreadable files) so the caller can fall back to
+    the git CLI.
+    """
+    head = resolve_head(repo_path)
+    return dict(head[0]) if head is not None else None
+
+
+def resolve_head(repo_path: str) -> Optional[Tuple[Dict[str, Optional[str]], Optional[str]]]:
+    """(git info, full commit hash or None on an unborn branch), or None as for read_git_head."""
+    git_dir = resolve_git_dir(repo_path)
+    if git_dir is None:
+        return None
+    common_dir = _common_dir(git_dir)
+    if os.path.exists(os.path.join(common_dir, 'reftable')):
+        return None
+
+    cached = _git_info_cache.get(repo_path)
+    if cached is not None:
+        signature, info, commit = cached
+        if all(_mtime(path) == mtime for path, mtime in signature):
+            record_cache('git_info', True)
+            return info, commit
+    record_cache('git_info', False)
+
+    try:
+        with open(os.path.join(git_dir, 'HEAD'), 'r') as f:
+            head = f.read().strip()
+    except OSError:
+        return None
+
+    ref = None
+    if head.startswith('ref:'):
+        ref = head[len('ref:'):].strip()
+        if not ref.startswith('refs/heads/'):
+            return None
+        branch = ref[len('refs/heads/'):]
+        try:
+            with open(os.path.join(common_dir, ref), 'r') as f:
+                commit = f.read().strip()
+        except FileNotFoundError:
+            commit = _read_packed_ref(common_dir, ref)
+        except OSError:
+            return None
+        if commit is not None and not re.fullmatch(r'[0-9a-f]{40,64}', commit):
+            return None
+    elif re.fullmatch(r'[0-9a-f]{40,64}', head):
+        branch, commit = "(detached HEAD)", head
+    else:
+        return None
+
+    info = {
+        "branch": branch,
+        # None for an unborn branch (no commits yet)
+        "commit_hash": commit[:SHORT_HASH_LENGTH] if commit else None,
+        "error": None
+    }
+    _git_info_cache[repo_path] = (_signature(git_dir, common_dir, ref), info, commit)
+    return info, commit
+
+
 def get_git_info(repo_path: str) -> Dict[str, Optional[str]]:
     """
     Get git information for a repository.
+
+    Reads the git directory directly (see read_git_head) and only spawns
+    git processes for layouts the direct reader does not understand.
     
     Args:
         repo_path: Path to the repository directory
@@ -49,7 +180,19 @@ def get_git_info(repo_path: str) -> Dict[str, Optional[str]]:
                 "commit_hash": None,
                 "error": "Not a git repository"
             }
-        
+
+        info = read_git_head(repo_path)
+        if info is not None:
+            return info
+    except Exception:
+        pass
+
+    return _get_git_info_subprocess(repo_path)
+
+
+def _get_git_info_subprocess(repo_path: str) -> Dict[str, Optional[str]]:
+    """Fallback that asks the git CLI; costs up to two process spawns."""
+    try:
         # Get current branch name
         branch_result = subprocess.run(
             ["git", "rev-parse", "--abbrev-ref", "HEAD"],
@@ -85,6 +228,8 @@ def get_git_info(repo_path: str) -> Dict[str, Optional[str]]:
             }
         
         branch = branch_result.stdout.strip()
+        if branch == "HEAD":
+            branch = "(detached HEAD)"
         
         # Get current commit hash (short version)
         commit_result = subprocess.run(
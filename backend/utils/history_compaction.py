@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.prompt_packer import FILE_BLOCK_PATTERN
+
+SUMMARY_PREFIX = "Summary of the earlier conversation (older turns were compacted):\n"
+
+Summarizer = Callable[[str, List[dict]], Awaitable[str]]
+
+
+def _hash_turns(turns: List[dict]) -> str:
+    digest = hashlib.sha256()
+    for turn in turns:
+        digest.update(turn.get('role', '').encode('utf-8'))
+        digest.update(b'\0')
+        digest.update((turn.get('content') or '').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def deduplicate_file_blocks(messages: List[dict]) -> Tuple[List[dict], List[str]]:
+    """
+    Replace repeated copies of an identical <file> block with a short reference.
+    The first copy is kept so later turns can still point back to it.
+    """
+    seen = set()
+    deduplicated = []
+
+    def replace(match):
+        path, body = match.group(1), match.group(2)
+        key = (path, hashlib.sha256(body.encode('utf-8')).hexdigest())
+        if key in seen:
+            deduplicated.append(path)
+            return f'<file path="{path}">\n[unchanged; identical to the copy sent earlier in this conversation]\n</file>'
+        seen.add(key)
+        return match.group(0)
+
+    result = []
+    for msg in messages:
+        content = msg.get('content') or ''
+        if '<file path="' in content:
+            msg = {**msg, 'content': FILE_BLOCK_PATTERN.sub(replace, content)}
+        result.append(msg)
+    return result, deduplicated
+
+
+def extractive_summary(previous_summary: str, turns: List[dict], max_chars: int = 400) -> str:
+    """Offline fallback: keep the first lines of every compacted turn."""
+    lines = [previous_summary] if previous_summary else []
+    for turn in turns:
+        text = ' '.join((turn.get('content') or '').split())
+        lines.append(f"- {turn.get('role', 'user')}: {text[:max_chars]}")
+    return '\n'.join(lines)
+
+
+class CompactionStore:
+    """Rolling summaries per chat session, kept as small JSON files on disk."""
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.base_dir, f"{os.path.basename(session_id)}.json")
+
+    def load(self, session_id: str) -> Optional[dict]:
+        try:
+            with open(self._path(session_id), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save(self, session_id: str, state: dict) -> None:
+        os.makedirs(self.base_dir, exist_ok=True)
+        path = self._path(session_id)
+        # Unique per process and thread, so concurrent saves never share a temp file
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, path)
+
+
+async def compact_history(messages: List[dict], session_id: str, store: CompactionStore,
+                          count_tokens: Callable[[str], int], summarize: Summarizer,
+                          budget_tokens: int, keep_recent_turns: int = 4,
+                          retry_backoff_seconds: float = 30.0) -> Tuple[List[dict], Dict]:
+    """
+    Keep the conversation history sent to the model within `budget_tokens`.
+
+    Leading system messages and the latest message are never touched. When the
+    turns in between exceed the budget, the oldest ones are folded into a
+    rolling summary that is cached per session, and the fold goes down to half
+    the budget so the following turns can reuse the cached summary as-is.
+    If `summarize` fails, the turns are folded with extractive_summary instead
+    and the state remembers it. A later request summarizes them again once
+    `retry_backoff_seconds` (doubled per failure) have passed; until then
+    further folds stay extractive.
+    Repeated file blocks are collapsed to references. The session file on disk
+    keeps the original turns; only the request sent to the provider changes.
+    """
+    report = {'compacted_turns': 0, 'summary_tokens': 0, 'summary_fallback': False, 'deduplicated_files': [],
+              'history_tokens_before': 0, 'history_tokens_after': 0}
+
+    head = 0
+    while head < len(messages) and messages[head].get('role') == 'system':
+        head += 1
+    if len(messages) - head < 2:
+        return messages, report
+    system_messages, history, latest = messages[:head], messages[head:-1], messages[-1]
+
+    deduplicated, report['deduplicated_files'] = deduplicate_file_blocks(history + [latest])
+    history, latest = deduplicated[:-1], deduplicated[-1]
+
+    turn_tokens = [count_tokens(turn.get('content') or '') for turn in history]
+    total = sum(turn_tokens)
+    report['history_tokens_before'] = report['history_tokens_after'] = total
+    if total <= budget_tokens:
+        return system_messages + history + [latest], report
+
+    foldable = max(0, len(history) - keep_recent_turns)
+    state = store.load(session_id)
+    covered, summary, fallback = 0, '', None
+    if state and state.get('covered', 0) <= foldable and state.get('prefix_hash') == _hash_turns(history[:state['covered']]):
+        covered, summary, fallback = state['covered'], state.get('summary', ''), state.get('fallback')
+
+    summary_tokens = count_tokens(summary) if summary else 0
+    if fallback or not summary or summary_tokens + sum(turn_tokens[covered:]) > budget_tokens:
+        target = covered
+        remaining = sum(turn_tokens[target:])
+        while target < foldable and remaining > budget_tokens // 2:
+            remaining -= turn_tokens[target]
+            target += 1
+        if fallback and time.time() < fallback.get('retry_at', 0):
+            # Backing off after a failed summary: further turns are folded extractively
+            if target > covered:
+                summary = extractive_summary(summary, history[covered:target])
+        else:
+            # An extractive fallback is redone from the last summary the model wrote
+            start, previous = (fallback['covered'], fallback['summary']) if fallback else (covered, summary)
+            if target > start:
+                try:
+                    summary, fallback = await summarize(previous, history[start:target]), None
+                except Exception:
+                    summary = extractive_summary(previous, history[start:target])
+                    failures = (fallback or {}).get('failures', 0) + 1
+                    fallback = {'covered': start, 'summary': previous, 'failures': failures,
+                                'retry_at': time.time() + retry_backoff_seconds * 2 ** min(failures - 1, 5)}
+        if target > covered or (state or {}).get('fallback') != fallback:
+            covered = target
+            summary_tokens = count_tokens(summary)
+            store.save(session_id, {'covered': covered, 'prefix_hash': _hash_turns(history[:covered]),
+                                    'summary': summary, 'fallback': fallback})
+
+    if not covered:
+        return system_messages + history + [latest], report
+
+    summary_message = {'role': 'system', 'content': f"{SUMMARY_PREFIX}{summary}"}
+    report['compacted_turns'] = covered
+    report['summary_tokens'] = summary_tokens
+    report['summary_fallback'] = fallback is not None
+    report['history_tokens_after'] = summary_tokens + sum(turn_tokens[covered:])
+    return system_messages + [summary_message] + history[covered:] + [latest], report
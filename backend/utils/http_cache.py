@@ -0,0 +1,95 @@
+import hashlib
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+from utils.metrics import record_cache
+from utils.shared_state import SharedCache
+
+# Clients may keep the response but must revalidate it before every use
+CACHE_CONTROL = 'no-cache'
+
+
+def make_etag(*parts) -> str:
+    """Weak validator over the given version parts; equal parts give equal tags."""
+    digest = hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def validator_headers(etag: str, last_modified: Optional[float]) -> Dict[str, str]:
+    headers = {'ETag': etag, 'Cache-Control': CACHE_CONTROL}
+    if last_modified is not None:
+        headers['Last-Modified'] = formatdate(last_modified, usegmt=True)
+    return headers
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == '*':
+        return True
+    # Weak comparison: W/"x" and "x" name the same representation
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith('W/') else candidate) == opaque:
+            return True
+    return False
+
+
+def _not_modified_since(header: str, last_modified: Optional[float]) -> bool:
+    if last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have one-second resolution
+    return int(last_modified) <= since
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[float] = None) -> Optional[Response]:
+    """
+    A 304 response when the request's validators still match, else None.
+    If-None-Match wins over If-Modified-Since when both are sent.
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        fresh = _etag_matches(if_none_match, etag)
+    else:
+        if_modified_since = request.headers.get('if-modified-since')
+        fresh = if_modified_since is not None and _not_modified_since(if_modified_since, last_modified)
+    if not fresh:
+        return None
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+class ResponseCache:
+    """
+    The last serialized body sent for each key together with its ETag, so a
+    request whose version still matches is answered without rebuilding it.
+    With a `shared` cache, bodies built by one worker serve the others.
+    """
+
+    def __init__(self, name: str, shared: Optional[SharedCache] = None):
+        self.name = name
+        self.shared = shared
+        self._entries: Dict[str, Tuple[str, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, etag: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        body = entry[1] if entry is not None and entry[0] == etag else None
+        if body is None and self.shared is not None:
+            body = self.shared.get(self.name, key, version=etag)
+            if body is not None:
+                with self._lock:
+                    self._entries[key] = (etag, body)
+        record_cache(self.name, body is not None)
+        return body
+
+    def put(self, key: str, etag: str, body: bytes) -> None:
+        with self._lock:
+            self._entries[key] = (etag, body)
+        if self.shared is not None:
+            self.shared.put(self.name, key, body, version=etag)
@@ -0,0 +1,202 @@
+import os
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils.app_config import backend_setting
+from utils.git_operations import resolve_git_dir
+
+IGNORE_SETTINGS = backend_setting('ignore', {
+    'use_gitignore': True,
+    'extra_patterns': [],
+})
+
+# Never worth walking, whatever the repository's .gitignore says
+DEFAULT_PATTERNS = [
+    '.git',
+    'node_modules/', 'venv/', '.venv/', '__pycache__/',
+    '.next/', '.turbo/', '.vercel/', '.tox/',
+    '.mypy_cache/', '.pytest_cache/', '.ruff_cache/',
+    'certs/', 'logs/',
+]
+
+# The context map only describes source files, so it also skips build output,
+# dotfiles (but not dot-directories), lockfiles and binary/media assets
+CONTEXT_MAP_PATTERNS = ['.*', '!.*/'] + DEFAULT_PATTERNS + [
+    'out/', 'build/', 'dist/', 'coverage/', '/public/static/',
+    '*.map', '*.min.js', '*.min.css',
+    '*.jpg', '*.jpeg', '*.png', '*.gif', '*.ico', '*.svg', '*.webp',
+    '*.mp3', '*.mp4', '*.wav', '*.ogg', '*.webm',
+    '*.pdf', '*.doc', '*.docx', '*.xls', '*.xlsx',
+    '*.ttf', '*.woff', '*.woff2', '*.eot',
+    '*.cache', '*.log', '*.tmp', '*.lock',
+    'package-lock.json', 'tsconfig.tsbuildinfo',
+]
+
+
+def _translate_glob(pattern: str) -> str:
+    """Regex for one gitignore glob, matched against a '/'-separated relative path."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+        elif c == '*':
+            out.append('[^/]*')
+            i += 1
+        elif c == '?':
+            out.append('[^/]')
+            i += 1
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+                continue
+            body = pattern[i + 1:end]
+            if body[0] in '!^':
+                body = '^' + body[1:]
+            out.append(f"[{body.replace(chr(92), chr(92) * 2)}]")
+            i = end + 1
+        elif c == '\\' and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return ''.join(out)
+
+
+def compile_pattern(line: str) -> Optional[Tuple[str, bool, bool]]:
+    """(regex, negated, dir_only) for one .gitignore line, or None for blanks and comments."""
+    line = line.rstrip('\n')
+    if not line.endswith('\\ '):
+        line = line.rstrip(' ')
+    if not line or line.startswith('#'):
+        return None
+    negated = line.startswith('!')
+    if negated or line.startswith('\\!') or line.startswith('\\#'):
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+    # Patterns with a slash are anchored to the .gitignore's directory;
+    # the others match a name at any depth
+    if '/' not in line:
+        line = '**/' + line
+    line = line.lstrip('/')
+    return f"(?:{_translate_glob(line)})", negated, dir_only
+
+
+class RuleSet:
+    """The compiled rules of one ignore source, relative to the directory it lives in."""
+
+    def __init__(self, base: str, lines: List[str]):
+        self.base = base
+        self.rules = []
+        for line in lines:
+            compiled = compile_pattern(line)
+            if compiled:
+                regex, negated, dir_only = compiled
+                self.rules.append((re.compile(regex + r'\Z'), negated, dir_only))
+        # One alternation per kind answers "does anything match?" in a single pass
+        self._any_dir = self._combine(self.rules)
+        self._any_file = self._combine([r for r in self.rules if not r[2]])
+
+    @staticmethod
+    def _combine(rules):
+        if not rules:
+            return None
+        return re.compile('|'.join(f"(?:{r[0].pattern})" for r in rules))
+
+    def match(self, relpath: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if re-included by a negation, None if no rule applies."""
+        combined = self._any_dir if is_dir else self._any_file
+        if combined is None or not combined.match(relpath):
+            return None
+        for regex, negated, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(relpath):
+                return not negated
+        return None
+
+
+class IgnoreMatcher:
+    """
+    Gitignore-style filtering for one repository checkout.
+
+    `patterns` apply everywhere; on top of them come .git/info/exclude, the
+    root .gitignore and the .gitignore of every directory on the way down,
+    later and deeper rules winning as in git. Nested .gitignore files are
+    read lazily, once per matcher. `walk` prunes ignored directories instead
+    of filtering their contents afterwards.
+    """
+
+    def __init__(self, root: str, patterns: Optional[List[str]] = None, use_gitignore: Optional[bool] = None):
+        self.root = root
+        if use_gitignore is None:
+            use_gitignore = IGNORE_SETTINGS['use_gitignore']
+        self.use_gitignore = use_gitignore
+        base = list(DEFAULT_PATTERNS if patterns is None else patterns) + list(IGNORE_SETTINGS['extra_patterns'])
+        self._global = [RuleSet('', base)]
+        if use_gitignore:
+            git_dir = resolve_git_dir(root)
+            if git_dir:
+                exclude = self._read_lines(os.path.join(git_dir, 'info', 'exclude'))
+                if exclude:
+                    self._global.append(RuleSet('', exclude))
+        self._per_dir: Dict[str, Optional[RuleSet]] = {}
+
+    @staticmethod
+    def _read_lines(path: str) -> List[str]:
+        try:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                return f.read().splitlines()
+        except OSError:
+            return []
+
+    def _dir_rules(self, reldir: str) -> Optional[RuleSet]:
+        if reldir not in self._per_dir:
+            lines = self._read_lines(os.path.join(self.root, reldir, '.gitignore')) if self.use_gitignore else []
+            self._per_dir[reldir] = RuleSet(reldir, lines) if lines else None
+        return self._per_dir[reldir]
+
+    def match_entry(self, relpath: str, is_dir: bool) -> bool:
+        """Verdict for one path whose parent directories are known not to be ignored."""
+        ignored = None
+        for rules in self._global:
+            verdict = rules.match(relpath, is_dir)
+            if verdict is not None:
+                ignored = verdict
+        parts = relpath.split('/')
+        for depth in range(len(parts)):
+            reldir = '/'.join(parts[:depth])
+            rules = self._dir_rules(reldir)
+            if rules is None:
+                continue
+            verdict = rules.match('/'.join(parts[depth:]), is_dir)
+            if verdict is not None:
+                ignored = verdict
+        return bool(ignored)
+
+    def is_ignored(self, relpath: str, is_dir: bool = False) -> bool:
+        """Whether `relpath` (relative to the root) or any directory above it is ignored."""
+        parts = relpath.replace(os.sep, '/').strip('/').split('/')
+        for depth in range(1, len(parts)):
+            if self.match_entry('/'.join(parts[:depth]), True):
+                return True
+        return self.match_entry('/'.join(parts), is_dir)
+
+    def walk(self) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """Like os.walk over the root, but yields relative dirs and never enters ignored ones."""
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            reldir = os.path.relpath(dirpath, self.root).replace(os.sep, '/')
+            prefix = '' if reldir == '.' else reldir + '/'
+            dirnames[:] = [d for d in dirnames if not self.match_entry(prefix + d, True)]
+            yield prefix.rstrip('/'), dirnames, [f for f in filenames if not self.match_entry(prefix + f, False)]
@@ -0,0 +1,241 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional, Set
+
+import anyio
+
+try:
+    from watchdog.observers import Observer
+except ImportError:  # polling only
+    Observer = None
+
+from utils.app_config import backend_setting
+from utils.metrics import get_logger
+
+LIVE_UPDATES = backend_setting('live_updates', {
+    # Without filesystem notifications (watchdog), a watched repository is
+    # stat-ed this often right after a change...
+    'poll_interval_seconds': 1.0,
+    # ...backing off to this while nothing changes. With notifications it is
+    # only a safety net for missed events.
+    'idle_poll_interval_seconds': 30.0,
+    # A change is sent once nothing else changed for this long...
+    'debounce_seconds': 0.5,
+    # ...or once it has been pending this long during continuous edits
+    'max_delay_seconds': 3.0,
+    # Messages a slow client may fall behind by before it is told to resync
+    'queue_size': 32,
+})
+
+logger = get_logger('live_updates')
+
+
+def _parent(path: str) -> str:
+    if path == '.':
+        return ''
+    return path.rpartition('/')[0] or '.'
+
+
+# Sent for every changed node; exact counts replacing estimates clear the estimate flag and margin
+COUNT_FIELDS = ('token_count', 'item_count', 'token_count_estimated', 'token_count_margin')
+
+
+def _counts(node: Dict) -> tuple:
+    return (node['token_count'], node['item_count'], node.get('token_count_estimated', False),
+            node.get('token_count_margin', 0))
+
+
+def _index(tree: Dict) -> Dict[str, Dict]:
+    nodes, stack = {}, [tree]
+    while stack:
+        node = stack.pop()
+        nodes[node['path']] = node
+        stack.extend(node.get('children', ()))
+    return nodes
+
+
+def diff_trees(old: Dict, new: Dict) -> Dict[str, list]:
+    """
+    What changed between two get_tree_structure trees, by node path:
+    counts (COUNT_FIELDS) of nodes in both, added subtrees with the path of
+    their parent, and removed paths. Only the top of an added or removed
+    subtree is listed.
+    """
+    old_nodes, new_nodes = _index(old), _index(new)
+    changed = [dict(zip(('path',) + COUNT_FIELDS, (path,) + _counts(node)))
+               for path, node in new_nodes.items()
+               if path in old_nodes and _counts(old_nodes[path]) != _counts(node)]
+    added = [{'parent': _parent(path), 'node': node} for path, node in new_nodes.items()
+             if path not in old_nodes and _parent(path) in old_nodes]
+    removed = [path for path in old_nodes if path not in new_nodes and _parent(path) in new_nodes]
+    return {'changed': changed, 'added': added, 'removed': removed}
+
+
+class _Wakeup:
+    """
+    watchdog event handler that wakes the channel's watch loop. Opens and
+    reads are ignored, or the watch's own scans would keep waking it.
+    """
+
+    CHANGES = {'created', 'deleted', 'modified', 'moved', 'closed'}
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, event: asyncio.Event):
+        self._loop = loop
+        self._event = event
+
+    def dispatch(self, event) -> None:
+        if event.event_type in self.CHANGES:
+            self._loop.call_soon_threadsafe(self._event.set)
+
+
+class RepositoryChannel:
+    """
+    Watches one repository while it has subscribers. Filesystem events (or,
+    without watchdog, a poll that backs off while the repository is idle)
+    trigger a comparison of a cheap version (stat signature) and the git
+    HEAD; a change is debounced, then the tree is rebuilt once and only its
+    diff is sent.
+    """
+
+    def __init__(self, repository: str, path: str, version: Callable[[str], object],
+                 load_tree: Callable[[str], Dict], git_info: Callable[[str], Dict]):
+        self.repository = repository
+        self.path = path
+        self._version = version
+        self._load_tree = load_tree
+        self._git_info = git_info
+        self.subscribers: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._git: Optional[Dict] = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=LIVE_UPDATES['queue_size'])
+        self.subscribers.add(queue)
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+        elif self._git is not None:
+            # The watch is already running; the newcomer only misses the ready message
+            queue.put_nowait({'type': 'ready', 'git': self._git})
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.subscribers.discard(queue)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _publish(self, message: Optional[Dict]) -> None:
+        """Queue `message` for every subscriber; None tells their sockets to close."""
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Diffs only apply in order; a client that fell behind reloads instead
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({'type': 'resync'} if message is not None else None)
+
+    async def _settled_version(self, version):
+        """The version once it stops changing for the debounce window, or at the max delay."""
+        deadline = time.monotonic() + LIVE_UPDATES['max_delay_seconds']
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LIVE_UPDATES['debounce_seconds'])
+            latest = await anyio.to_thread.run_sync(self._version, self.repository)
+            if latest == version:
+                break
+            version = latest
+        return version
+
+    async def _start_observer(self, changed: asyncio.Event):
+        """A watchdog observer that sets `changed` on any event under the repository, or None."""
+        if Observer is None:
+            return None
+        observer = Observer()
+        try:
+            observer.schedule(_Wakeup(asyncio.get_running_loop(), changed), self.path, recursive=True)
+            # Setting up recursive watches walks the tree
+            await anyio.to_thread.run_sync(observer.start)
+        except Exception as e:
+            # e.g. the inotify watch limit; polling still works
+            logger.warning("filesystem notifications unavailable, polling instead",
+                           extra={"repository": self.repository, "error": str(e)})
+            return None
+        return observer
+
+    async def _watch(self) -> None:
+        changed = asyncio.Event()
+        observer = None
+        try:
+            observer = await self._start_observer(changed)
+            version = await anyio.to_thread.run_sync(self._version, self.repository)
+            tree = await anyio.to_thread.run_sync(self._load_tree, self.repository)
+            self._git = await anyio.to_thread.run_sync(self._git_info, self.repository)
+            self._publish({'type': 'ready', 'git': self._git})
+            idle_interval = LIVE_UPDATES['idle_poll_interval_seconds']
+            interval = idle_interval if observer else LIVE_UPDATES['poll_interval_seconds']
+            while True:
+                try:
+                    await asyncio.wait_for(changed.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+                changed.clear()
+                latest = await anyio.to_thread.run_sync(self._version, self.repository)
+                git = await anyio.to_thread.run_sync(self._git_info, self.repository)
+                if latest == version and git == self._git:
+                    if observer is None:
+                        interval = min(interval * 2, idle_interval)
+                    continue
+                if observer is None:
+                    interval = LIVE_UPDATES['poll_interval_seconds']
+                message = {'type': 'diff'}
+                if latest != version:
+                    version = await self._settled_version(latest)
+                    new_tree = await anyio.to_thread.run_sync(self._load_tree, self.repository)
+                    message.update(diff_trees(tree, new_tree))
+                    tree = new_tree
+                    git = await anyio.to_thread.run_sync(self._git_info, self.repository)
+                if git != self._git:
+                    message['git'] = self._git = git
+                if any(message.get(key) for key in ('changed', 'added', 'removed', 'git')):
+                    self._publish(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("repository watch failed", extra={"repository": self.repository, "error": str(e)})
+            self._publish({'type': 'error', 'detail': str(e)})
+            # Closing makes clients reconnect, and the next subscriber starts a fresh watch
+            self._publish(None)
+            self._task = None
+        finally:
+            if observer is not None:
+                observer.stop()
+
+
+class LiveUpdates:
+    """Repository channels by name, created for the first subscriber and dropped with the last."""
+
+    def __init__(self, path: Callable[[str], str], version: Callable[[str], object],
+                 load_tree: Callable[[str], Dict], git_info: Callable[[str], Dict]):
+        self._path = path
+        self._version = version
+        self._load_tree = load_tree
+        self._git_info = git_info
+        self._channels: Dict[str, RepositoryChannel] = {}
+
+    def subscribers(self) -> Dict[str, int]:
+        return {repository: len(channel.subscribers) for repository, channel in self._channels.items()}
+
+    @asynccontextmanager
+    async def subscribe(self, repository: str):
+        channel = self._channels.get(repository)
+        if channel is None:
+            channel = self._channels[repository] = RepositoryChannel(
+                repository, self._path(repository), self._version, self._load_tree, self._git_info)
+        queue = channel.subscribe()
+        try:
+            yield queue
+        finally:
+            channel.unsubscribe(queue)
+            if not channel.subscribers:
+                self._channels.pop(repository, None)
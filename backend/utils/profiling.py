@@ -0,0 +1,123 @@
+import os
+import re
+import sys
+import json
+import time
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+from utils.app_config import backend_setting
+
+PROFILING = backend_setting('profiling', {
+    # Requests are only profiled when this is on *and* they ask for it
+    'enabled': False,
+    'interval_ms': 2,
+    'keep': 50,
+})
+
+PROFILE_ID_PATTERN = re.compile(r'^[0-9A-Za-z_.-]+$')
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every other thread at a fixed interval while running.
+
+    Profiling a single request this way also catches the threadpool workers it
+    hands work to; stacks are prefixed with the thread name so a concurrent
+    request on another worker is easy to tell apart.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.samples
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)).replace(';', ':'))
+                self.samples[';'.join(reversed(stack))] += 1
+
+
+class ProfileStore:
+    """
+    Profiles as collapsed-stack files (`<id>.folded`, one "frame;frame;frame count"
+    line per distinct stack) that flamegraph.pl, inferno or speedscope read
+    directly, each with a small JSON sidecar describing the request.
+    """
+
+    def __init__(self, base_dir: str, keep: int):
+        self.base_dir = base_dir
+        self.keep = keep
+
+    def save(self, samples: Counter, meta: Dict) -> str:
+        os.makedirs(self.base_dir, exist_ok=True)
+        route = re.sub(r'[^0-9A-Za-z]+', '_', meta.get('route', '')).strip('_') or 'root'
+        request_id = re.sub(r'[^0-9A-Za-z_.-]+', '_', str(meta.get('request_id', '-')))[:64] or '-'
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{route}-{request_id}"
+        with open(os.path.join(self.base_dir, f"{profile_id}.folded"), 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(self.base_dir, f"{profile_id}.json"), 'w') as f:
+            json.dump({**meta, 'id': profile_id, 'samples': sum(samples.values())}, f)
+        self._prune()
+        return profile_id
+
+    def _entries(self) -> List[str]:
+        try:
+            names = [n[:-len('.json')] for n in os.listdir(self.base_dir) if n.endswith('.json')]
+        except FileNotFoundError:
+            return []
+        return sorted(names, reverse=True)
+
+    def _prune(self) -> None:
+        for profile_id in self._entries()[self.keep:]:
+            for suffix in ('.json', '.folded'):
+                try:
+                    os.remove(os.path.join(self.base_dir, profile_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def list(self, limit: int) -> List[Dict]:
+        """Metadata of the most recent profiles, newest first."""
+        profiles = []
+        for profile_id in self._entries()[:limit]:
+            try:
+                with open(os.path.join(self.base_dir, f"{profile_id}.json")) as f:
+                    profiles.append(json.load(f))
+            except (OSError, json.JSONDecodeError):
+                continue
+        return profiles
+
+    def path(self, profile_id: str) -> Optional[str]:
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = os.path.join(self.base_dir, f"{profile_id}.folded")
+        return path if os.path.exists(path) else None
@@ -0,0 +1,242 @@
+import os
+import re
+import ast
+import time
+import hashlib
+import textwrap
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.app_config import backend_setting
+from utils.metrics import record_cache
+from utils.serialization import dumps, loads
+from utils.shared_state import SharedCache
+
+PROMPT_ASSEMBLY = backend_setting('prompt_assembly', {
+    # Decoded file contents kept by content hash, across all repositories
+    'cache_bytes': 64 * 1024 * 1024,
+    'handle_ttl_seconds': 3600,
+    'max_handles': 256,
+})
+
+FILES_PLACEHOLDER = '{{files}}'
+TREE_PLACEHOLDER = '{{tree}}'
+
+JS_EXTENSIONS = {'.js', '.jsx', '.ts', '.tsx', '.mjs', '.cjs'}
+JS_DEFINITION = r'^[ \t]*(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:function\s*\*?\s*{name}\b|class\s+{name}\b|(?:const|let|var)\s+{name}\s*=)'
+
+
+class AssemblyError(ValueError):
+    pass
+
+
+class FileBlockCache:
+    """
+    File contents keyed by their SHA-256, with the hash of each path
+    remembered until its mtime or size changes. Unchanged files are never
+    re-read, identical contents are stored once, and token counts are kept
+    per (hash, encoding, symbol) so a file is tokenized once per tokenizer.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._hashes: Dict[str, Tuple[tuple, str]] = {}
+        self._contents: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._tokens: Dict[Tuple[str, str, Optional[str]], int] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def read(self, path: str) -> Tuple[str, str]:
+        """(content hash, decoded content) of a UTF-8 file."""
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            known = self._hashes.get(path)
+            if known and known[0] == signature and known[1] in self._contents:
+                self._contents.move_to_end(known[1])
+                record_cache('prompt_file_blocks', True)
+                return known[1], self._contents[known[1]][0]
+        record_cache('prompt_file_blocks', False)
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        content = data.decode('utf-8')
+        with self._lock:
+            self._hashes[path] = (signature, digest)
+            if digest not in self._contents:
+                self._contents[digest] = (content, len(data))
+                self._size += len(data)
+                while self._size > self.max_bytes and len(self._contents) > 1:
+                    evicted, (_, size) = self._contents.popitem(last=False)
+                    self._size -= size
+                    for key in [k for k in self._tokens if k[0] == evicted]:
+                        del self._tokens[key]
+        return digest, content
+
+    def token_count(self, digest: str, encoding: str, text: str, count: Callable[[str], int],
+                    symbol: Optional[str] = None) -> int:
+        """Tokens of the file with this hash, or of one of its symbols; dropped when the file is evicted."""
+        key = (digest, encoding, symbol)
+        with self._lock:
+            cached = self._tokens.get(key)
+        if cached is None:
+            cached = count(text)
+            with self._lock:
+                # Not cached if the file was evicted while counting
+                if digest in self._contents:
+                    self._tokens[key] = cached
+        return cached
+
+
+class AssembledPrompts:
+    """
+    Assembled messages by handle. The handle is the hash of the messages, so
+    assembling the same prompt twice gives the same handle; entries expire
+    after `ttl` seconds and the oldest are dropped beyond `max_entries`.
+    With a `shared` cache a handle made by one worker resolves on any other.
+    """
+
+    NAMESPACE = 'assembled_prompts'
+
+    def __init__(self, ttl: float, max_entries: int, shared: Optional[SharedCache] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries: "OrderedDict[str, Tuple[float, List[dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _handle(messages: List[dict]) -> str:
+        digest = hashlib.sha256()
+        for message in messages:
+            digest.update(message['role'].encode('utf-8') + b'\0' + message['content'].encode('utf-8') + b'\0')
+        return f"asm_{digest.hexdigest()[:32]}"
+
+    def _remember(self, handle: str, messages: List[dict], ttl: float) -> None:
+        with self._lock:
+            self._entries[handle] = (time.monotonic() + ttl, messages)
+            self._entries.move_to_end(handle)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, messages: List[dict]) -> str:
+        handle = self._handle(messages)
+        self._remember(handle, messages, self.ttl)
+        if self.shared is not None:
+            self.shared.put(self.NAMESPACE, handle, dumps(messages), ttl=self.ttl)
+        return handle
+
+    def get(self, handle: str) -> Optional[List[dict]]:
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[handle]
+                entry = None
+        if entry is not None:
+            return entry[1]
+        if self.shared is not None:
+            value = self.shared.get(self.NAMESPACE, handle)
+            if value is not None:
+                messages = loads(value)
+                # The shared entry carries its own expiry; keep the local copy no longer than a full TTL
+                self._remember(handle, messages, self.ttl)
+                return messages
+        return None
+
+
+def _python_symbol(content: str, name: str) -> Optional[Tuple[int, int]]:
+    """1-based inclusive line span of a (dotted) class or function name, decorators included."""
+    try:
+        scope = ast.parse(content).body
+    except SyntaxError:
+        return None
+    node = None
+    for part in name.split('.'):
+        node = next((n for n in scope if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+                     and n.name == part), None)
+        if node is None:
+            return None
+        scope = node.body
+    start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+    return start, node.end_lineno
+
+
+def _javascript_symbol(content: str, name: str) -> Optional[Tuple[int, int]]:
+    """Line span of a top-level-looking JS/TS definition, found by matching its braces."""
+    match = re.search(JS_DEFINITION.format(name=re.escape(name)), content, re.MULTILINE)
+    if not match:
+        return None
+    depth, opened, end = 0, False, len(content)
+    for i in range(match.end(), len(content)):
+        char = content[i]
+        if char == '{':
+            depth, opened = depth + 1, True
+        elif char == '}':
+            depth -= 1
+            if opened and depth == 0:
+                end = i + 1
+                break
+        elif char == ';' and not opened:
+            end = i + 1
+            break
+    return content.count('\n', 0, match.start()) + 1, content.count('\n', 0, end) + 1
+
+
+def extract_symbol(path: str, content: str, name: str) -> Tuple[str, int, int]:
+    """(dedented source, first line, last line) of the definition of `name` in a Python or JS/TS file."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.py':
+        span = _python_symbol(content, name)
+    elif ext in JS_EXTENSIONS:
+        span = _javascript_symbol(content, name)
+    else:
+        raise AssemblyError(f"Symbol references are only supported in Python and JavaScript files: {path}")
+    if span is None:
+        raise AssemblyError(f"Symbol '{name}' not found in {path}")
+    lines = content.splitlines()
+    return textwrap.dedent('\n'.join(lines[span[0] - 1:span[1]])), span[0], span[1]
+
+
+def file_block(label: str, body: str) -> str:
+    return f'<file path="{label}">\n{body.strip()}\n</file>'
+
+
+def format_tree(node: Dict, depth: int = 0) -> str:
+    """Indented names, the same outline the composer adds as repository structure."""
+    lines = ['  ' * depth + node['name']]
+    for child in node.get('children', []):
+        lines.append(format_tree(child, depth + 1))
+    return '\n'.join(lines)
+
+
+def render_user_message(template: str, blocks: List[str], tree: Optional[str]) -> str:
+    """
+    `template` with {{files}} and {{tree}} replaced when it uses them;
+    otherwise the composer's layout: the text as <user_request>, then the
+    repository structure, then the file blocks.
+    """
+    files = '\n\n'.join(blocks)
+    if FILES_PLACEHOLDER in template or TREE_PLACEHOLDER in template:
+        tree_section = f"<repository_structure>\n{tree}\n</repository_structure>" if tree else ''
+        return template.replace(FILES_PLACEHOLDER, files).replace(TREE_PLACEHOLDER, tree_section)
+    sections = []
+    if template.strip():
+        sections.append(f"<user_request>\n{template.strip()}\n</user_request>")
+    if tree:
+        sections.append(f"<repository_structure>\n{tree}\n</repository_structure>")
+    sections.extend(blocks)
+    return '\n\n'.join(sections)
+
+
+def with_assembled(messages: List[dict], assembled: List[dict]) -> List[dict]:
+    """
+    Conversation `messages` followed by an assembled prompt. An assembled
+    system message replaces any system message already in the history.
+    """
+    if any(m['role'] == 'system' for m in assembled):
+        messages = [m for m in messages if m.get('role') != 'system']
+    system = [m for m in assembled if m['role'] == 'system']
+    rest = [m for m in assembled if m['role'] != 'system']
+    return system + list(messages) + rest
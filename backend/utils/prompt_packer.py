@@ -0,0 +1,149 @@
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Rough per-message framing cost (role markers, separators) added by chat APIs
+MESSAGE_OVERHEAD_TOKENS = 4
+
+FILE_BLOCK_PATTERN = re.compile(r'<file path="([^"]+)">\n(.*?)\n?</file>', re.DOTALL)
+OUTLINE_PATTERN = re.compile(
+    r'^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?'
+    r'(?:def|class|function|interface|type|struct|enum|impl|fn|func|const\s+\w+\s*=\s*(?:async\s*)?\()'
+)
+
+
+class ContextWindowExceeded(ValueError):
+    pass
+
+
+def parse_file_priorities(value) -> Optional[Dict[str, float]]:
+    """A request's `file_priorities`: file paths mapped to numbers, higher kept longer."""
+    if value is None:
+        return None
+    if not isinstance(value, dict) or not all(
+            isinstance(path, str) and isinstance(priority, (int, float)) and not isinstance(priority, bool)
+            for path, priority in value.items()):
+        raise ValueError("file_priorities must map file paths to numbers")
+    return {path: float(priority) for path, priority in value.items()}
+
+
+def summarize_file_block(path: str, content: str) -> str:
+    """Replace a file body with its definition lines (functions, classes, exports)."""
+    outline = [line.rstrip() for line in content.split('\n') if OUTLINE_PATTERN.match(line)]
+    body = '\n'.join(outline) if outline else '...'
+    return f'<file path="{path}">\n[summarized to fit the context window]\n{body}\n</file>'
+
+
+def omit_file_block(path: str) -> str:
+    return f'<file path="{path}">\n[omitted to fit the context window]\n</file>'
+
+
+def _split_segments(content: str) -> List[dict]:
+    """Split message content into plain text and <file> block segments."""
+    segments = []
+    position = 0
+    for match in FILE_BLOCK_PATTERN.finditer(content):
+        if match.start() > position:
+            segments.append({'text': content[position:match.start()], 'path': None})
+        segments.append({'text': match.group(0), 'path': match.group(1), 'body': match.group(2)})
+        position = match.end()
+    if position < len(content):
+        segments.append({'text': content[position:], 'path': None})
+    return segments
+
+
+def _fits_by_bytes(messages: List[dict], budget: int) -> bool:
+    # BPE tokenizers never emit more tokens than input bytes, so this is a safe
+    # upper bound that lets ordinary prompts skip tokenization entirely.
+    total = sum(len((msg.get('content') or '').encode('utf-8')) + MESSAGE_OVERHEAD_TOKENS for msg in messages)
+    return total <= budget
+
+
+def pack_messages(messages: List[dict], budget: int, count_tokens: Callable[[str], int],
+                  file_priorities: Optional[Dict[str, float]] = None) -> Tuple[List[dict], dict]:
+    """
+    Fit `messages` into `budget` input tokens.
+
+    Older conversation turns are dropped first (oldest first; the system prompt
+    and the latest message are always kept). File blocks are then summarized
+    and finally omitted, lowest priority first. Without explicit
+    `file_priorities`, blocks that appear later in the prompt rank lower.
+
+    Every segment is tokenized once, so the cost is a single pass over the
+    prompt no matter how much gets trimmed. Returns the packed messages and a
+    report of what was trimmed.
+    """
+    report = {
+        'budget': budget,
+        'original_tokens': None,
+        'final_tokens': None,
+        'dropped_turns': [],
+        'summarized_files': [],
+        'dropped_files': [],
+        'trimmed': False,
+    }
+    if _fits_by_bytes(messages, budget):
+        return messages, report
+
+    packed = []
+    for msg in messages:
+        segments = _split_segments(msg.get('content') or '')
+        for segment in segments:
+            segment['tokens'] = count_tokens(segment['text'])
+        packed.append({'message': msg, 'segments': segments, 'dropped': False})
+
+    def message_tokens(entry):
+        return MESSAGE_OVERHEAD_TOKENS + sum(segment['tokens'] for segment in entry['segments'])
+
+    total = sum(message_tokens(entry) for entry in packed)
+    report['original_tokens'] = total
+
+    last_index = len(packed) - 1
+    for index, entry in enumerate(packed):
+        if total <= budget:
+            break
+        if index == last_index or entry['message'].get('role') == 'system':
+            continue
+        total -= message_tokens(entry)
+        entry['dropped'] = True
+        report['dropped_turns'].append(index)
+
+    if total > budget:
+        blocks = [(index, position, segment)
+                  for index, entry in enumerate(packed) if not entry['dropped']
+                  for position, segment in enumerate(entry['segments']) if segment['path']]
+        order = {id(segment): rank for rank, (_, _, segment) in enumerate(blocks)}
+        if file_priorities:
+            blocks.sort(key=lambda block: (file_priorities.get(block[2]['path'], 0.0), -order[id(block[2])]))
+        else:
+            blocks.reverse()
+
+        for stage in ('summarized', 'dropped'):
+            for _, _, segment in blocks:
+                if total <= budget:
+                    break
+                if stage == 'summarized':
+                    text = summarize_file_block(segment['path'], segment['body'])
+                else:
+                    text = omit_file_block(segment['path'])
+                tokens = count_tokens(text)
+                if tokens >= segment['tokens']:
+                    continue
+                total -= segment['tokens'] - tokens
+                segment['text'], segment['tokens'] = text, tokens
+                if segment.get('stage') == 'summarized':
+                    report['summarized_files'].remove(segment['path'])
+                segment['stage'] = stage
+                report[f'{stage}_files'].append(segment['path'])
+
+    report['final_tokens'] = total
+    report['trimmed'] = bool(report['dropped_turns'] or report['summarized_files'] or report['dropped_files'])
+    if total > budget:
+        raise ContextWindowExceeded(
+            f"Prompt needs {total} tokens even after trimming; the model accepts {budget}")
+
+    result = []
+    for entry in packed:
+        if entry['dropped']:
+            continue
+        result.append({**entry['message'], 'content': ''.join(segment['text'] for segment in entry['segments'])})
+    return result, report
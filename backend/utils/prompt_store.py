@@ -0,0 +1,128 @@
+import os
+import json
+import copy
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, TypeVar
+
+from utils.metrics import record_cache
+from utils.shared_state import FileLock, lock_path
+
+T = TypeVar('T')
+
+
+def step_sort_key(prompt: Dict) -> float:
+    try:
+        return int(prompt['step'].split()[-1])
+    except (ValueError, IndexError):
+        return float('inf')
+
+
+class PromptIndex:
+    """
+    Lookups over one snapshot of the prompts: by id, by name, by step, and
+    the default prompt of each step (the flagged one, else the first).
+    """
+
+    def __init__(self, prompts: List[Dict]):
+        self.prompts = prompts
+        self.ordered = sorted(prompts, key=step_sort_key)
+        self.by_id = {p['id']: p for p in prompts}
+        self.by_name = {p['name']: p for p in prompts}
+        self.by_step: Dict[str, List[Dict]] = defaultdict(list)
+        for p in self.ordered:
+            self.by_step[p['step']].append(p)
+        self.defaults: Dict[str, Dict] = {}
+        for step, members in self.by_step.items():
+            self.defaults[step] = next((p for p in members if p.get('is_default')), members[0])
+
+
+class PromptRegistry:
+    """
+    In-memory view of system_prompts.json.
+
+    The file is parsed once and re-read only when its mtime or size changes,
+    so listing prompts never parses JSON. Mutations are serialized by a lock
+    that other worker processes honour too, and written to a temp file that
+    is renamed over the original, so a crash or two overlapping writes can
+    never leave a truncated file behind or lose an update.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = FileLock(lock_path(path))
+        self._index = PromptIndex([])
+        self._signature = None
+        with self._lock:
+            if not os.path.exists(path):
+                self._write([])
+
+    def _stat_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _refresh(self) -> None:
+        signature = self._stat_signature()
+        record_cache('system_prompts', signature == self._signature)
+        if signature == self._signature:
+            return
+        with self._lock:
+            signature = self._stat_signature()
+            if signature == self._signature:
+                return
+            prompts = []
+            if signature is not None:
+                try:
+                    with open(self.path, 'r') as f:
+                        content = f.read().strip()
+                    prompts = json.loads(content) if content else []
+                except json.JSONDecodeError:
+                    prompts = []
+            self._load(prompts)
+            self._signature = signature
+
+    def _load(self, prompts: List[Dict]) -> None:
+        self._index = PromptIndex(prompts)
+
+    def _write(self, prompts: List[Dict]) -> None:
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(prompts, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self._load(prompts)
+        self._signature = self._stat_signature()
+
+    @property
+    def index(self) -> PromptIndex:
+        """Current snapshot with lookups. Shared; callers must not modify it."""
+        self._refresh()
+        return self._index
+
+    def version(self) -> Optional[tuple]:
+        """(mtime_ns, size) of the file behind the current snapshot."""
+        self._refresh()
+        return self._signature
+
+    def list(self) -> List[Dict]:
+        """Current prompts ordered by step number."""
+        return self.index.ordered
+
+    def get(self, prompt_id: str) -> Optional[Dict]:
+        return self.index.by_id.get(prompt_id)
+
+    def mutate(self, change: Callable[[PromptIndex], T]) -> T:
+        """
+        Apply `change` to an index over a private copy of the prompts and
+        persist the copy. If `change` raises, nothing is written and the
+        cache is untouched.
+        """
+        with self._lock:
+            self._refresh()
+            working = PromptIndex(copy.deepcopy(self._index.prompts))
+            result = change(working)
+            self._write(working.prompts)
+            return result
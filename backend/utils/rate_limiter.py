@@ -0,0 +1,192 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+PRIORITIES = {
+    "interactive": PRIORITY_INTERACTIVE,
+    "background": PRIORITY_BACKGROUND,
+}
+
+
+def estimate_request_tokens(messages: List[dict]) -> int:
+    """
+    Cheap up-front estimate of the prompt size used for admission control.
+    Uses the same ~4 characters per token rule of thumb as the token counter;
+    the reservation is corrected with real usage once the provider answers.
+    """
+    chars = sum(len(msg.get('content') or '') for msg in messages)
+    return max(1, chars // 4)
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding at most one minute of budget."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken (0 if available right now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _ProviderQueue:
+    def __init__(self, max_concurrent: int):
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.waiters: List[Tuple[int, int]] = []
+        self.condition = asyncio.Condition()
+
+
+class Reservation:
+    def __init__(self, provider: str, model: str, tokens: int, buckets: List[TokenBucket]):
+        self.provider = provider
+        self.model = model
+        self.tokens = tokens
+        self.wait_time = 0.0
+        self._buckets = buckets
+
+    def settle(self, actual_tokens: int) -> None:
+        """Correct the token reservation with the usage reported by the provider."""
+        difference = actual_tokens - self.tokens
+        for bucket in self._buckets:
+            if difference > 0:
+                bucket.tokens -= difference
+            else:
+                bucket.refund(-difference)
+        self.tokens = actual_tokens
+
+
+class ProviderScheduler:
+    """
+    Token-bucket admission control for LLM calls.
+
+    Every provider has a requests-per-minute and tokens-per-minute bucket plus a
+    concurrency cap; models may add their own buckets on top. Requests that do
+    not fit are queued in priority order instead of being sent and rejected, so
+    interactive stages are dispatched ahead of background work.
+    """
+
+    def __init__(self, models: Dict[str, Dict[str, dict]], limits: Dict[str, dict]):
+        self.models = models
+        self.limits = limits
+        self._queues: Dict[str, _ProviderQueue] = {}
+        self._buckets: Dict[Tuple[str, Optional[str], str], TokenBucket] = {}
+        self._sequence = itertools.count()
+        self._stats: Dict[str, dict] = {}
+
+    def _queue(self, provider: str) -> _ProviderQueue:
+        if provider not in self._queues:
+            max_concurrent = self.limits.get(provider, {}).get('max_concurrent', 4)
+            self._queues[provider] = _ProviderQueue(max_concurrent)
+        return self._queues[provider]
+
+    def _buckets_for(self, provider: str, model: str) -> Tuple[List[TokenBucket], List[TokenBucket]]:
+        """Return the (request, token) buckets that apply to a call."""
+        scopes = [(None, self.limits.get(provider, {})),
+                  (model, self.models.get(provider, {}).get(model, {}))]
+        request_buckets, token_buckets = [], []
+        for scope, config in scopes:
+            for kind, target in (('rpm', request_buckets), ('tpm', token_buckets)):
+                if not config.get(kind):
+                    continue
+                key = (provider, scope, kind)
+                if key not in self._buckets:
+                    self._buckets[key] = TokenBucket(config[kind])
+                target.append(self._buckets[key])
+        return request_buckets, token_buckets
+
+    def _delay(self, request_buckets, token_buckets, tokens: int, now: float) -> float:
+        delays = [bucket.delay(1, now) for bucket in request_buckets]
+        delays += [bucket.delay(tokens, now) for bucket in token_buckets]
+        return max(delays, default=0.0)
+
+    def _record_wait(self, provider: str, waited: float) -> None:
+        stats = self._stats.setdefault(provider, {'dispatched': 0, 'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0})
+        stats['dispatched'] += 1
+        stats['wait_seconds_total'] += waited
+        stats['wait_seconds_max'] = max(stats['wait_seconds_max'], waited)
+
+    @asynccontextmanager
+    async def reserve(self, provider: str, model: str, tokens: int, priority: int = PRIORITY_INTERACTIVE):
+        queue = self._queue(provider)
+        request_buckets, token_buckets = self._buckets_for(provider, model)
+        entry = (priority, next(self._sequence))
+        enqueued = time.monotonic()
+
+        async with queue.condition:
+            heapq.heappush(queue.waiters, entry)
+            try:
+                while True:
+                    timeout = None
+                    if queue.waiters[0] == entry and queue.active < queue.max_concurrent:
+                        timeout = self._delay(request_buckets, token_buckets, tokens, time.monotonic())
+                        if timeout <= 0:
+                            break
+                    try:
+                        await asyncio.wait_for(queue.condition.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                queue.waiters.remove(entry)
+                heapq.heapify(queue.waiters)
+                queue.condition.notify_all()
+                raise
+
+            heapq.heappop(queue.waiters)
+            now = time.monotonic()
+            for bucket in request_buckets:
+                bucket.consume(1, now)
+            for bucket in token_buckets:
+                bucket.consume(tokens, now)
+            queue.active += 1
+            queue.condition.notify_all()
+
+        reservation = Reservation(provider, model, tokens, token_buckets)
+        reservation.wait_time = now - enqueued
+        self._record_wait(provider, reservation.wait_time)
+        try:
+            yield reservation
+        finally:
+            async with queue.condition:
+                queue.active -= 1
+                queue.condition.notify_all()
+
+    def metrics(self) -> Dict[str, dict]:
+        result = {}
+        for provider, queue in self._queues.items():
+            stats = self._stats.get(provider, {'dispatched': 0, 'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0})
+            dispatched = stats['dispatched']
+            result[provider] = {
+                'queue_depth': len(queue.waiters),
+                'active': queue.active,
+                'max_concurrent': queue.max_concurrent,
+                'dispatched': dispatched,
+                'wait_seconds_total': round(stats['wait_seconds_total'], 4),
+                'wait_seconds_avg': round(stats['wait_seconds_total'] / dispatched, 4) if dispatched else 0.0,
+                'wait_seconds_max': round(stats['wait_seconds_max'], 4),
+            }
+        return result
@@ -0,0 +1,102 @@
+import os
+import time
+import struct
+import asyncio
+from typing import Dict, List, Optional
+
+import anyio
+
+from utils.git_operations import get_git_info, resolve_git_dir
+
+
+def read_index_entry_count(git_dir: str) -> Optional[int]:
+    """Number of tracked files, read from the 12-byte header of .git/index."""
+    try:
+        with open(os.path.join(git_dir, 'index'), 'rb') as f:
+            header = f.read(12)
+    except OSError:
+        return None
+    if len(header) < 12 or header[:4] != b'DIRC':
+        return None
+    return struct.unpack('>I', header[8:12])[0]
+
+
+class RepositorySummaries:
+    """
+    Branch, commit, dirty state, tracked file count and last known tree
+    totals for every repository under a root directory.
+
+    Dirty checks are the only part that needs a git process, so they run
+    concurrently under a semaphore and are cached per repository until the
+    index or HEAD changes or `ttl` seconds pass. Untracked files count as
+    dirty; since creating one touches neither the index nor HEAD, they show
+    up once the cache entry expires. `file_count` and `token_count` both
+    describe the working tree as of the last full tree computation, so
+    listing never walks a checkout; `tracked_file_count` comes from the index.
+    """
+
+    def __init__(self, root: str, max_parallel: int = 8, ttl: float = 30.0):
+        self.root = root
+        self.ttl = ttl
+        self._semaphore = asyncio.Semaphore(max_parallel)
+        self._dirty_cache: Dict[str, tuple] = {}
+        self._tree_totals: Dict[str, Dict[str, int]] = {}
+
+    def record_tree(self, repository: str, file_count: int, token_count: int) -> None:
+        self._tree_totals[repository] = {'file_count': file_count, 'token_count': token_count}
+
+    async def _is_dirty(self, repo_path: str, git_dir: str, refresh: bool) -> Optional[bool]:
+        signature = tuple(_mtime(os.path.join(git_dir, name)) for name in ('index', 'HEAD'))
+        cached = self._dirty_cache.get(repo_path)
+        if cached and not refresh and cached[0] == signature and time.monotonic() - cached[1] < self.ttl:
+            return cached[2]
+
+        async with self._semaphore:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    'git', 'status', '--porcelain',
+                    cwd=repo_path, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+            except OSError:
+                return None
+            try:
+                stdout, _ = await asyncio.wait_for(process.communicate(), timeout=5)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                return None
+        dirty = bool(stdout.strip()) if process.returncode == 0 else None
+        self._dirty_cache[repo_path] = (signature, time.monotonic(), dirty)
+        return dirty
+
+    async def summarize(self, repository: str, refresh: bool = False) -> Dict:
+        repo_path = os.path.join(self.root, repository)
+        git_info, git_dir, tracked_file_count = await anyio.to_thread.run_sync(_read_git_state, repo_path)
+        totals = self._tree_totals.get(repository, {})
+        return {
+            'repository': repository,
+            'branch': git_info['branch'],
+            'commit_hash': git_info['commit_hash'],
+            'is_git': git_dir is not None,
+            'dirty': await self._is_dirty(repo_path, git_dir, refresh) if git_dir else None,
+            'file_count': totals.get('file_count'),
+            'token_count': totals.get('token_count'),
+            'tracked_file_count': tracked_file_count,
+        }
+
+    async def summarize_all(self, refresh: bool = False) -> List[Dict]:
+        repositories = sorted(entry.name for entry in os.scandir(self.root) if entry.is_dir())
+        return list(await asyncio.gather(*(self.summarize(name, refresh) for name in repositories)))
+
+
+def _read_git_state(repo_path: str) -> tuple:
+    """Git info, git directory and index entry count; all blocking file reads."""
+    git_info = get_git_info(repo_path)
+    git_dir = resolve_git_dir(repo_path) if git_info['error'] is None else None
+    return git_info, git_dir, read_index_entry_count(git_dir) if git_dir else None
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
@@ -0,0 +1,51 @@
+import os
+import json
+import threading
+from typing import Any, Union
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # the stdlib encoder is slower but produces the same documents
+    orjson = None
+
+# Plain json accepts int and other scalar keys too
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def write_json(path: str, obj: Any) -> None:
+    """
+    Write aside and rename over `path`, so readers never see a half-written
+    file. The temp name is unique per process and thread, so concurrent
+    writers of one path never share a temp file and the last rename wins.
+    """
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(dumps(obj))
+    os.replace(temp_path, path)
+
+
+def read_json(path: str) -> Any:
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+class FastJSONResponse(JSONResponse):
+    """The app's default response class: same JSON, encoded with `dumps`."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
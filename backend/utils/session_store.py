@@ -0,0 +1,428 @@
+import os
+import re
+import html
+import json
+import base64
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from utils.metrics import get_logger
+from utils.serialization import dumps, loads
+from utils.shared_state import FileLock, lock_path
+
+logger = get_logger('sessions')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    last_activity_at TEXT NOT NULL,
+    deleted_at TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    stage_scores TEXT NOT NULL DEFAULT '{}',
+    log_seq INTEGER NOT NULL DEFAULT 0,
+    log_pending INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sessions_by_activity
+    ON sessions (last_activity_at DESC, id DESC) WHERE deleted_at IS NULL;
+CREATE TABLE IF NOT EXISTS search_documents (
+    doc_id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    message_index INTEGER
+);
+CREATE INDEX IF NOT EXISTS search_documents_by_session ON search_documents (session_id, kind);
+CREATE VIRTUAL TABLE IF NOT EXISTS session_search USING fts5(text, tokenize = 'unicode61');
+"""
+
+# Bumped whenever a rebuild is needed to backfill new index structures
+INDEX_VERSION = 3
+
+# Columns added after the first release of the index, applied to older databases
+MIGRATIONS = {
+    'log_seq': "ALTER TABLE sessions ADD COLUMN log_seq INTEGER NOT NULL DEFAULT 0",
+    'log_pending': "ALTER TABLE sessions ADD COLUMN log_pending INTEGER NOT NULL DEFAULT 0",
+}
+
+# Private-use characters snippet() wraps matches in; the text is
+# HTML-escaped first and these are then swapped for <mark> tags
+MATCH_START, MATCH_END = '\ue000', '\ue001'
+
+# Appended deltas are folded into the session snapshot once this many pile up
+COMPACT_AFTER_ENTRIES = 50
+
+STAGE_SCORE_KEYS = {
+    'stage1-understand-validate': ('stage1', 'clarityScore'),
+    'stage2-plan-validate': ('stage2', 'feasibilityScore'),
+    'stage3-agent-instructions': ('stage3', 'instructionQuality'),
+}
+
+
+def apply_delta(session: Dict, delta: Dict) -> Dict:
+    """Apply one appended delta (new messages, stages, files, title, deletion) to a session."""
+    session['conversation_history'] = (session.get('conversation_history') or []) + delta.get('messages', [])
+    session['stage_history'] = (session.get('stage_history') or []) + delta.get('stages', [])
+    included = session.get('included_files') or []
+    known = set(included)
+    session['included_files'] = included + [f for f in delta.get('included_files', []) if f not in known]
+    for key in ('title', 'deleted_at'):
+        if delta.get(key) is not None:
+            session[key] = delta[key]
+    session['updated_at'] = delta['updated_at']
+    return session
+
+
+def session_metadata(session: Dict) -> Dict:
+    """Derive the sidebar fields of a session without keeping its body around."""
+    history = session.get('conversation_history') or []
+    last_activity = session['created_at']
+    if history:
+        last_activity = history[-1].get('timestamp') or session['created_at']
+
+    stage_scores = {}
+    for entry in session.get('stage_history') or []:
+        keys = STAGE_SCORE_KEYS.get(entry.get('stage'))
+        if keys:
+            stage_scores[keys[0]] = entry.get(keys[1])
+
+    return {
+        'id': session['id'],
+        'title': session['title'],
+        'created_at': session['created_at'],
+        'updated_at': session['updated_at'],
+        'last_activity_at': last_activity,
+        'deleted_at': session.get('deleted_at'),
+        'message_count': len(history),
+        'stage_scores': stage_scores,
+    }
+
+
+def search_documents(session: Dict, message_offset: int = 0) -> List[Tuple[str, Optional[int], str]]:
+    """(kind, message_index, text) rows indexed for full-text search."""
+    documents = [('title', None, session['title'])] if session.get('title') else []
+    for index, message in enumerate(session.get('conversation_history') or [], start=message_offset):
+        if message.get('content'):
+            documents.append(('message', index, message['content']))
+    if session.get('included_files'):
+        documents.append(('files', None, '\n'.join(session['included_files'])))
+    return documents
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix."""
+    words = re.findall(r'\w+', text)
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def highlight(snippet: str) -> str:
+    """HTML-escape an FTS snippet, then turn its match markers into <mark> tags."""
+    return html.escape(snippet).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+def encode_cursor(last_activity_at: str, session_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{last_activity_at}|{session_id}".encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        last_activity_at, session_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|', 1)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return last_activity_at, session_id
+
+
+class SessionStore:
+    """
+    Chat sessions with bodies kept as one JSON file each and their metadata in
+    a SQLite index, so listing never has to open the session files.
+
+    Incremental updates go to an append-only `<id>.jsonl` log next to the
+    snapshot, one numbered delta per line. Reads replay the log on top of the
+    snapshot; every COMPACT_AFTER_ENTRIES deltas the log is folded back into
+    the snapshot with an atomic rename. The snapshot records the last folded
+    sequence number, so a crash between the rename and removing the log never
+    applies a delta twice.
+    """
+
+    def __init__(self, sessions_dir: str, index_path: str):
+        self.sessions_dir = sessions_dir
+        self.index_path = index_path
+        os.makedirs(sessions_dir, exist_ok=True)
+        # Serializes writers across threads and worker processes; readers rely on WAL snapshots
+        self._lock = FileLock(lock_path(index_path))
+        self._db = sqlite3.connect(index_path, timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        # Lock-free readers get a connection per thread, so they never see a writer's open transaction
+        self._readers = threading.local()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+            self._migrate()
+            if self._db.execute("PRAGMA user_version").fetchone()[0] < INDEX_VERSION:
+                self.rebuild()
+                self._db.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+            else:
+                self._reconcile()
+
+    def _migrate(self) -> None:
+        columns = {row['name'] for row in self._db.execute("PRAGMA table_info(sessions)")}
+        with self._db:
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    self._db.execute(statement)
+
+    def _body_path(self, session_id: str) -> str:
+        return os.path.join(self.sessions_dir, f"{os.path.basename(session_id)}.json")
+
+    def _log_path(self, session_id: str) -> str:
+        return os.path.join(self.sessions_dir, f"{os.path.basename(session_id)}.jsonl")
+
+    def _session_files(self) -> List[str]:
+        return [name for name in os.listdir(self.sessions_dir) if name.endswith('.json')]
+
+    def _reconcile(self) -> None:
+        """Rebuild the index when it does not match the session files (first run, manual edits)."""
+        indexed = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        if indexed != len(self._session_files()):
+            self.rebuild()
+
+    def rebuild(self) -> int:
+        """Re-derive metadata and the search index from the session files."""
+        count = 0
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM sessions")
+            self._db.execute("DELETE FROM session_search")
+            self._db.execute("DELETE FROM search_documents")
+            for filename in self._session_files():
+                try:
+                    session, seq, pending = self._load(filename[:-len('.json')])
+                    self._upsert({**session_metadata(session), 'log_seq': seq, 'log_pending': pending})
+                    self._index_documents(session['id'], search_documents(session))
+                    count += 1
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    logger.warning("skipping unreadable session file", extra={"file": filename, "error": str(e)})
+        return count
+
+    def _index_documents(self, session_id: str, documents: List[Tuple[str, Optional[int], str]]) -> None:
+        for kind, index, text in documents:
+            doc_id = self._db.execute(
+                "INSERT INTO search_documents (session_id, kind, message_index) VALUES (?, ?, ?)",
+                (session_id, kind, index)).lastrowid
+            self._db.execute("INSERT INTO session_search (rowid, text) VALUES (?, ?)", (doc_id, text))
+
+    def _unindex_documents(self, session_id: str, kind: Optional[str] = None) -> None:
+        """Drop a session's search rows (optionally of one kind) by rowid, without scanning the FTS table."""
+        where, params = "session_id = ?", [session_id]
+        if kind:
+            where, params = where + " AND kind = ?", params + [kind]
+        self._db.execute(f"DELETE FROM session_search WHERE rowid IN (SELECT doc_id FROM search_documents WHERE {where})", params)
+        self._db.execute(f"DELETE FROM search_documents WHERE {where}", params)
+
+    def _indexed_files(self, session_id: str) -> List[str]:
+        row = self._db.execute(
+            """SELECT text FROM session_search WHERE rowid =
+                   (SELECT doc_id FROM search_documents WHERE session_id = ? AND kind = 'files')""",
+            (session_id,)).fetchone()
+        return row[0].split('\n') if row else []
+
+    def _upsert(self, metadata: Dict) -> None:
+        self._db.execute(
+            """INSERT OR REPLACE INTO sessions
+               (id, title, created_at, updated_at, last_activity_at, deleted_at, message_count, stage_scores,
+                log_seq, log_pending)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (metadata['id'], metadata['title'], metadata['created_at'], metadata['updated_at'],
+             metadata['last_activity_at'], metadata['deleted_at'], metadata['message_count'],
+             json.dumps(metadata['stage_scores']), metadata.get('log_seq', 0), metadata.get('log_pending', 0)))
+
+    def _write_body(self, session: Dict, log_seq: int) -> None:
+        path = self._body_path(session['id'])
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(dumps({**session, 'log_seq': log_seq}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def _load(self, session_id: str) -> Tuple[Dict, int, int]:
+        """Snapshot plus replayed log; returns (session, last sequence number, pending log entries)."""
+        with open(self._body_path(session_id), 'rb') as f:
+            session = loads(f.read())
+        seq = session.pop('log_seq', 0)
+        pending = 0
+        try:
+            with open(self._log_path(session_id), 'rb') as f:
+                for line in f:
+                    try:
+                        entry = loads(line)
+                    except ValueError:
+                        continue  # torn line from an interrupted append
+                    if entry['seq'] <= seq:
+                        continue
+                    apply_delta(session, entry['delta'])
+                    seq = entry['seq']
+                    pending += 1
+        except FileNotFoundError:
+            pass
+        return session, seq, pending
+
+    def _reader(self) -> sqlite3.Connection:
+        db = getattr(self._readers, 'db', None)
+        if db is None:
+            db = self._readers.db = sqlite3.connect(self.index_path, timeout=30)
+            db.row_factory = sqlite3.Row
+        return db
+
+    def _row(self, session_id: str):
+        return self._db.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+
+    def exists(self, session_id: str) -> bool:
+        return self._reader().execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone() is not None
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        try:
+            return self._load(session_id)[0]
+        except FileNotFoundError:
+            return None
+
+    def save(self, session: Dict) -> Dict:
+        """Replace a session wholesale (create, full PUT), folding away any pending log."""
+        with self._lock:
+            row = self._row(session['id'])
+            seq = row['log_seq'] if row else 0
+            self._write_body(session, seq)
+            self._remove_log(session['id'])
+            with self._db:
+                self._upsert({**session_metadata(session), 'log_seq': seq, 'log_pending': 0})
+                self._unindex_documents(session['id'])
+                self._index_documents(session['id'], search_documents(session))
+        return session
+
+    def append(self, session_id: str, delta: Dict) -> Optional[Dict]:
+        """
+        Record new messages/stages/files for a session by appending one log line.
+        Only the delta is written; returns the updated metadata row.
+        """
+        with self._lock:
+            row = self._row(session_id)
+            if row is None:
+                return None
+            seq = row['log_seq'] + 1
+            line = dumps({'seq': seq, 'delta': delta}) + b'\n'
+            with open(self._log_path(session_id), 'ab+') as f:
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        line = b'\n' + line
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+            stage_scores = json.loads(row['stage_scores'])
+            for entry in delta.get('stages', []):
+                keys = STAGE_SCORE_KEYS.get(entry.get('stage'))
+                if keys:
+                    stage_scores[keys[0]] = entry.get(keys[1])
+            messages = delta.get('messages', [])
+            metadata = {
+                **dict(row),
+                'title': delta.get('title') or row['title'],
+                'updated_at': delta['updated_at'],
+                'last_activity_at': (messages[-1].get('timestamp') or row['last_activity_at']) if messages else row['last_activity_at'],
+                'deleted_at': delta.get('deleted_at') or row['deleted_at'],
+                'message_count': row['message_count'] + len(messages),
+                'stage_scores': stage_scores,
+                'log_seq': seq,
+                'log_pending': row['log_pending'] + 1,
+            }
+            with self._db:
+                self._upsert(metadata)
+                if delta.get('title'):
+                    self._unindex_documents(session_id, 'title')
+                included_files = None
+                if delta.get('included_files'):
+                    # One files document per session, rebuilt from the indexed list
+                    included_files = self._indexed_files(session_id)
+                    included_files += [f for f in delta['included_files'] if f not in included_files]
+                    self._unindex_documents(session_id, 'files')
+                self._index_documents(session_id, search_documents(
+                    {'title': delta.get('title'), 'conversation_history': messages,
+                     'included_files': included_files},
+                    message_offset=row['message_count']))
+            if metadata['log_pending'] >= COMPACT_AFTER_ENTRIES:
+                self._compact(session_id)
+        return {key: metadata[key] for key in ('id', 'title', 'updated_at', 'last_activity_at', 'message_count', 'log_seq')}
+
+    def _compact(self, session_id: str) -> None:
+        session, seq, _ = self._load(session_id)
+        self._write_body(session, seq)
+        self._remove_log(session_id)
+        with self._db:
+            self._db.execute("UPDATE sessions SET log_pending = 0 WHERE id = ?", (session_id,))
+
+    def _remove_log(self, session_id: str) -> None:
+        try:
+            os.remove(self._log_path(session_id))
+        except FileNotFoundError:
+            pass
+
+    def list(self, limit: int = 50, cursor: Optional[str] = None) -> Dict:
+        """One page of non-deleted sessions, most recently active first."""
+        query = ("SELECT id, title, created_at, updated_at, last_activity_at, message_count, stage_scores "
+                 "FROM sessions WHERE deleted_at IS NULL")
+        params: list = []
+        if cursor:
+            last_activity_at, session_id = decode_cursor(cursor)
+            query += " AND (last_activity_at < ? OR (last_activity_at = ? AND id < ?))"
+            params += [last_activity_at, last_activity_at, session_id]
+        query += " ORDER BY last_activity_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        rows = self._reader().execute(query, params).fetchall()
+        sessions = [{**dict(row), 'stage_scores': json.loads(row['stage_scores'])} for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = sessions[-1]
+            next_cursor = encode_cursor(last['last_activity_at'], last['id'])
+        return {'sessions': sessions, 'next_cursor': next_cursor}
+
+    def search(self, text: str, limit: int = 20) -> List[Dict]:
+        """
+        Rank non-deleted sessions for `text` across titles, messages and
+        included file paths (BM25, best first) with highlighted snippets.
+        Snippets are HTML-escaped, with matches wrapped in <mark>.
+        """
+        query = fts_query(text)
+        if not query:
+            return []
+        rows = self._reader().execute(
+            """SELECT s.id, s.title, s.last_activity_at, d.kind, d.message_index,
+                      snippet(session_search, 0, ?, ?, '…', 12) AS snippet,
+                      bm25(session_search) AS rank
+               FROM session_search
+               JOIN search_documents d ON d.doc_id = session_search.rowid
+               JOIN sessions s ON s.id = d.session_id
+               WHERE session_search MATCH ? AND s.deleted_at IS NULL
+               ORDER BY rank LIMIT ?""",
+            (MATCH_START, MATCH_END, query, limit * 5)).fetchall()
+
+        results: Dict[str, Dict] = {}
+        for row in rows:
+            result = results.get(row['id'])
+            if result is None:
+                if len(results) == limit:
+                    continue
+                result = results[row['id']] = {
+                    'id': row['id'], 'title': row['title'], 'last_activity_at': row['last_activity_at'],
+                    'score': round(-row['rank'], 4), 'matches': []}
+            if len(result['matches']) < 3:
+                result['matches'].append({'kind': row['kind'], 'message_index': row['message_index'],
+                                          'snippet': highlight(row['snippet'])})
+        return list(results.values())
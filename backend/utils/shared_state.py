@@ -0,0 +1,215 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from dotenv import dotenv_values, set_key
+
+from utils.app_config import backend_setting
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only cover the threads of one process
+    fcntl = None
+
+# Number of uvicorn worker processes; above 1, caches are shared through SQLite
+WORKERS = max(1, int(backend_setting('workers', 1)))
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARED_CACHE_PATH = os.path.join(BACKEND_DIR, 'logs', 'shared_cache.sqlite3')
+
+
+def split_limits(limits: Dict[str, dict], workers: int) -> Dict[str, dict]:
+    """Per-worker share of provider rate limits, so all workers together stay within them."""
+    if workers <= 1:
+        return limits
+    return {provider: {name: max(1, value // workers) for name, value in values.items()}
+            for provider, values in limits.items()}
+
+
+def lock_path(path: str) -> str:
+    """Hidden lock file next to `path`: data/.sessions.sqlite3.lock for data/sessions.sqlite3."""
+    return os.path.join(os.path.dirname(path), f".{os.path.basename(path).lstrip('.')}.lock")
+
+
+class FileLock:
+    """
+    Exclusive lock shared by the threads of this process and by every other
+    process that locks the same path (flock on a side file). Reentrant within
+    a thread, so a locked method can call another locked method.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+
+class SharedCache:
+    """
+    Key/value entries and counters in a SQLite database in WAL mode, visible
+    to every worker process. Entries live in a namespace, can carry a version
+    that a read must match (an mtime signature, an ETag) and can expire.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        version TEXT,
+        value BLOB NOT NULL,
+        expires_at REAL,
+        PRIMARY KEY (namespace, key)
+    );
+    CREATE TABLE IF NOT EXISTS counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    """
+
+    # Expired entries are swept after this many writes from one process
+    PRUNE_EVERY_WRITES = 200
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(self.SCHEMA)
+            self._local.db = db
+        return db
+
+    def get(self, namespace: str, key: str, version=None) -> Optional[bytes]:
+        row = self._db().execute(
+            "SELECT version, value, expires_at FROM entries WHERE namespace = ? AND key = ?",
+            (namespace, key)).fetchone()
+        if row is None or (row[2] is not None and row[2] < time.time()):
+            return None
+        if version is not None and row[0] != str(version):
+            return None
+        return row[1]
+
+    def put(self, namespace: str, key: str, value: bytes, version=None, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        self._db().execute(
+            "INSERT OR REPLACE INTO entries (namespace, key, version, value, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, None if version is None else str(version), value, expires_at))
+        self._wrote()
+
+    def add(self, namespace: str, key: str, ttl: float) -> bool:
+        """Create an entry only if no live one exists; True for the one caller that did."""
+        return bool(self.add_many(namespace, [key], ttl))
+
+    def add_many(self, namespace: str, keys: List[str], ttl: float) -> List[str]:
+        """`add` for several keys in one transaction; the keys this caller created."""
+        if not keys:
+            return []
+        db = self._db()
+        now = time.time()
+        added = []
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for key in keys:
+                db.execute("DELETE FROM entries WHERE namespace = ? AND key = ? AND expires_at < ?", (namespace, key, now))
+                if db.execute("INSERT OR IGNORE INTO entries (namespace, key, value, expires_at) VALUES (?, ?, x'', ?)",
+                              (namespace, key, now + ttl)).rowcount == 1:
+                    added.append(key)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return added
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._db().execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def incr(self, name: str) -> int:
+        db = self._db()
+        db.execute("INSERT INTO counters (name, value) VALUES (?, 1) "
+                   "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+        return self.counter(name)
+
+    def counter(self, name: str) -> int:
+        row = self._db().execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def _wrote(self) -> None:
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY_WRITES == 0:
+            self._db().execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+
+
+# Only multi-worker deployments pay for the database; one process keeps everything in memory
+shared_cache: Optional[SharedCache] = SharedCache(SHARED_CACHE_PATH) if WORKERS > 1 else None
+
+
+class EnvFile:
+    """
+    The backend's .env. Updates are written under a file lock and applied to
+    this process; other workers pick them up with `refresh`, which only
+    re-reads the file when its mtime or size changed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = FileLock(lock_path(path))
+        self._signature = self._stat_signature()
+
+    def _stat_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            set_key(self.path, key, value)
+            os.environ[key] = value
+            self._signature = self._stat_signature()
+
+    def refresh(self) -> bool:
+        """Apply the file to os.environ if another process changed it; True when it did."""
+        if self._stat_signature() == self._signature:
+            return False
+        with self._lock:
+            signature = self._stat_signature()
+            if signature == self._signature:
+                return False
+            values = dotenv_values(self.path) if signature is not None else {}
+            os.environ.update({key: value for key, value in values.items() if value is not None})
+            self._signature = signature
+        return True
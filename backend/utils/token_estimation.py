@@ -0,0 +1,164 @@
+import os
+import math
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from utils.app_config import backend_setting
+from utils.metrics import record_cache
+from utils.shared_state import SharedCache
+
+TOKEN_ESTIMATION = backend_setting('token_estimation', {
+    # Files above this size are sampled instead of read in full by /tree
+    'sample_above_bytes': 1024 * 1024,
+    'sample_windows': 8,
+    'window_bytes': 16 * 1024,
+    'exact_in_background': True,
+})
+
+# Exact counts are computed chunk by chunk so a huge file never sits in memory whole
+EXACT_CHUNK_BYTES = 4 * 1024 * 1024
+# Two-sided 95% bound on the mean tokens-per-byte of the sampled windows
+CONFIDENCE_Z = 1.96
+
+
+def _trim_to_whitespace(window: bytes, at_start: bool, at_end: bool) -> bytes:
+    """Drop the partial words at a window's edges so they don't skew the ratio."""
+    if not at_start:
+        cut = next((i for i, b in enumerate(window) if b in b' \t\n'), None)
+        window = window[cut + 1:] if cut is not None else window
+    if not at_end:
+        cut = max(window.rfind(b' '), window.rfind(b'\n'), window.rfind(b'\t'))
+        window = window[:cut] if cut > 0 else window
+    return window
+
+
+def estimate_file_tokens(path: str, size: int, count_tokens: Callable[[str], int],
+                         windows: Optional[int] = None, window_bytes: Optional[int] = None) -> Tuple[int, int]:
+    """
+    (estimate, margin) for the token count of a large file, from `windows`
+    evenly spaced samples: the mean tokens-per-byte of the samples times the
+    file size, with a 95% confidence margin from their spread.
+    """
+    windows = windows or TOKEN_ESTIMATION['sample_windows']
+    window_bytes = window_bytes or TOKEN_ESTIMATION['window_bytes']
+    if size <= windows * window_bytes:
+        windows, window_bytes = 1, size
+
+    step = (size - window_bytes) / max(windows - 1, 1)
+    ratios = []
+    with open(path, 'rb') as f:
+        for i in range(windows):
+            start = int(i * step)
+            f.seek(start)
+            sample = _trim_to_whitespace(f.read(window_bytes), start == 0, start + window_bytes >= size)
+            if sample:
+                ratios.append(count_tokens(sample.decode('utf-8', errors='ignore')) / len(sample))
+
+    if not ratios:
+        return 0, 0
+    mean = sum(ratios) / len(ratios)
+    if len(ratios) > 1:
+        variance = sum((r - mean) ** 2 for r in ratios) / (len(ratios) - 1)
+        margin = CONFIDENCE_Z * math.sqrt(variance / len(ratios)) * size
+    else:
+        margin = 0.0
+    return int(mean * size), int(math.ceil(margin))
+
+
+def count_file_tokens_exact(path: str, count_tokens: Callable[[str], int]) -> int:
+    """Full count of a file, fed to the counter in line-aligned chunks."""
+    total = 0
+    remainder = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(EXACT_CHUNK_BYTES)
+            if not chunk:
+                break
+            chunk = remainder + chunk
+            cut = chunk.rfind(b'\n') + 1
+            if cut == 0:
+                remainder = chunk
+                continue
+            remainder = chunk[cut:]
+            total += count_tokens(chunk[:cut].decode('utf-8', errors='ignore'))
+    if remainder:
+        total += count_tokens(remainder.decode('utf-8', errors='ignore'))
+    return total
+
+
+class ExactTokenCounts:
+    """
+    Exact counts for files /tree had to estimate, computed in the background
+    and keyed by (path, mtime, size) so a changed file is estimated again.
+    `generation(scope)` goes up whenever a count computed for that scope (a
+    repository) lands. With a `shared` cache, counts, claims and generations
+    are common to all workers.
+    """
+
+    NAMESPACE = 'exact_token_counts'
+    # A claim left behind by a worker that died mid-count is retried after this
+    CLAIM_TTL_SECONDS = 600
+
+    def __init__(self, shared: Optional[SharedCache] = None):
+        self.shared = shared
+        self._counts: Dict[str, Tuple[tuple, int]] = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._generations: Dict[str, int] = {}
+
+    def generation(self, scope: str) -> int:
+        if self.shared is not None:
+            return self.shared.counter(f"{self.NAMESPACE}:{scope}")
+        return self._generations.get(scope, 0)
+
+    @staticmethod
+    def _signature(path: str) -> Optional[tuple]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, path: str) -> Optional[int]:
+        signature = self._signature(path)
+        cached = self._counts.get(path)
+        count = cached[1] if cached and cached[0] == signature else None
+        if count is None and self.shared is not None and signature is not None:
+            value = self.shared.get(self.NAMESPACE, path, version=signature)
+            if value is not None:
+                count = int(value)
+                self._counts[path] = (signature, count)
+        record_cache('exact_token_counts', count is not None)
+        return count
+
+    def claim(self, paths: Iterable[str]) -> list:
+        """The subset of `paths` not already being counted, now marked as in progress."""
+        with self._lock:
+            claimed = [p for p in paths if p not in self._pending]
+            self._pending.update(claimed)
+        if self.shared is not None:
+            won = set(self.shared.add_many(f"{self.NAMESPACE}_claims", claimed, self.CLAIM_TTL_SECONDS))
+            with self._lock:
+                self._pending.difference_update(p for p in claimed if p not in won)
+            claimed = [p for p in claimed if p in won]
+        return claimed
+
+    def compute(self, paths: Iterable[str], count_tokens: Callable[[str], int], scope: str) -> None:
+        for path in paths:
+            try:
+                signature = self._signature(path)
+                if signature is not None:
+                    count = count_file_tokens_exact(path, count_tokens)
+                    self._counts[path] = (signature, count)
+                    with self._lock:
+                        self._generations[scope] = self._generations.get(scope, 0) + 1
+                    if self.shared is not None:
+                        self.shared.put(self.NAMESPACE, path, str(count).encode('ascii'), version=signature)
+                        self.shared.incr(f"{self.NAMESPACE}:{scope}")
+            except OSError:
+                pass
+            finally:
+                with self._lock:
+                    self._pending.discard(path)
+                if self.shared is not None:
+                    self.shared.delete(f"{self.NAMESPACE}_claims", path)
@@ -1,5 +1,7 @@
 import os
-import json
+import hashlib
+
+from utils.ignore_matcher import IgnoreMatcher
 
 def should_skip_token_count(file_path):
     # List of specific files to skip
@@ -18,35 +20,36 @@ def should_skip_token_count(file_path):
     return filename in skip_files or ext in skip_extensions
 
 def get_tree_structure(path, max_depth=10):
-    excluded_dirs = {'node_modules', 'venv', '.venv', '__pycache__', '.git', '.next', '.mypy_cache', '.pytest_cache', '.ruff_cache', 'certs', 'logs'}
+    matcher = IgnoreMatcher(path)
 
-    def traverse(current_path, current_depth=0):
+    def traverse(current_path, relpath, is_dir, current_depth=0):
         if current_depth > max_depth:
             return None
 
-        item_name = os.path.basename(current_path)
-        if item_name in excluded_dirs:
-            return None
-
         # Check if we should skip token counting before creating the node
         skip_token_count = should_skip_token_count(current_path)
         node = {
-            "name": item_name,
+            "name": os.path.basename(current_path),
             "type": "file",
             "item_count": 1,
             "token_count": 0,
-            "path": os.path.relpath(current_path, path),
+            "path": relpath or ".",
             "skip_token_count": skip_token_count
         }
 
-        if os.path.isdir(current_path):
+        if is_dir:
             node["type"] = "directory"
             node["children"] = []
             node["item_count"] = 0
             try:
-                for child in sorted(os.listdir(current_path)):
-                    child_path = os.path.join(current_path, child)
-                    child_node = traverse(child_path, current_depth + 1)
+                with os.scandir(current_path) as entries:
+                    children = sorted((entry.name, entry.path, entry.is_dir()) for entry in entries)
+                for child, child_path, child_is_dir in children:
+                    child_relpath = f"{relpath}/{child}" if relpath else child
+                    # Ignored directories are pruned here, never listed
+                    if matcher.match_entry(child_relpath, child_is_dir):
+                        continue
+                    child_node = traverse(child_path, child_relpath, child_is_dir, current_depth + 1)
                     if child_node:
                         node["children"].append(child_node)
                         node["item_count"] += child_node["item_count"]
@@ -55,5 +58,42 @@ def get_tree_structure(path, max_depth=10):
 
         return node
 
-    tree = traverse(path)
-    return json.dumps(tree)
\ No newline at end of file
+    return traverse(path, "", os.path.isdir(path))
+
+
+def get_tree_signature(path, max_depth=10):
+    """
+    (digest, newest mtime) over the name, size and mtime of everything
+    get_tree_structure would list. Only stats entries, never reads a file,
+    so it is a cheap version for the tree and its token counts.
+    """
+    matcher = IgnoreMatcher(path)
+    digest = hashlib.blake2b(digest_size=16)
+    newest = os.stat(path).st_mtime
+    stack = [(path, "", 0)]
+    while stack:
+        current_path, relpath, depth = stack.pop()
+        # Children of a directory at max_depth are not part of the tree
+        if depth >= max_depth:
+            continue
+        try:
+            with os.scandir(current_path) as entries:
+                children = sorted(entries, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        for entry in children:
+            child_relpath = f"{relpath}/{entry.name}" if relpath else entry.name
+            is_dir = entry.is_dir()
+            if matcher.match_entry(child_relpath, is_dir):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            newest = max(newest, stat.st_mtime)
+            if is_dir:
+                digest.update(f"d {child_relpath}\n".encode('utf-8', 'surrogateescape'))
+                stack.append((entry.path, child_relpath, depth + 1))
+            else:
+                digest.update(f"f {child_relpath} {stat.st_mtime_ns} {stat.st_size}\n".encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest(), newest
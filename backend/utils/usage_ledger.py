@@ -0,0 +1,330 @@
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from utils.app_config import backend_setting
+from utils.metrics import get_logger
+
+USAGE_LEDGER = backend_setting('usage_ledger', {
+    # Ledger database; null keeps it in backend/logs. The USAGE_LEDGER_PATH environment variable wins.
+    'path': None,
+    # Calls are written in batches by a background thread, at most this long after they finish
+    'flush_interval_seconds': 1.0,
+    'batch_size': 200,
+    # Spend caps in USD checked before a call is dispatched; null disables a cap
+    'budgets': {
+        'daily_usd': None,
+        'monthly_usd': None,
+        'session_usd': None,
+    },
+})
+
+logger = get_logger('usage')
+
+
+def ledger_path(default: str) -> str:
+    return os.getenv('USAGE_LEDGER_PATH') or USAGE_LEDGER['path'] or default
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    day TEXT NOT NULL,
+    session_id TEXT,
+    request_id TEXT,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    cost REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS usage_daily (
+    day TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    cost REAL NOT NULL,
+    PRIMARY KEY (day, provider, model)
+);
+CREATE TABLE IF NOT EXISTS usage_sessions (
+    session_id TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    cost REAL NOT NULL,
+    first_at TEXT NOT NULL,
+    last_at TEXT NOT NULL,
+    PRIMARY KEY (session_id, provider, model)
+);
+"""
+
+TOTAL_COLUMNS = ("SUM(requests) AS requests, SUM(input_tokens) AS input_tokens, "
+                 "SUM(output_tokens) AS output_tokens, SUM(cost) AS cost")
+
+GROUPS = ('model', 'provider')
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, scope: str, limit: float, spent: float):
+        super().__init__(f"{scope.capitalize()} budget of ${limit:.2f} reached (${spent:.4f} spent)")
+        self.scope = scope
+        self.limit = limit
+        self.spent = spent
+
+
+def _month_range(day: date):
+    first = day.replace(day=1)
+    following = (first + timedelta(days=32)).replace(day=1)
+    return first.isoformat(), (following - timedelta(days=1)).isoformat()
+
+
+def _totals(row) -> Dict:
+    return {'requests': row['requests'] or 0, 'input_tokens': row['input_tokens'] or 0,
+            'output_tokens': row['output_tokens'] or 0, 'cost': row['cost'] or 0.0}
+
+
+class UsageLedger:
+    """
+    Every completed LLM call as one row of an append-only SQLite table, with
+    rollups by (day, provider, model) and by (session, provider, model)
+    updated in the same transaction. `record` only queues the call; a
+    background thread writes queued calls in batches, so summaries read a
+    few small rollup rows and lag by at most the flush interval. Budget
+    checks also count calls still in the queue and the estimated cost of
+    calls in flight, which `reserve` holds until `record` or `release`.
+    Reservations are per process: with several workers each one only sees
+    its own calls in flight. The database is opened on first use.
+    """
+
+    def __init__(self, path: str, flush_interval: float, batch_size: int, budgets: Dict[str, Optional[float]]):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.budgets = budgets
+        self._pending: List[tuple] = []
+        # The batch a flush is writing; still counted by budget checks until it is committed
+        self._writing: List[tuple] = []
+        # Estimated costs of calls in flight, by reservation id
+        self._reserved: Dict[int, tuple] = {}
+        self._next_reservation = 0
+        self._lock = threading.Lock()
+        # Makes a budget check and its reservation one step for concurrent requests
+        self._budget_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """The ledger database, created on first use; call with _db_lock held."""
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    @staticmethod
+    def _entry(provider: str, model: str, input_tokens: int, output_tokens: int, cost: float,
+               session_id: Optional[str], request_id: Optional[str], priority: str) -> tuple:
+        now = datetime.now()
+        return (now.isoformat(), now.date().isoformat(), session_id, request_id, provider, model, priority,
+                input_tokens, output_tokens, cost)
+
+    def reserve(self, provider: str, model: str, estimated_cost: float, session_id: Optional[str] = None) -> int:
+        """
+        Check the budgets for a call costing about `estimated_cost` and hold
+        that cost until the call is recorded or released. Raises
+        BudgetExceeded instead if the call would go over a cap.
+        """
+        with self._budget_lock:
+            self.check_budget(estimated_cost, session_id)
+            with self._lock:
+                self._next_reservation += 1
+                reservation = self._next_reservation
+                self._reserved[reservation] = self._entry(provider, model, 0, 0, estimated_cost,
+                                                          session_id, None, 'reserved')
+        return reservation
+
+    def release(self, reservation: int) -> None:
+        """Drop the hold of a call that failed before it could be recorded."""
+        with self._lock:
+            self._reserved.pop(reservation, None)
+
+    def record(self, provider: str, model: str, input_tokens: int, output_tokens: int, cost: float,
+               session_id: Optional[str] = None, request_id: Optional[str] = None, priority: str = 'interactive',
+               reservation: Optional[int] = None) -> None:
+        """Queue a finished call, replacing its reservation (if any) with the real cost."""
+        entry = self._entry(provider, model, input_tokens, output_tokens, cost, session_id, request_id, priority)
+        with self._lock:
+            if reservation is not None:
+                self._reserved.pop(reservation, None)
+            self._pending.append(entry)
+            if self._writer is None and not self._closed:
+                self._writer = threading.Thread(target=self._run, name="usage-ledger", daemon=True)
+                self._writer.start()
+            if len(self._pending) >= self.batch_size:
+                self._wake.set()
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """Write queued calls and their rollups in one transaction."""
+        with self._db_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._writing = batch
+            if not batch:
+                return 0
+            try:
+                db = self._connection()
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    self._write(batch)
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+            except Exception as e:
+                # Put the batch back so the next flush retries it
+                with self._lock:
+                    self._pending[:0] = batch
+                logger.error("writing usage failed", extra={"entries": len(batch), "error": str(e)})
+                return 0
+            finally:
+                with self._lock:
+                    self._writing = []
+        return len(batch)
+
+    def _write(self, batch: List[tuple]) -> None:
+        self._db.executemany(
+            "INSERT INTO usage (created_at, day, session_id, request_id, provider, model, priority, "
+            "input_tokens, output_tokens, cost) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+        for created_at, day, session_id, _, provider, model, _, input_tokens, output_tokens, cost in batch:
+            self._db.execute(
+                "INSERT INTO usage_daily VALUES (?, ?, ?, 1, ?, ?, ?) ON CONFLICT (day, provider, model) DO UPDATE SET "
+                "requests = requests + 1, input_tokens = input_tokens + excluded.input_tokens, "
+                "output_tokens = output_tokens + excluded.output_tokens, cost = cost + excluded.cost",
+                (day, provider, model, input_tokens, output_tokens, cost))
+            if session_id:
+                self._db.execute(
+                    "INSERT INTO usage_sessions VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (session_id, provider, model) DO UPDATE SET "
+                    "requests = requests + 1, input_tokens = input_tokens + excluded.input_tokens, "
+                    "output_tokens = output_tokens + excluded.output_tokens, cost = cost + excluded.cost, "
+                    "last_at = excluded.last_at",
+                    (session_id, provider, model, input_tokens, output_tokens, cost, created_at, created_at))
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+    def _query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._db_lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def _pending_cost(self, first_day: Optional[str] = None, last_day: Optional[str] = None,
+                      session_id: Optional[str] = None) -> float:
+        with self._lock:
+            pending = self._writing + self._pending + list(self._reserved.values())
+        return sum(entry[9] for entry in pending
+                   if (first_day is None or first_day <= entry[1] <= last_day)
+                   and (session_id is None or entry[2] == session_id))
+
+    def spent(self, scope: str, session_id: Optional[str] = None) -> float:
+        """Spend so far today, this month or in a session, including calls not written yet or in flight."""
+        today = date.today()
+        # Queued calls are read first: one written in between is counted twice, never missed
+        if scope == 'session':
+            pending = self._pending_cost(session_id=session_id)
+            row = self._query("SELECT SUM(cost) FROM usage_sessions WHERE session_id = ?", (session_id,))[0]
+            return (row[0] or 0.0) + pending
+        first, last = (today.isoformat(), today.isoformat()) if scope == 'daily' else _month_range(today)
+        pending = self._pending_cost(first, last)
+        row = self._query("SELECT SUM(cost) FROM usage_daily WHERE day BETWEEN ? AND ?", (first, last))[0]
+        return (row[0] or 0.0) + pending
+
+    def check_budget(self, estimated_cost: float, session_id: Optional[str] = None) -> None:
+        """Raise BudgetExceeded if a call costing about `estimated_cost` would go over a configured cap."""
+        for scope in ('daily', 'monthly', 'session'):
+            limit = self.budgets.get(f'{scope}_usd')
+            if limit is None or (scope == 'session' and not session_id):
+                continue
+            spent = self.spent(scope, session_id)
+            if spent + estimated_cost > limit:
+                raise BudgetExceeded(scope, limit, spent)
+
+    def budget_status(self) -> Dict[str, Dict]:
+        status = {}
+        for scope in ('daily', 'monthly'):
+            limit = self.budgets.get(f'{scope}_usd')
+            spent = self.spent(scope)
+            status[scope] = {'limit': limit, 'spent': spent,
+                             'remaining': None if limit is None else max(0.0, limit - spent)}
+        status['session'] = {'limit': self.budgets.get('session_usd')}
+        return status
+
+    def summary(self, days: int = 30) -> Dict:
+        """Totals for today, this month and the last `days` days, the latter also by model and provider."""
+        today = date.today()
+        since = (today - timedelta(days=days - 1)).isoformat()
+        month_first, month_last = _month_range(today)
+
+        def total(first, last):
+            return _totals(self._query(f"SELECT {TOTAL_COLUMNS} FROM usage_daily WHERE day BETWEEN ? AND ?",
+                                       (first, last))[0])
+
+        def grouped(column):
+            rows = self._query(f"SELECT {column} AS name, {TOTAL_COLUMNS} FROM usage_daily WHERE day >= ? "
+                               f"GROUP BY {column} ORDER BY cost DESC", (since,))
+            return {row['name']: _totals(row) for row in rows}
+
+        return {
+            'today': total(today.isoformat(), today.isoformat()),
+            'month': total(month_first, month_last),
+            'window': {'days': days, 'since': since, **total(since, today.isoformat())},
+            'by_model': grouped('model'),
+            'by_provider': grouped('provider'),
+            'budgets': self.budget_status(),
+        }
+
+    def daily(self, days: int = 30, group_by: str = 'model') -> List[Dict]:
+        if group_by not in GROUPS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUPS)}")
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        rows = self._query(f"SELECT day, {group_by} AS name, {TOTAL_COLUMNS} FROM usage_daily WHERE day >= ? "
+                           f"GROUP BY day, {group_by} ORDER BY day, cost DESC", (since,))
+        return [{'day': row['day'], group_by: row['name'], **_totals(row)} for row in rows]
+
+    def sessions(self, limit: int = 20) -> List[Dict]:
+        """Sessions with the highest spend."""
+        rows = self._query(f"SELECT session_id, {TOTAL_COLUMNS}, MIN(first_at) AS first_at, MAX(last_at) AS last_at "
+                           "FROM usage_sessions GROUP BY session_id ORDER BY cost DESC LIMIT ?", (limit,))
+        return [{'session_id': row['session_id'], 'first_at': row['first_at'], 'last_at': row['last_at'],
+                 **_totals(row)} for row in rows]
+
+    def session(self, session_id: str) -> Optional[Dict]:
+        rows = self._query("SELECT * FROM usage_sessions WHERE session_id = ? ORDER BY cost DESC", (session_id,))
+        if not rows:
+            return None
+        by_model = {row['model']: {'provider': row['provider'], **_totals(row)} for row in rows}
+        totals = {key: sum(entry[key] for entry in by_model.values())
+                  for key in ('requests', 'input_tokens', 'output_tokens', 'cost')}
+        return {'session_id': session_id, 'first_at': min(row['first_at'] for row in rows),
+                'last_at': max(row['last_at'] for row in rows), **totals, 'by_model': by_model}
@@ -22,7 +22,8 @@ function App() {
 
   const [selectedRepository, setSelectedRepository] = useState('');
   const [selectedFiles, setSelectedFiles] = useState([]);
-  const [userPrompt, setUserPrompt] = useState('');
+  // What PromptComposer assembled: { content, handle, tokenCount, tokenCountExact }
+  const [userPrompt, setUserPrompt] = useState(null);
   const [isSidebarOpen, setIsSidebarOpen] = useState(() => {
     const savedState = sessionStorage.getItem(`${instanceId}_sidebarOpen`);
     return savedState !== null ? savedState === 'true' : window.innerWidth >= 1024;
@@ -144,7 +145,7 @@ function App() {
                   />
                 } />
                 <Route path="/system-prompt" element={<SystemPromptManagement />} />
-                <Route path="/llm-interaction" element={<LLMInteraction initialPrompt={userPrompt} />} />
+                <Route path="/llm-interaction" element={<LLMInteraction assembledPrompt={userPrompt} />} />
                 <Route path="/settings" element={
                   <Settings 
                     selectedRepository={selectedRepository} 
@@ -30,6 +30,7 @@ import {
 
 const ChatSessions = ({ onSessionSelect, activeSessionId }) => {
   const [sessions, setSessions] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [isCreating, setIsCreating] = useState(false);
   const [newTitle, setNewTitle] = useState('');
   const [editingSession, setEditingSession] = useState(null);
@@ -42,28 +43,19 @@ const ChatSessions = ({ onSessionSelect, activeSessionId }) => {
     loadSessions();
   }, []);
 
-  const loadSessions = async () => {
+  const loadSessions = async (cursor = null) => {
     try {
-      const data = await chatSessionService.listChatSessions();
-      console.log('Chat sessions:', data); // Debug log
-      // Sort sessions by most recent message timestamp
-      const sortedSessions = data.sort((a, b) => {
-        const aTimestamp = getLastMessageTimestamp(a);
-        const bTimestamp = getLastMessageTimestamp(b);
-        return bTimestamp - aTimestamp;
-      });
-      setSessions(sortedSessions);
+      // Sessions arrive sorted by most recent activity, one page at a time
+      const data = await chatSessionService.listChatSessions(cursor);
+      setSessions(prev => (cursor ? [...prev, ...data.sessions] : data.sessions));
+      setNextCursor(data.next_cursor);
     } catch (error) {
       console.error('Failed to load sessions:', error);
     }
   };
 
   const getLastMessageTimestamp = (session) => {
-    if (!session.conversation_history || session.conversation_history.length === 0) {
-      return new Date(session.created_at).getTime();
-    }
-    const lastMessage = session.conversation_history[session.conversation_history.length - 1];
-    return new Date(lastMessage.timestamp || session.created_at).getTime();
+    return new Date(session.last_activity_at || session.created_at).getTime();
   };
 
   const formatTimestamp = (session) => {
@@ -88,7 +80,7 @@ const ChatSessions = ({ onSessionSelect, activeSessionId }) => {
     try {
       const title = newTitle.trim() || 'New Chat';
       const session = await chatSessionService.createChatSession(title);
-      setSessions(prev => [session, ...prev]);
+      setSessions(prev => [{ ...session, last_activity_at: session.created_at, stage_scores: {} }, ...prev]);
       setNewTitle('');
       setIsCreating(false);
       onSessionSelect(session);
@@ -101,13 +93,12 @@ const ChatSessions = ({ onSessionSelect, activeSessionId }) => {
     if (!editingSession) return;
 
     try {
-      const updatedSession = {
-        ...editingSession,
-        title: editingTitle.trim()
-      };
+      // List entries only carry metadata, so rename on top of the full session
+      const fullSession = await chatSessionService.getChatSession(editingSession.id);
+      const title = editingTitle.trim();
 
-      await chatSessionService.updateChatSession(editingSession.id, updatedSession);
-      setSessions(prev => prev.map(s => s.id === editingSession.id ? updatedSession : s));
+      await chatSessionService.updateChatSession(editingSession.id, { ...fullSession, title });
+      setSessions(prev => prev.map(s => s.id === editingSession.id ? { ...s, title } : s));
       setShowEditDialog(false);
       setEditingSession(null);
       setEditingTitle('');
@@ -146,19 +137,8 @@ const ChatSessions = ({ onSessionSelect, activeSessionId }) => {
   };
 
   const getStageCheckmarks = (session) => {
-    if (!session.stage_history) return [];
-    
-    // Get latest scores for each stage
-    const latestScores = session.stage_history.reduce((acc, entry) => {
-      if (entry.stage === 'stage1-understand-validate') {
-        acc.stage1 = entry.clarityScore;
-      } else if (entry.stage === 'stage2-plan-validate') {
-        acc.stage2 = entry.feasibilityScore;
-      } else if (entry.stage === 'stage3-agent-instructions') {
-        acc.stage3 = entry.instructionQuality;
-      }
-      return acc;
-    }, {});
+    // Latest score per stage, precomputed by the backend session index
+    const latestScores = session.stage_scores || {};
 
     return [
       latestScores.stage1 > 90,
@@ -225,6 +205,11 @@ const ChatSessions = ({ onSessionSelect, activeSessionId }) => {
             </div>
           </div>
         ))}
+        {nextCursor && (
+          <Button onClick={() => loadSessions(nextCursor)} size="sm" variant="ghost" className="w-full">
+            Load more
+          </Button>
+        )}
       </div>
 
       {/* Edit Session Dialog */}
@@ -1,8 +1,9 @@
 import React from 'react';
-import { FiX, FiAlertTriangle } from 'react-icons/fi';
+import { FiX, FiAlertTriangle, FiScissors } from 'react-icons/fi';
 import { shouldWarnAboutFile } from '../utils/fileWarnings';
 
-const FileChip = ({ fileName, tokenCount, onRemove, isRepositoryTree, isBinary }) => {
+// A truncated file is a head/tail preview; `onLoadFull` (when allowed) swaps in the whole file
+const FileChip = ({ fileName, tokenCount, onRemove, isRepositoryTree, isBinary, isTruncated, estimatedTokenCount, onLoadFull }) => {
   const { warn, reason, tokenWarning } = shouldWarnAboutFile(fileName, tokenCount);
 
   const getChipStyle = () => {
@@ -50,9 +51,29 @@ const FileChip = ({ fileName, tokenCount, onRemove, isRepositoryTree, isBinary }
           title={reason}
         />
       )}
+      {isTruncated && (
+        <FiScissors
+          className="ml-1 text-yellow-600 dark:text-yellow-400"
+          size={14}
+          title={`Preview of the head and tail; the whole file is about ${estimatedTokenCount.toLocaleString()} tokens`}
+        />
+      )}
       <span className={`mx-1 ${getTokenStyle()}`}>
-        {isBinary ? '(binary)' : `(${tokenCount.toLocaleString()})`}
+        {isBinary
+          ? '(binary)'
+          : isTruncated
+            ? `(${tokenCount.toLocaleString()} of ~${estimatedTokenCount.toLocaleString()})`
+            : `(${tokenCount.toLocaleString()})`}
       </span>
+      {isTruncated && onLoadFull && (
+        <button
+          onClick={onLoadFull}
+          className="ml-1 px-1 rounded text-xs underline text-gray-600 hover:text-gray-900 dark:text-gray-300 dark:hover:text-white"
+          title="Replace the preview with the whole file"
+        >
+          full
+        </button>
+      )}
       <button
         onClick={onRemove}
         className={`
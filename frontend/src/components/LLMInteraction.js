@@ -28,7 +28,7 @@ import { Separator } from "../components/ui/separator";
 import { ScrollArea } from "../components/ui/scroll-area";
 import { Skeleton } from "../components/ui/skeleton";
 
-const LLMInteraction = ({ initialPrompt }) => {
+const LLMInteraction = ({ assembledPrompt }) => {
   // 1) System Prompt-Related State
   const [prompts, setPrompts] = useState([]);
   const [activePromptId, setActivePromptId] = useState(null);
@@ -39,7 +39,7 @@ const LLMInteraction = ({ initialPrompt }) => {
 
   // 3) Conversation State
   const [conversationHistory, setConversationHistory] = useState([]);
-  const [userPrompt, setUserPrompt] = useState(initialPrompt || '');
+  const [userPrompt, setUserPrompt] = useState(assembledPrompt?.content || '');
   const [loading, setLoading] = useState(false);
 
   // 4) Token + Cost Tracking
@@ -68,6 +68,8 @@ const LLMInteraction = ({ initialPrompt }) => {
 
   // Add new state for active session
   const [activeSession, setActiveSession] = useState(null);
+  // What the backend already has for the active session, so saves only send deltas
+  const persistedRef = useRef({ sessionId: null, messages: 0, stages: 0, files: new Set() });
 
   // =====================
   //    INITIAL LOAD
@@ -84,6 +86,7 @@ const LLMInteraction = ({ initialPrompt }) => {
       if (sessionId) {
         try {
           const session = await chatSessionService.getChatSession(sessionId);
+          markPersisted(session);
           setActiveSession(session);
           setConversationHistory(session.conversation_history);
           setStageHistory(session.stage_history);
@@ -105,23 +108,53 @@ const LLMInteraction = ({ initialPrompt }) => {
     }
   }, [activeSession?.id]);
 
-  // Save session state after each change
-  useEffect(() => {
-    const saveSession = async () => {
-      if (activeSession) {
-        try {
-          await chatSessionService.updateChatSession(activeSession.id, {
-            ...activeSession,
-            conversation_history: conversationHistory,
-            stage_history: stageHistory,
-            included_files: Array.from(includedFiles)
-          });
-        } catch (error) {
-          console.error('Failed to save session:', error);
+  const markPersisted = (session) => {
+    persistedRef.current = {
+      sessionId: session.id,
+      messages: session.conversation_history.length,
+      stages: session.stage_history.length,
+      files: new Set(session.included_files)
+    };
+  };
+
+  // Saves run one at a time: each delta is computed from what the previous save persisted
+  const saveQueueRef = useRef(Promise.resolve());
+
+  const persistSession = async (snapshot) => {
+    const persisted = persistedRef.current;
+    try {
+      const appendOnly = persisted.sessionId === snapshot.id &&
+        snapshot.conversation_history.length >= persisted.messages &&
+        snapshot.stage_history.length >= persisted.stages;
+      if (appendOnly) {
+        const delta = {
+          messages: snapshot.conversation_history.slice(persisted.messages),
+          stages: snapshot.stage_history.slice(persisted.stages),
+          included_files: snapshot.included_files.filter(file => !persisted.files.has(file))
+        };
+        if (delta.messages.length || delta.stages.length || delta.included_files.length) {
+          await chatSessionService.appendToChatSession(snapshot.id, delta);
         }
+      } else {
+        await chatSessionService.updateChatSession(snapshot.id, snapshot);
       }
-    };
-    saveSession();
+      markPersisted(snapshot);
+    } catch (error) {
+      console.error('Failed to save session:', error);
+    }
+  };
+
+  // Save session state after each change
+  useEffect(() => {
+    if (activeSession) {
+      const snapshot = {
+        ...activeSession,
+        conversation_history: conversationHistory,
+        stage_history: stageHistory,
+        included_files: Array.from(includedFiles)
+      };
+      saveQueueRef.current = saveQueueRef.current.then(() => persistSession(snapshot));
+    }
   }, [conversationHistory, stageHistory, includedFiles]);
 
   const fetchPrompts = async () => {
@@ -169,13 +202,21 @@ const LLMInteraction = ({ initialPrompt }) => {
     }
   }, [prompts, activePromptId]);
 
+  // While the prompt is the one PromptComposer assembled, the backend already
+  // holds it: it is sent by handle and its count comes from the assembly
+  const promptHandle = assembledPrompt?.handle && userPrompt === assembledPrompt.content
+    ? assembledPrompt.handle
+    : null;
+
   useEffect(() => {
-    if (userPrompt) {
+    if (promptHandle) {
+      setUserPromptTokens(assembledPrompt.tokenCount);
+    } else if (userPrompt) {
       countTokens(userPrompt, setUserPromptTokens);
     } else {
       setUserPromptTokens(0);
     }
-  }, [userPrompt]);
+  }, [userPrompt, promptHandle]);
 
   const countTokens = async (text, setTokens) => {
     try {
@@ -214,6 +255,7 @@ const LLMInteraction = ({ initialPrompt }) => {
     setElapsedTime(0);
 
     try {
+      let sessionId = activeSession?.id;
       // Create a new chat session if one doesn't exist
       if (!activeSession) {
         // Remove HTML tags and get first three words for the title
@@ -222,7 +264,9 @@ const LLMInteraction = ({ initialPrompt }) => {
         const title = words.slice(0, 3).join(' ') || 'New Chat';
         
         const newSession = await chatSessionService.createChatSession(title);
+        markPersisted(newSession);
         setActiveSession(newSession);
+        sessionId = newSession.id;
       }
 
       const activePrompt = prompts.find((p) => p.id === activePromptId);
@@ -238,11 +282,22 @@ const LLMInteraction = ({ initialPrompt }) => {
       // Only include system message if a prompt is selected
       const messages = [
         ...(activePromptId ? [{ role: 'system', content: systemPromptWithContext }] : []),
-        ...conversationHistory,
-        { role: 'user', content: userPrompt }
+        ...conversationHistory
       ];
+      const userMessage = { role: 'user', content: userPrompt };
 
-      const result = await sendLLMRequest(messages, temperature, model);
+      let result;
+      if (promptHandle) {
+        try {
+          result = await sendLLMRequest(messages, temperature, model, sessionId, promptHandle);
+        } catch (error) {
+          // The handle expired; send the text instead
+          if (error.response?.status !== 404) throw error;
+          result = await sendLLMRequest([...messages, userMessage], temperature, model, sessionId);
+        }
+      } else {
+        result = await sendLLMRequest([...messages, userMessage], temperature, model, sessionId);
+      }
 
       // Look for JSON output snippet in the response
       const jsonOutput = result.response.match(/```json\n([\s\S]*?)\n```/);
@@ -394,8 +449,11 @@ const LLMInteraction = ({ initialPrompt }) => {
     return '#EF4444';                 // red
   };
 
-  const handleSessionSelect = async (session) => {
-    if (session) {
+  const handleSessionSelect = async (sessionSummary) => {
+    if (sessionSummary) {
+      // The sidebar only holds session metadata; load the full session body
+      const session = await chatSessionService.getChatSession(sessionSummary.id);
+      markPersisted(session);
       setActiveSession(session);
       setConversationHistory(session.conversation_history);
       setStageHistory(session.stage_history);
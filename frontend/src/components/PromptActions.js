@@ -153,10 +153,14 @@ const PromptActions = ({ addTreeStructure, clearPrompt, clearFiles, setTranscrip
     }
   };
 
-  const handleGoToLLM = () => {
-    if (prompt.trim()) {
-      setUserPrompt(prompt.trim());
+  const handleGoToLLM = async () => {
+    if (!prompt.trim()) return;
+    try {
+      await setUserPrompt(prompt.trim());
       navigate('/llm-interaction');
+    } catch (error) {
+      console.error('Error preparing prompt:', error);
+      setStatus('Error preparing prompt');
     }
   };
 
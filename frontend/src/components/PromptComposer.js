@@ -1,6 +1,6 @@
 // File: frontend/src/components/PromptComposer.js
 
-import React, { useState, useEffect, useCallback, useRef } from 'react';
+import React, { useState, useEffect, useCallback, useMemo, useRef } from 'react';
 import axios from 'axios';
 import { FiLoader, FiFile, FiFolder } from 'react-icons/fi';
 import PromptActions from './PromptActions';
@@ -8,6 +8,7 @@ import PromptTextArea from './PromptTextArea';
 import TranscriptionDisplay from './TranscriptionDisplay';
 import FileChip from './FileChip';
 import { analyzePromptForFiles } from '../services/llmService';
+import { FULL_READ_MAX_BYTES, assemblePrompt } from '../services/fileContentService';
 import FileSuggestions from './FileSuggestions';
 import PromptPreview from './PromptPreview';
 import { API_URL } from '../config/api';
@@ -24,7 +25,10 @@ import { Skeleton } from "./ui/skeleton";
 
 const PromptComposer = ({ selectedRepository, selectedFiles, onFileRemove, setUserPrompt, onFileSelectionChange, onBatchFileSelection }) => {
   const [basePrompt, setBasePrompt] = useState('');
-  const [fileContents, setFileContents] = useState({});
+  // The prompt as /prompts/assemble built it, with its handle and token counts
+  const [assembled, setAssembled] = useState(null);
+  // Previewed files the user asked to include whole
+  const [fullFiles, setFullFiles] = useState([]);
   const [transcriptionHistory, setTranscriptionHistory] = useState([]);
   const [status, setStatus] = useState('');
   const [treeStructure, setTreeStructure] = useState('');
@@ -51,6 +55,7 @@ const PromptComposer = ({ selectedRepository, selectedFiles, onFileRemove, setUs
   const lastPromptRef = useRef(basePrompt);
   const treeOperationRef = useRef(false);
   const lastCopiedPromptRef = useRef('');
+  const assemblyRef = useRef({ key: null, promise: null });
 
   // Toggle to show/hide extra file chips
   const [showAllFiles, setShowAllFiles] = useState(false);
@@ -117,74 +122,53 @@ const PromptComposer = ({ selectedRepository, selectedFiles, onFileRemove, setUs
   }, [basePrompt, isAutoAnalyzeEnabled, isAnalyzing, analyzePrompt]);
 
   // ======================
-  //  FILE CONTENT FETCH
+  //   PROMPT ASSEMBLY
   // ======================
-  const fetchFileContents = async () => {
-    const newContents = { ...fileContents };
-
-    // Remove any old file paths no longer selected
-    Object.keys(newContents).forEach(path => {
-      const stillSelected = selectedFiles.some(file => {
-        if (file.type === 'directory') {
-          return file.files.some(f => f.path === path);
-        }
-        return file.path === path;
-      });
-      if (!stillSelected) {
-        delete newContents[path];
-      }
-    });
-
-    // Fetch content for newly added files
-    for (const file of selectedFiles) {
-      if (file.type === 'directory') {
-        for (const subFile of file.files) {
-          if (!newContents[subFile.path]) {
-            try {
-              const response = await axios.get(`${API_URL}/file_content?repository=${selectedRepository}&path=${subFile.path}`);
-              if (response.data.is_binary) {
-                console.log(`Skipping binary file: ${subFile.path}`);
-                newContents[subFile.path] = { content: '', tokenCount: 0, isBinary: true };
-              } else {
-                newContents[subFile.path] = { 
-                  content: response.data.content, 
-                  tokenCount: response.data.token_count,
-                  isBinary: false 
-                };
-              }
-            } catch (error) {
-              console.error(`Failed to fetch content for ${subFile.path}:`, error);
-            }
-          }
-        }
-      } else {
-        // Single file
-        if (!newContents[file.path]) {
-          try {
-            const response = await axios.get(`${API_URL}/file_content?repository=${selectedRepository}&path=${file.path}`);
-            if (response.data.is_binary) {
-              console.log(`Skipping binary file: ${file.path}`);
-              newContents[file.path] = { content: '', tokenCount: 0, isBinary: true };
-            } else {
-              newContents[file.path] = { 
-                content: response.data.content, 
-                tokenCount: response.data.token_count,
-                isBinary: false 
-              };
-            }
-          } catch (error) {
-            console.error(`Failed to fetch content for ${file.path}:`, error);
-          }
-        }
-      }
-    }
-
-    setFileContents(newContents);
+  const selectedPaths = selectedFiles.flatMap(file =>
+    file.type === 'directory' ? file.files.map(f => f.path) : [file.path]
+  );
+  const assemblyRequest = {
+    template: basePrompt,
+    files: selectedPaths,
+    fullFiles: fullFiles.filter(path => selectedPaths.includes(path)),
+    includeTree: isTreeAdded
   };
+  const assemblyKey = JSON.stringify([selectedRepository, assemblyRequest]);
+
+  // The assembled prompt for the current inputs, reusing the request already made for them
+  const assembleCurrent = useCallback(() => {
+    if (assemblyRef.current.key !== assemblyKey) {
+      const request = JSON.parse(assemblyKey)[1];
+      const isEmpty = !request.template.trim() && request.files.length === 0 && !request.includeTree;
+      const key = assemblyKey;
+      assemblyRef.current = {
+        key,
+        promise: !selectedRepository || isEmpty
+          ? Promise.resolve(null)
+          : assemblePrompt(selectedRepository, request).catch(error => {
+              // Forget the failure so the same inputs are tried again
+              if (assemblyRef.current.key === key) assemblyRef.current = { key: null, promise: null };
+              throw error;
+            })
+      };
+    }
+    return assemblyRef.current.promise;
+  }, [assemblyKey, selectedRepository]);
 
   useEffect(() => {
-    fetchFileContents();
-  }, [selectedFiles, selectedRepository]);
+    const timeoutId = setTimeout(() => {
+      assembleCurrent()
+        .then(result => {
+          // A slower response for older inputs must not overwrite a newer one
+          if (assemblyRef.current.key === assemblyKey) setAssembled(result);
+        })
+        .catch(error => {
+          console.error('Failed to assemble prompt:', error);
+          setStatus('Error assembling prompt');
+        });
+    }, 300);
+    return () => clearTimeout(timeoutId);
+  }, [assemblyKey, assembleCurrent]);
 
   // ======================
   //  FETCH TREE STRUCTURE
@@ -192,7 +176,7 @@ const PromptComposer = ({ selectedRepository, selectedFiles, onFileRemove, setUs
   const fetchTreeStructure = async (repo) => {
     try {
       const response = await axios.get(`${API_URL}/tree?repository=${repo}`);
-      const formattedTree = formatTreeStructure(JSON.parse(response.data.tree));
+      const formattedTree = formatTreeStructure(response.data.tree);
       setTreeStructure(formattedTree);
     } catch (error) {
       console.error('Failed to fetch tree structure:', error);
@@ -215,58 +199,34 @@ const PromptComposer = ({ selectedRepository, selectedFiles, onFileRemove, setUs
   const removeFile = (filePath) => {
     const fileToRemove = selectedFiles.find(f => f.path === filePath);
     if (fileToRemove) {
-      if (fileToRemove.type === 'directory') {
-        fileToRemove.files.forEach(f => {
-          setFileContents(prev => {
-            const newContents = { ...prev };
-            delete newContents[f.path];
-            return newContents;
-          });
-        });
-      } else {
-        setFileContents(prev => {
-          const newContents = { ...prev };
-          delete newContents[filePath];
-          return newContents;
-        });
-      }
+      const removed = fileToRemove.type === 'directory' ? fileToRemove.files.map(f => f.path) : [filePath];
+      setFullFiles(prev => prev.filter(path => !removed.includes(path)));
     }
     onFileRemove(filePath);
     setHasUnsavedChanges(true);
   };
 
+  // Replace a file's preview with its whole content, on explicit request only
+  const loadFullFile = (path) => {
+    setFullFiles(prev => (prev.includes(path) ? prev : [...prev, path]));
+    setHasUnsavedChanges(true);
+  };
+
   // ======================
   // CONSTRUCT STRUCTURED PROMPT
   // ======================
-  const getStructuredPrompt = useCallback(() => {
-    const sections = [];
-
-    // 1) user_request
-    if (basePrompt.trim()) {
-      sections.push(`<user_request>\n${basePrompt.trim()}\n</user_request>`);
-    }
-
-    // 2) repository_structure
-    if (isTreeAdded && treeStructure.trim()) {
-      sections.push(`<repository_structure>\n${treeStructure.trim()}\n</repository_structure>`);
-    }
-
-    // 3) file contents
-    for (const [path, { content }] of Object.entries(fileContents)) {
-      if (content && content.trim()) {
-        sections.push(`<file path="${path}">\n${content.trim()}\n</file>`);
-      }
-    }
-
-    return sections.join("\n\n");
-  }, [basePrompt, fileContents, isTreeAdded, treeStructure]);
+  // Built on the server by /prompts/assemble; this is its text
+  const getStructuredPrompt = useCallback(() => assembled?.content || '', [assembled]);
+  const fileTokenCounts = useMemo(() => Object.fromEntries(
+    Object.values(assembled?.files || {}).map(file => [file.path, file.token_count])
+  ), [assembled]);
 
   // ======================
   //   CLEARING
   // ======================
   const clearAll = () => {
     setBasePrompt('');
-    setFileContents({});
+    setFullFiles([]);
     setTranscriptionHistory([]);
     setIsTreeAdded(false);
     setTreeTokenCount(0);
@@ -278,7 +238,7 @@ const PromptComposer = ({ selectedRepository, selectedFiles, onFileRemove, setUs
   };
 
   const clearFiles = () => {
-    setFileContents({});
+    setFullFiles([]);
     setIsTreeAdded(false);
     setTreeTokenCount(0);
     setFileSuggestions(null);
@@ -413,10 +373,10 @@ const PromptComposer = ({ selectedRepository, selectedFiles, onFileRemove, setUs
     const sortedFiles = [...selectedFiles].sort((a, b) => {
       const aTokens = a.type === 'directory'
         ? (a.token_count?.total || 0)
-        : (fileContents[a.path]?.tokenCount || 0);
+        : (assembled?.files[a.path]?.token_count || 0);
       const bTokens = b.type === 'directory'
         ? (b.token_count?.total || 0)
-        : (fileContents[b.path]?.tokenCount || 0);
+        : (assembled?.files[b.path]?.token_count || 0);
 
       if (aTokens !== bTokens) return bTokens - aTokens;
       return a.path.localeCompare(b.path);
@@ -439,15 +399,17 @@ const PromptComposer = ({ selectedRepository, selectedFiles, onFileRemove, setUs
           />
         );
       } else {
-        const tokenCount = fileContents[file.path]?.tokenCount || 0;
-        const isBinary = fileContents[file.path]?.isBinary || false;
+        const entry = assembled?.files[file.path];
         return (
           <FileChip
             key={file.path}
             fileName={file.path}
-            tokenCount={tokenCount}
+            tokenCount={entry?.token_count || 0}
             onRemove={() => removeFile(file.path)}
-            isBinary={isBinary}
+            isBinary={assembled?.skipped[file.path] === 'binary'}
+            isTruncated={entry?.truncated || false}
+            estimatedTokenCount={entry?.estimated_token_count || 0}
+            onLoadFull={entry?.size <= FULL_READ_MAX_BYTES ? () => loadFullFile(file.path) : null}
           />
         );
       }
@@ -481,8 +443,8 @@ const PromptComposer = ({ selectedRepository, selectedFiles, onFileRemove, setUs
 
   // Calculate total tokens for selected files
   const calculateTotalTokens = useCallback(() => {
-    return Object.values(fileContents).reduce((total, { tokenCount }) => total + (tokenCount || 0), 0);
-  }, [fileContents]);
+    return Object.values(assembled?.files || {}).reduce((total, { token_count }) => total + (token_count || 0), 0);
+  }, [assembled]);
 
   // Handle copy to clipboard
   const handleCopyToClipboard = useCallback(async () => {
@@ -536,34 +498,25 @@ const PromptComposer = ({ selectedRepository, selectedFiles, onFileRemove, setUs
       
       // First, clear everything
       selectedFiles.forEach(file => onFileRemove(file.path));
-      setFileContents({});
+      setFullFiles([]);
       
-      // Then fetch all file contents first
-      const newContents = {};
+      // One assembly of the whole combination gives every file's token count
+      const { files: included } = await assemblePrompt(selectedRepository, {
+        files: combination.files.flatMap(file =>
+          file.type === 'directory' ? file.files.map(f => f.path) : [file.path]
+        )
+      });
       const filesToAdd = [];
       
       for (const file of combination.files) {
         if (file.type === 'directory') {
-          const directoryFiles = [];
-          for (const subFile of file.files) {
-            try {
-              const response = await axios.get(`${API_URL}/file_content?repository=${selectedRepository}&path=${subFile.path}`);
-              if (!response.data.is_binary) {
-                newContents[subFile.path] = { 
-                  content: response.data.content, 
-                  tokenCount: response.data.token_count,
-                  isBinary: false 
-                };
-                directoryFiles.push({
-                  path: subFile.path,
-                  type: 'file',
-                  token_count: response.data.token_count
-                });
-              }
-            } catch (error) {
-              console.error(`Failed to fetch content for ${subFile.path}:`, error);
-            }
-          }
+          const directoryFiles = file.files
+            .filter(subFile => included[subFile.path])
+            .map(subFile => ({
+              path: subFile.path,
+              type: 'file',
+              token_count: included[subFile.path].token_count
+            }));
           if (directoryFiles.length > 0) {
             filesToAdd.push({
               path: file.path,
@@ -574,30 +527,15 @@ const PromptComposer = ({ selectedRepository, selectedFiles, onFileRemove, setUs
               }
             });
           }
-        } else {
-          try {
-            const response = await axios.get(`${API_URL}/file_content?repository=${selectedRepository}&path=${file.path}`);
-            if (!response.data.is_binary) {
-              newContents[file.path] = { 
-                content: response.data.content, 
-                tokenCount: response.data.token_count,
-                isBinary: false 
-              };
-              filesToAdd.push({
-                path: file.path,
-                type: 'file',
-                token_count: response.data.token_count
-              });
-            }
-          } catch (error) {
-            console.error(`Failed to fetch content for ${file.path}:`, error);
-          }
+        } else if (included[file.path]) {
+          filesToAdd.push({
+            path: file.path,
+            type: 'file',
+            token_count: included[file.path].token_count
+          });
         }
       }
       
-      // Update file contents first
-      setFileContents(newContents);
-      
       // Update all files at once using batch selection
       onBatchFileSelection(filesToAdd);
       
@@ -661,8 +599,9 @@ const PromptComposer = ({ selectedRepository, selectedFiles, onFileRemove, setUs
             enhanceTranscription={enhanceTranscription}
             setStatus={setStatus}
             prompt={getStructuredPrompt()}
-            setUserPrompt={prompt => {
-              setUserPrompt(prompt);
+            setUserPrompt={async () => {
+              // Hand over the assembly of the latest edits, with its handle, not a stale one
+              setUserPrompt(await assembleCurrent());
               setHasUnsavedChanges(false);
             }}
             handleCopyToClipboard={handleCopyToClipboard}
@@ -706,14 +645,8 @@ const PromptComposer = ({ selectedRepository, selectedFiles, onFileRemove, setUs
             <PromptTextArea
               prompt={basePrompt}
               setPrompt={handleBasePromptChange}
-              additionalTokenCount={
-                treeTokenCount +
-                selectedFiles.reduce((sum, file) => {
-                  if (file.type === 'directory') return sum + (file.token_count?.total || 0);
-                  return sum + (fileContents[file.path]?.tokenCount || 0);
-                }, 0)
-              }
-              fullPrompt={getStructuredPrompt()}
+              tokenCount={assembled?.tokenCount || 0}
+              tokenCountExact={assembled ? assembled.tokenCountExact : true}
             />
           </div>
           
@@ -790,7 +723,7 @@ const PromptComposer = ({ selectedRepository, selectedFiles, onFileRemove, setUs
             </svg>
             Prompt Preview
           </h3>
-          <PromptPreview structuredPrompt={getStructuredPrompt()} />
+          <PromptPreview structuredPrompt={getStructuredPrompt()} fileTokenCounts={fileTokenCounts} />
         </CardContent>
       </Card>
     </div>
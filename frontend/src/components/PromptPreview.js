@@ -78,7 +78,8 @@ function parseStructuredPrompt(structuredPrompt) {
   const flushBufferAsContent = () => {
     // Only add a content segment if it's NOT all blank lines
     if (buffer.length > 0 && !isAllWhitespace(buffer)) {
-      segments.push({ type: 'content', lines: buffer });
+      // Inside a <file> block the content is that file's
+      segments.push({ type: 'content', lines: buffer, path: filePathStack[filePathStack.length - 1] });
     }
     buffer = [];
   };
@@ -128,7 +129,10 @@ function parseStructuredPrompt(structuredPrompt) {
   return segments;
 }
 
-const PromptPreview = ({ structuredPrompt }) => {
+const NO_FILE_TOKEN_COUNTS = {};
+
+// `fileTokenCounts` (path -> tokens) comes from the assembly; only other sections are counted here
+const PromptPreview = ({ structuredPrompt, fileTokenCounts = NO_FILE_TOKEN_COUNTS }) => {
   const [segments, setSegments] = useState([]);
   const [tokenCounts, setTokenCounts] = useState({}); // index -> token count
 
@@ -137,19 +141,18 @@ const PromptPreview = ({ structuredPrompt }) => {
     const segs = parseStructuredPrompt(structuredPrompt);
     setSegments(segs);
 
-    // 2) For each content segment, call /count_tokens
+    // 2) For each content segment not already counted, call /count_tokens
     (async () => {
       const newCounts = {};
       for (let i = 0; i < segs.length; i++) {
         if (segs[i].type === 'content') {
-          const contentText = segs[i].lines.join('\n');
-          const count = await fetchTokenCount(contentText);
-          newCounts[i] = count;
+          const known = fileTokenCounts[segs[i].path];
+          newCounts[i] = known !== undefined ? known : await fetchTokenCount(segs[i].lines.join('\n'));
         }
       }
       setTokenCounts(newCounts);
     })();
-  }, [structuredPrompt]);
+  }, [structuredPrompt, fileTokenCounts]);
 
   const tagStyle = "font-bold text-green-600 dark:text-green-300 px-2 py-0.5";
   const contentStyle = "text-blue-600 dark:text-blue-300 italic px-2 py-1 my-1 bg-gray-100/30 dark:bg-gray-700/30 rounded";
@@ -1,20 +1,12 @@
-import React, { useState, useEffect, useRef } from 'react';
-import axios from 'axios';
-import { API_URL } from '../config/api';
+import React, { useEffect, useRef } from 'react';
 import PropTypes from 'prop-types';
 import { ArrowDownToLine } from 'lucide-react';
 
-const PromptTextArea = ({ prompt, setPrompt, additionalTokenCount, fullPrompt }) => {
-  const [tokenCount, setTokenCount] = useState(0);
+// `tokenCount` is the whole assembled prompt's, counted with cl100k_base unless `tokenCountExact`
+const PromptTextArea = ({ prompt, setPrompt, tokenCount, tokenCountExact }) => {
   const textareaRef = useRef(null);
   const lastKeyboardFocusRef = useRef(false);
 
-  useEffect(() => {
-    const debouncedUpdateTokenCount = debounce(updateTokenCount, 300);
-    debouncedUpdateTokenCount(prompt);
-    return () => debouncedUpdateTokenCount.cancel();
-  }, [prompt]);
-
   useEffect(() => {
     const handleKeyDown = (e) => {
       if (e.metaKey && e.key === 'k') {
@@ -40,29 +32,6 @@ const PromptTextArea = ({ prompt, setPrompt, additionalTokenCount, fullPrompt })
     setPrompt(e.target.value);
   };
 
-  const updateTokenCount = async (text) => {
-    try {
-      const response = await axios.post(`${API_URL}/count_tokens`, {
-        text,
-        model: 'gpt-3.5-turbo'
-      });
-      setTokenCount(response.data.count);
-    } catch (error) {
-      console.error('Error counting tokens:', error);
-      setTokenCount(0);
-    }
-  };
-
-  const debounce = (func, wait) => {
-    let timeout;
-    const debouncedFunc = (...args) => {
-      clearTimeout(timeout);
-      timeout = setTimeout(() => func(...args), wait);
-    };
-    debouncedFunc.cancel = () => clearTimeout(timeout);
-    return debouncedFunc;
-  };
-
   const getTokenCountColor = (total) => {
     if (total >= 100000) return 'text-red-500 dark:text-red-400 font-semibold';
     if (total >= 50000) return 'text-yellow-500 dark:text-yellow-400 font-semibold';
@@ -113,8 +82,11 @@ const PromptTextArea = ({ prompt, setPrompt, additionalTokenCount, fullPrompt })
             to focus at bottom
           </span>
         </div>
-        <div className={`${getTokenCountColor(tokenCount + additionalTokenCount)} px-2 py-1 rounded-md bg-gray-100 dark:bg-gray-700`}>
-          Tokens: {tokenCount + additionalTokenCount}
+        <div
+          className={`${getTokenCountColor(tokenCount)} px-2 py-1 rounded-md bg-gray-100 dark:bg-gray-700`}
+          title={tokenCountExact ? undefined : 'Approximate: counted with the cl100k_base tokenizer'}
+        >
+          Tokens: {tokenCountExact ? '' : '~'}{tokenCount}
         </div>
       </div>
     </div>
@@ -124,8 +96,8 @@ const PromptTextArea = ({ prompt, setPrompt, additionalTokenCount, fullPrompt })
 PromptTextArea.propTypes = {
   prompt: PropTypes.string.isRequired,
   setPrompt: PropTypes.func.isRequired,
-  additionalTokenCount: PropTypes.number.isRequired,
-  fullPrompt: PropTypes.string.isRequired
+  tokenCount: PropTypes.number.isRequired,
+  tokenCountExact: PropTypes.bool
 };
 
 export default PromptTextArea;
\ No newline at end of file
@@ -7,6 +7,8 @@ import {
   FiPlus, FiMinus, FiAlertTriangle, FiEye, FiEyeOff, FiX, FiCheck 
 } from 'react-icons/fi';
 import { API_URL } from '../config/api';
+import { useRepositoryUpdates } from '../hooks/useRepositoryUpdates';
+import { applyTreeDiff } from '../utils/treeDiff';
 
 const CORE_FILE_TYPES = [
   'js', 'jsx', 'ts', 'tsx', 'py', 'go', 'java', 'kt', 'rb', 'rs', 
@@ -215,8 +217,7 @@ const RepositoryFileViewer = ({ selectedRepository, onFileSelect, selectedFiles
   const fetchTreeStructure = useCallback(async (repo) => {
     try {
       const response = await axios.get(`${API_URL}/tree?repository=${repo}`);
-      const parsedTree = JSON.parse(response.data.tree);
-      const sortedTree = sortTreeStructure(parsedTree);
+      const sortedTree = sortTreeStructure(response.data.tree);
       setTreeStructure(sortedTree);
       
       // Load saved state or initialize all folders as expanded
@@ -248,6 +249,16 @@ const RepositoryFileViewer = ({ selectedRepository, onFileSelect, selectedFiles
     }
   }, [selectedRepository, fetchTreeStructure]);
 
+  // File changes arrive as diffs; the tree is only reloaded when the backend asks for it
+  useRepositoryUpdates(selectedRepository, (message) => {
+    if (message.type === 'diff' && (message.changed || message.added || message.removed)) {
+      setTreeStructure(prev => prev && sortTreeStructure(applyTreeDiff(prev, message)));
+    } else if (message.type === 'ready' || message.type === 'resync' || message.type === 'error') {
+      // Catches up on anything that changed before the watch started; usually a 304
+      fetchTreeStructure(selectedRepository);
+    }
+  });
+
 
   const toggleFolder = (path) => {
     const newState = {
@@ -556,11 +567,11 @@ const RepositoryFileViewer = ({ selectedRepository, onFileSelect, selectedFiles
             {node.type === 'directory'
               ? `${formatNumber(node.item_count || 0)} items${
                   node.token_count && !warning.skipTokenCount
-                    ? `, ${formatNumber(node.token_count)} tokens`
+                    ? `, ${node.token_count_estimated ? '~' : ''}${formatNumber(node.token_count)} tokens`
                     : ''
                 }`
               : node.token_count && !warning.skipTokenCount
-                ? `${formatNumber(node.token_count)} tokens`
+                ? `${node.token_count_estimated ? '~' : ''}${formatNumber(node.token_count)} tokens`
                 : ''}
           </span>
         </div>
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 import { API_URL } from '../config/api';
+import { useRepositoryUpdates } from '../hooks/useRepositoryUpdates';
 
 const RepositorySelector = ({ onSelect, selectedRepository }) => {
   const [directories, setDirectories] = useState([]);
@@ -62,6 +63,11 @@ const RepositorySelector = ({ onSelect, selectedRepository }) => {
     fetchGitInfo(selectedRepository);
   }, [selectedRepository]);
 
+  // Branch switches and new commits are pushed by the backend
+  useRepositoryUpdates(selectedRepository, (message) => {
+    if (message.git) setGitInfo(message.git);
+  });
+
   const handleChange = (e) => onSelect(e.target.value);
 
   const handleContextMap = async (action) => {
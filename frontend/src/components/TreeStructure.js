@@ -19,9 +19,7 @@ const TreeNode = ({ node }) => {
   );
 };
 
-const TreeStructure = ({ treeData }) => {
-  const tree = JSON.parse(treeData);
-
+const TreeStructure = ({ treeData: tree }) => {
   return (
     <div className="mt-4 p-4 border rounded">
       <h3 className="text-lg font-bold mb-2">Project Structure</h3>
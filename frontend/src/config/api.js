@@ -1,3 +1,4 @@
 import config from './config.json';
 
-export const API_URL = `http://localhost:${config.backend.port}`;
\ No newline at end of file
+export const API_URL = `http://localhost:${config.backend.port}`;
+export const WS_URL = `ws://localhost:${config.backend.port}`;
\ No newline at end of file
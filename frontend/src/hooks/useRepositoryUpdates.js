@@ -0,0 +1,62 @@
+import { useEffect, useRef } from 'react';
+import { WS_URL } from '../config/api';
+
+const RECONNECT_DELAYS = [1000, 2000, 5000, 10000];
+
+// One socket per repository, shared by every component listening to it
+const connections = {};
+
+const connect = (repository) => {
+  const connection = connections[repository];
+  const socket = new WebSocket(`${WS_URL}/ws/repository/${encodeURIComponent(repository)}`);
+  connection.socket = socket;
+
+  socket.onopen = () => {
+    connection.attempts = 0;
+  };
+  socket.onmessage = (event) => {
+    const message = JSON.parse(event.data);
+    connection.listeners.forEach(listener => listener(message));
+  };
+  socket.onclose = (event) => {
+    // 1008: the backend refused the repository, retrying will not help
+    if (connection.listeners.size === 0 || event.code === 1008) return;
+    const delay = RECONNECT_DELAYS[Math.min(connection.attempts, RECONNECT_DELAYS.length - 1)];
+    connection.attempts += 1;
+    connection.timer = setTimeout(() => connect(repository), delay);
+  };
+};
+
+const subscribe = (repository, listener) => {
+  if (!connections[repository]) {
+    connections[repository] = { listeners: new Set(), attempts: 0, socket: null, timer: null };
+    connections[repository].listeners.add(listener);
+    connect(repository);
+  } else {
+    connections[repository].listeners.add(listener);
+  }
+
+  return () => {
+    const connection = connections[repository];
+    connection.listeners.delete(listener);
+    if (connection.listeners.size === 0) {
+      clearTimeout(connection.timer);
+      connection.socket?.close();
+      delete connections[repository];
+    }
+  };
+};
+
+/**
+ * Calls `onMessage` with every update the backend pushes for `repository`:
+ * "ready" (with git info), "diff" (see applyTreeDiff), "resync" and "error".
+ */
+export const useRepositoryUpdates = (repository, onMessage) => {
+  const handlerRef = useRef(onMessage);
+  handlerRef.current = onMessage;
+
+  useEffect(() => {
+    if (!repository) return undefined;
+    return subscribe(repository, message => handlerRef.current(message));
+  }, [repository]);
+};
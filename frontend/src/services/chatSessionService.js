@@ -3,11 +3,13 @@ import config from '../config/config.json';
 
 const API_URL = `http://localhost:${config.backend.port}`;
 
-export const listChatSessions = async () => {
+export const listChatSessions = async (cursor = null, limit = 50) => {
   try {
-    const response = await axios.get(`${API_URL}/chat-sessions`);
-    // Filter out soft-deleted sessions
-    return response.data.filter(session => !session.deleted_at);
+    // Returns one page of session metadata: { sessions, next_cursor }
+    const response = await axios.get(`${API_URL}/chat-sessions`, {
+      params: { limit, ...(cursor ? { cursor } : {}) }
+    });
+    return response.data;
   } catch (error) {
     console.error('Error listing chat sessions:', error);
     throw error;
@@ -46,6 +48,17 @@ export const updateChatSession = async (sessionId, sessionData) => {
   }
 };
 
+export const appendToChatSession = async (sessionId, delta) => {
+  try {
+    // Sends only what is new: { messages, stages, included_files }
+    const response = await axios.patch(`${API_URL}/chat-sessions/${sessionId}`, delta);
+    return response.data;
+  } catch (error) {
+    console.error('Error appending to chat session:', error);
+    throw error;
+  }
+};
+
 export const deleteChatSession = async (sessionId) => {
   try {
     // First get the current session data
@@ -0,0 +1,33 @@
+import axios from 'axios';
+import { API_URL } from '../config/api';
+import config from '../config/config.json';
+
+// Same cap /prompts/assemble applies to files included whole
+export const FULL_READ_MAX_BYTES = config.backend.file_content?.max_full_read_bytes ?? 16 * 1024 * 1024;
+
+/**
+ * Build a prompt from repository files on the server. Files above the
+ * preview threshold go in as their head/tail preview unless listed in
+ * `fullFiles`. Returns the prompt text, its handle for /llm_interaction,
+ * token counts (exact only when `tokenCountExact`) and, by path, what each
+ * file contributed or why it was skipped.
+ */
+export const assemblePrompt = async (repository, { template = '', files = [], fullFiles = [], includeTree = false }) => {
+  const { data } = await axios.post(`${API_URL}/prompts/assemble`, {
+    repository,
+    template,
+    files,
+    full_files: fullFiles,
+    include_tree: includeTree,
+    include_messages: true
+  });
+  const user = data.messages.find(message => message.role === 'user');
+  return {
+    content: user ? user.content : '',
+    handle: data.handle,
+    tokenCount: data.token_count,
+    tokenCountExact: data.token_count_exact,
+    files: Object.fromEntries(data.files.map(file => [file.path, file])),
+    skipped: Object.fromEntries(data.skipped.map(file => [file.path, file.reason]))
+  };
+};
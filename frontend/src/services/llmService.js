@@ -3,12 +3,15 @@ import config from '../config/config.json';
 
 const API_URL = `http://localhost:${config.backend.port}`;
 
-export const sendLLMRequest = async (messages, temperature, model) => {
+// With a `promptHandle` from /prompts/assemble the backend appends that prompt to `messages`
+export const sendLLMRequest = async (messages, temperature, model, sessionId = null, promptHandle = null) => {
   try {
     const response = await axios.post(`${API_URL}/llm_interaction`, {
       messages,
       temperature,
-      model
+      model,
+      ...(sessionId ? { session_id: sessionId } : {}),
+      ...(promptHandle ? { prompt_handle: promptHandle } : {})
     });
     return response.data;
   } catch (error) {
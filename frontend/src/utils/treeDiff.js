@@ -0,0 +1,52 @@
+const parentPath = (path) => {
+  const index = path.lastIndexOf('/');
+  return index === -1 ? '.' : path.slice(0, index);
+};
+
+/**
+ * A copy of `tree` with a "diff" message from /ws/repository applied:
+ * new token and item counts (and whether they are estimates), added
+ * subtrees and removed nodes. Nodes the diff does not touch keep their
+ * identity.
+ */
+export const applyTreeDiff = (tree, diff) => {
+  if (!tree) return tree;
+  const changed = new Map((diff.changed || []).map(change => [change.path, change]));
+  const removed = new Set(diff.removed || []);
+  const added = {};
+  (diff.added || []).forEach(({ parent, node }) => {
+    (added[parent] = added[parent] || []).push(node);
+  });
+
+  // Only the nodes on the way to something that changed are copied
+  const touched = new Set();
+  const mark = (path) => {
+    while (path && !touched.has(path)) {
+      touched.add(path);
+      path = path === '.' ? null : parentPath(path);
+    }
+  };
+  changed.forEach((_, path) => mark(path));
+  removed.forEach(path => mark(parentPath(path)));
+  Object.keys(added).forEach(mark);
+
+  const update = (node) => {
+    if (!touched.has(node.path)) return node;
+    const change = changed.get(node.path);
+    const next = { ...node, ...(change ? {
+      token_count: change.token_count,
+      item_count: change.item_count,
+      token_count_estimated: change.token_count_estimated,
+      token_count_margin: change.token_count_margin,
+    } : {}) };
+    if (node.children) {
+      next.children = node.children
+        .filter(child => !removed.has(child.path))
+        .map(update)
+        .concat(added[node.path] || []);
+    }
+    return next;
+  };
+
+  return update(tree);
+};